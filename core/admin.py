@@ -1,5 +1,6 @@
+from django import forms
 from django.contrib import admin
-from .models import Domain, Drop, Competitor
+from .models import ApiToken, Domain, Drop, Competitor, Registrar
 
 @admin.register(Domain)
 class DomainAdmin(admin.ModelAdmin):
@@ -17,3 +18,42 @@ class CompetitorAdmin(admin.ModelAdmin):
     list_display = ("name", "drop", "attempts", "created_at")
     search_fields = ("name", "drop__domain__name")
     list_filter = ("drop",)
+
+class RegistrarForm(forms.ModelForm):
+    new_password = forms.CharField(
+        required=False, widget=forms.PasswordInput,
+        help_text="EPP <login> password. Leave blank to keep the current one.",
+    )
+
+    class Meta:
+        model = Registrar
+        fields = ("client_id", "is_active", "session_rate", "rate", "burst", "max_sessions")
+
+    def clean(self):
+        cleaned = super().clean()
+        if not self.instance.pk and not cleaned.get("new_password"):
+            self.add_error("new_password", "A password is required for a new registrar.")
+        return cleaned
+
+    def save(self, commit=True):
+        if self.cleaned_data.get("new_password"):
+            self.instance.set_password(self.cleaned_data["new_password"])
+        return super().save(commit)
+
+@admin.register(Registrar)
+class RegistrarAdmin(admin.ModelAdmin):
+    form = RegistrarForm
+    list_display = ("client_id", "is_active", "session_rate", "rate", "max_sessions", "created_at")
+    search_fields = ("client_id",)
+    list_filter = ("is_active",)
+
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    # Tokens are issued with `manage.py issue_api_token`; only the digest is kept
+    list_display = ("registrar", "prefix", "is_active", "created_at")
+    search_fields = ("registrar__client_id", "prefix")
+    list_filter = ("is_active",)
+    readonly_fields = ("registrar", "prefix", "digest", "created_at")
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,80 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .models import ChangeCounter, Domain
+
+VERSION_COUNTER = "domains"
+
+
+class AvailabilityIndex:
+    """Process-wide set of registered (name, tld) pairs used to answer <check>.
+
+    Writes made in this process are applied by the Domain signals straight
+    away. Writes made elsewhere (dashboard, admin, other EPP workers) bump the
+    shared "domains" ChangeCounter, which is polled at most once every
+    EPP_AVAILABILITY_REFRESH_SECONDS and triggers a reload when it moves.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._registered = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def load(self):
+        version = ChangeCounter.current(VERSION_COUNTER)
+        registered = set(Domain.objects.values_list("name", "tld"))
+        with self._lock:
+            self._registered = registered
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    def is_registered(self, name, tld):
+        return (name, tld) in self.registered([(name, tld)])
+
+    def registered(self, pairs):
+        """Return the subset of (name, tld) pairs that are registered."""
+        pairs = set(pairs)
+        if not settings.EPP_AVAILABILITY_INDEX:
+            names = {name for name, _ in pairs}
+            return pairs & set(Domain.objects.filter(name__in=names).values_list("name", "tld"))
+        self._revalidate()
+        return pairs & self._registered
+
+    def _revalidate(self):
+        if self._registered is None or self._version is None:
+            self.load()
+            return
+        now = time.monotonic()
+        if now - self._checked_at < settings.EPP_AVAILABILITY_REFRESH_SECONDS:
+            return
+        self._checked_at = now
+        if ChangeCounter.current(VERSION_COUNTER) != self._version:
+            self.load()
+
+    def changed(self, added, removed, version):
+        """Apply one transaction's (name, tld) additions and removals."""
+        with self._lock:
+            if self._registered is None or self._version is None:
+                return
+            self._registered.update(added)
+            self._registered.difference_update(removed)
+            # Only our own bump moved the counter; anything else needs a reload
+            if version == self._version + 1:
+                self._version = version
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+
+
+index = AvailabilityIndex()
+
+
+def domains_changed():
+    """Signal other processes that Domain rows changed outside of model signals
+    (bulk_create, queryset.update)."""
+    ChangeCounter.bump(VERSION_COUNTER)
+    index.invalidate()
@@ -0,0 +1,126 @@
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .feed import record_drop_changes
+from .models import Competitor, Drop
+
+DROP_NS = {"drop": "urn:drop"}
+
+
+class Capture:
+    """One <capture> element of a batch and, once registered, its result."""
+
+    __slots__ = ("index", "domain_name", "attempts", "delay_ms", "code", "msg", "competitor")
+
+    def __init__(self, index, domain_name, attempts, delay_ms):
+        self.index = index
+        self.domain_name = domain_name
+        self.attempts = attempts
+        self.delay_ms = delay_ms
+        self.code = None
+        self.msg = None
+        self.competitor = None
+
+    def fail(self, code, msg):
+        self.code, self.msg = code, msg
+
+
+def parse_captures(body):
+    """Parse a request with any number of <capture> elements under <command>.
+
+    Raises ValueError if the document itself is unusable; a bad element only
+    fails that item.
+    """
+    try:
+        root = ET.fromstring(body)
+    except ET.ParseError as e:
+        raise ValueError(f"Malformed XML: {e}")
+    command = root.find("command")
+    if command is None:
+        raise ValueError("Missing <command>")
+    captures = []
+    for index, element in enumerate(command.iterfind("capture")):
+        domain_name = (element.findtext("drop:name", namespaces=DROP_NS) or "").strip()
+        attempts = element.findtext("drop:attempts", namespaces=DROP_NS)
+        delay_ms = element.findtext("drop:delay_ms", namespaces=DROP_NS)
+        capture = Capture(
+            index, domain_name,
+            int(attempts) if attempts and attempts.isdigit() else 1,
+            int(delay_ms) if delay_ms and delay_ms.isdigit() else 100,
+        )
+        if not domain_name:
+            capture.fail(2002, "Missing <drop:name>")
+        elif "." not in domain_name:
+            capture.fail(2002, "Invalid domain format")
+        elif capture.attempts > settings.COMPETITOR_MAX_ATTEMPTS:
+            capture.fail(2002, f"<drop:attempts> must be at most {settings.COMPETITOR_MAX_ATTEMPTS}")
+        captures.append(capture)
+    if not captures:
+        raise ValueError("Missing <capture>")
+    return captures
+
+
+async def register_captures(captures):
+    """Add a competitor for every valid capture: one query finds all pending
+    drops, one bulk insert adds the competitors."""
+    wanted = [c for c in captures if c.code is None]
+    keys = {c: tuple(c.domain_name.rsplit(".", 1)) for c in wanted}
+    drops = {}
+    queryset = (
+        Drop.objects.filter(status="pending", domain__name__in={name for name, _ in keys.values()})
+        .select_related("domain")
+        .order_by("drop_time")
+    )
+    async for drop in queryset:
+        # Several pending drops for one domain: the earliest is the one being raced
+        drops.setdefault((drop.domain.name, drop.domain.tld), drop)
+    competitors = []
+    for capture in wanted:
+        drop = drops.get(keys[capture])
+        if drop is None:
+            capture.fail(2303, f"No pending drop for domain: {capture.domain_name}")
+            continue
+        capture.competitor = Competitor(
+            drop=drop, name=capture.domain_name, attempts=capture.attempts, delay_ms=capture.delay_ms,
+        )
+        competitors.append(capture.competitor)
+    if competitors:
+        await Competitor.objects.abulk_create(competitors)
+        # bulk_create skips the post_save signals that feed the dashboards
+        await sync_to_async(record_drop_changes)({c.drop_id for c in competitors})
+    for capture in wanted:
+        if capture.code is None:
+            capture.code, capture.msg = 1000, "Command completed successfully"
+    return captures
+
+
+def capture_response(captures):
+    """EPP-style response with one <drop:cd> per capture, in request order."""
+    items = []
+    for capture in captures:
+        competitor_id = (
+            f"\n                <drop:competitor_id>{capture.competitor.id}</drop:competitor_id>"
+            if capture.competitor is not None else ""
+        )
+        items.append(f"""
+            <drop:cd index="{capture.index}">
+                <drop:name>{escape(capture.domain_name)}</drop:name>
+                <drop:result code="{capture.code}">{escape(capture.msg)}</drop:result>{competitor_id}
+            </drop:cd>""")
+    succeeded = sum(1 for c in captures if c.code == 1000)
+    return f"""
+<epp xmlns:drop="urn:drop">
+    <response>
+        <result code="1000">
+            <msg>Command completed successfully; {succeeded} of {len(captures)} captures registered</msg>
+        </result>
+        <resData>
+            <drop:capData>{"".join(items)}
+            </drop:capData>
+        </resData>
+    </response>
+</epp>
+"""
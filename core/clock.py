@@ -0,0 +1,135 @@
+import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+# No models here: the EPP event loop asks for the time, and it must not query.
+
+
+class RealClock:
+    """Wall-clock time; the default CLOCK_BACKEND."""
+
+    speed = 1.0
+
+    def now(self):
+        return timezone.now()
+
+    def timeout(self, until):
+        """Real seconds to wait for ``until``; <= 0 once it has passed."""
+        return (until - timezone.now()).total_seconds()
+
+    def real_seconds(self, seconds):
+        return seconds
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class SimClock:
+    """Virtual time that can run faster than real time and jump ahead.
+
+    now = virtual + (wall - real) * speed, with (real, virtual, speed) kept
+    in SIM_CLOCK_FILE so the web and every EPP worker agree. Each process
+    re-reads the file at most every SIM_CLOCK_REFRESH_SECONDS, and no wait
+    is longer than that, so a jump (manage.py sim_clock) or a new speed is
+    picked up everywhere within one refresh. The first process to start
+    creates the file at the current time and SIM_CLOCK_SPEED.
+    """
+
+    def __init__(self):
+        self.path = settings.SIM_CLOCK_FILE
+        self.refresh = settings.SIM_CLOCK_REFRESH_SECONDS
+        self.initial_speed = settings.SIM_CLOCK_SPEED
+        self._state = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _current(self):
+        checked = time.monotonic()
+        if self._state is None or checked - self._checked_at >= self.refresh:
+            self._checked_at = checked
+            self._load()
+        return self._state
+
+    def _load(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            now = time.time()
+            self._write(now, now, self.initial_speed, replace=False)
+            stat = os.stat(self.path)
+        version = (stat.st_ino, stat.st_mtime_ns)
+        if version != self._version:
+            with open(self.path) as f:
+                state = json.load(f)
+            self._state = (state['real'], state['virtual'], state['speed'])
+            self._version = version
+
+    def _write(self, real, virtual, speed, replace=True):
+        directory = os.path.dirname(self.path) or '.'
+        with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as f:
+            json.dump({'real': real, 'virtual': virtual, 'speed': speed}, f)
+        try:
+            if replace:
+                os.replace(f.name, self.path)
+            else:
+                # Another process may be creating it too: the first one wins
+                try:
+                    os.link(f.name, self.path)
+                except FileExistsError:
+                    pass
+        finally:
+            if not replace:
+                os.unlink(f.name)
+
+    def _timestamp(self):
+        real, virtual, speed = self._current()
+        return virtual + (time.time() - real) * speed
+
+    @property
+    def speed(self):
+        return self._current()[2]
+
+    def now(self):
+        return datetime.datetime.fromtimestamp(self._timestamp(), tz=datetime.timezone.utc)
+
+    def timeout(self, until):
+        remaining = until.timestamp() - self._timestamp()
+        if remaining <= 0:
+            return remaining
+        return min(remaining / self.speed, self.refresh)
+
+    def real_seconds(self, seconds):
+        return seconds / self.speed
+
+    def sleep(self, seconds):
+        deadline = self.now() + datetime.timedelta(seconds=seconds)
+        while (wait := self.timeout(deadline)) > 0:
+            time.sleep(wait)
+
+    def set(self, when=None, speed=None):
+        """Move to ``when`` (default: stay) and/or run at ``speed`` from now on."""
+        with self._lock:
+            virtual = when.timestamp() if when is not None else self._timestamp()
+            self._write(time.time(), virtual, speed or self.speed)
+            self._version = None
+            self._load()
+
+    def reset(self):
+        """Start again from real time at SIM_CLOCK_SPEED."""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self._version = None
+        self._load()
+
+
+clock = import_string(settings.CLOCK_BACKEND)()
@@ -0,0 +1,162 @@
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password
+
+from .models import ApiToken, ChangeCounter, Registrar
+
+# Bumped on any Registrar or ApiToken change
+VERSION_COUNTER = "registrars"
+
+# Reported as the owner of the legacy API_TOKEN setting
+LEGACY_TOKEN_OWNER = "API_TOKEN"
+
+# Login-time view of a Registrar, throttling defaults already applied
+Account = namedtuple("Account", "client_id password session_rate rate burst max_sessions")
+
+
+def _account(registrar):
+    def pick(value, default):
+        return default if value is None else value
+    return Account(
+        registrar.client_id,
+        registrar.password,
+        pick(registrar.session_rate, settings.EPP_SESSION_RATE),
+        pick(registrar.rate, settings.EPP_REGISTRAR_RATE),
+        pick(registrar.burst, settings.EPP_RATE_BURST),
+        pick(registrar.max_sessions, settings.EPP_MAX_SESSIONS),
+    )
+
+
+class _CachedTable:
+    """Base for process-wide tables derived from Registrar rows.
+
+    Loaded on first use and reloaded when the shared "registrars"
+    ChangeCounter moves, checked at most every EPP_CREDENTIALS_REFRESH_SECONDS.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._table = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def build(self):
+        raise NotImplementedError
+
+    def load(self):
+        version = ChangeCounter.current(VERSION_COUNTER)
+        table = self.build()
+        with self._lock:
+            self._table = table
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+
+    def current(self):
+        if self._table is None or self._version is None:
+            self.load()
+            return self._table
+        now = time.monotonic()
+        if now - self._checked_at >= settings.EPP_CREDENTIALS_REFRESH_SECONDS:
+            self._checked_at = now
+            if ChangeCounter.current(VERSION_COUNTER) != self._version:
+                self.load()
+        return self._table
+
+
+class RegistrarCredentials(_CachedTable):
+    """Active registrars, used to answer EPP <login>.
+
+    A successful check is remembered by a digest of the password for as long
+    as the stored hash is unchanged, so reconnecting clients do not pay for
+    the password hasher on every login. Failures are never cached.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._verified = {}
+        self._check_locks = {}
+
+    def build(self):
+        return {r.client_id: _account(r) for r in Registrar.objects.filter(is_active=True)}
+
+    def authenticate(self, client_id, password):
+        """Return the registrar's Account, or None if the credentials are wrong."""
+        if not client_id or not password:
+            return None
+        account = self.current().get(client_id)
+        if account is None:
+            return None
+        key = (client_id, hashlib.sha256(password.encode()).digest())
+        if self._verified.get(key) == account.password:
+            return account
+        # One hasher run per registrar at a time: a reconnect storm waits for
+        # the first check and then hits the cache instead of queuing N of them
+        with self._lock:
+            check_lock = self._check_locks.setdefault(client_id, threading.Lock())
+        with check_lock:
+            if self._verified.get(key) == account.password:
+                return account
+            if not check_password(password, account.password):
+                return None
+            self._verified[key] = account.password
+        return account
+
+
+class ApiTokens(_CachedTable):
+    """API tokens for the HTTP capture endpoints.
+
+    Tokens look like "<prefix>.<secret>". The prefix is public and finds the
+    token's row; the SHA-256 digest of the whole token is then compared in
+    constant time. Tokens are random, so a plain digest is safe to store.
+    The legacy API_TOKEN environment variable, read at load time, is still
+    accepted.
+    """
+
+    def build(self):
+        tokens = {
+            prefix: (digest, client_id)
+            for prefix, digest, client_id in ApiToken.objects.filter(is_active=True, registrar__is_active=True)
+            .values_list("prefix", "digest", "registrar__client_id")
+        }
+        legacy = os.environ.get("API_TOKEN")
+        tokens[None] = (token_digest(legacy), LEGACY_TOKEN_OWNER) if legacy else None
+        return tokens
+
+    def authenticate(self, token):
+        """Return the client_id that owns ``token`` (or LEGACY_TOKEN_OWNER), else None."""
+        if not token:
+            return None
+        table = self.current()
+        prefix, dot, _ = token.partition(".")
+        entry = table.get(prefix) if dot else None
+        entry = entry or table[None]
+        if entry is None:
+            return None
+        digest, owner = entry
+        return owner if hmac.compare_digest(digest, token_digest(token)) else None
+
+
+def token_digest(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def generate_token():
+    """Return (token, prefix, digest) for a new API token."""
+    prefix = secrets.token_hex(4)
+    token = f"{prefix}.{secrets.token_urlsafe(32)}"
+    return token, prefix, token_digest(token)
+
+
+credentials = RegistrarCredentials()
+api_tokens = ApiTokens()
@@ -0,0 +1 @@
+# Mock EPP server internals shared by the run_eppserver engines.
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import resource
+import time
+
+from django.conf import settings
+
+from . import metrics
+from .commands import dispatch_batch, is_pending
+from .protocol import FrameBuffer, FrameError, frame_parts, greeting
+from .session import Session
+
+logger = logging.getLogger(__name__)
+
+
+def raise_nofile_limit():
+    # Every idle session holds a socket; lift the soft fd limit to the hard one
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            return soft
+        return hard
+    return soft
+
+
+class EPPProtocol(asyncio.BufferedProtocol):
+    """One EPP session. The transport reads straight into the session's
+    FrameBuffer; complete frames are queued for the session task in order."""
+
+    max_queued_batches = 8
+
+    def __init__(self, db_pool, recorder=None):
+        self.db_pool = db_pool
+        self.recorder = recorder
+        self.session = Session()
+        self.frames = FrameBuffer()
+        self.batches = asyncio.Queue()
+        self.can_write = asyncio.Event()
+        self.can_write.set()
+        self.reading_paused = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        metrics.session_opened()
+        if self.recorder is not None:
+            self.record_id = self.recorder.open_session()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def get_buffer(self, sizehint):
+        return self.frames.writable()
+
+    def buffer_updated(self, nbytes):
+        try:
+            frames = self.frames.advance(nbytes)
+        except FrameError as e:
+            logger.warning("Closing EPP session: %s", e)
+            self.transport.abort()
+            return
+        if frames:
+            if self.recorder is not None:
+                self.recorder.frames(self.record_id, frames)
+            self.batches.put_nowait(frames)
+            # Backpressure: stop reading while the session is behind
+            if self.batches.qsize() >= self.max_queued_batches and not self.reading_paused:
+                self.reading_paused = True
+                self.transport.pause_reading()
+
+    def eof_received(self):
+        self.batches.put_nowait(None)
+
+    def connection_lost(self, exc):
+        self.can_write.set()
+        self.batches.put_nowait(None)
+
+    def pause_writing(self):
+        self.can_write.clear()
+
+    def resume_writing(self):
+        self.can_write.set()
+
+    def write(self, responses):
+        # writelines hands the header/payload buffers to the transport unjoined
+        started = time.perf_counter()
+        self.transport.writelines(frame_parts(responses))
+        metrics.sent(time.perf_counter() - started)
+
+    async def run(self):
+        try:
+            self.write([greeting()])
+            idle_timeout = settings.EPP_IDLE_TIMEOUT or None
+            while True:
+                try:
+                    frames = await asyncio.wait_for(self.batches.get(), idle_timeout)
+                except asyncio.TimeoutError:
+                    break
+                if frames is None or self.transport.is_closing():
+                    break
+                if self.reading_paused and self.batches.qsize() < self.max_queued_batches // 2:
+                    self.reading_paused = False
+                    self.transport.resume_reading()
+                # ORM calls are synchronous; keep them off the event loop.
+                # Pipelined frames share one pool hop and one write.
+                responses = await asyncio.wrap_future(self.db_pool.submit(dispatch_batch, frames, self.session))
+                # Drop races complete on the scheduler thread; wait without tying up the pool
+                responses = [await asyncio.wrap_future(r) if is_pending(r) else r for r in responses]
+                if self.recorder is not None:
+                    self.recorder.responses(self.record_id, responses)
+                await self.can_write.wait()
+                if self.transport.is_closing():
+                    break
+                self.write(responses)
+                if self.session.closing:
+                    break
+        except Exception:
+            logger.exception("EPP session failed")
+            metrics.session_failed()
+        finally:
+            # Here rather than in connection_lost: no dispatch for this session is in flight
+            self.session.close()
+            self.transport.close()
+            metrics.session_closed()
+            if self.recorder is not None:
+                self.recorder.close_session(self.record_id)
+
+
+async def serve(host, port, db_pool, recorder=None, backlog=4096, reuse_port=False, started=None):
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(
+        lambda: EPPProtocol(db_pool, recorder), host, port, backlog=backlog, reuse_port=reuse_port or None,
+    )
+    if started:
+        started(server)
+    async with server:
+        await server.serve_forever()
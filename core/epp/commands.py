@@ -0,0 +1,172 @@
+import logging
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.availability import index
+from core.clock import clock
+from core.credentials import credentials
+from core.models import Domain, Drop
+from .protocol import (
+    EPP_RESPONSE_SUCCESS,
+    RESULTS,
+    epp_check_response,
+    epp_create_response,
+    greeting,
+)
+from . import metrics
+from .parser import DOMAIN_NAME, EPP_NS, parse_command
+from .profiling import profiler
+from .race import scheduler as race_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+def dispatch(data, session):
+    """Run one EPP command frame for ``session`` and return the response bytes.
+
+    A <create> that joins a drop race returns a Future of the response
+    instead; use resolve() or await it. Touches the database, so the asyncio
+    engine must call it from an executor.
+    """
+    started = time.perf_counter()
+    try:
+        command = parse_command(data)
+    except ET.ParseError:
+        command = None
+    parsed = time.perf_counter()
+    response = _run(command, session)
+    label = metrics.command_label(command and command.command)
+    metrics.command(label, parsed - started, time.perf_counter() - parsed)
+    if is_pending(response):
+        response.add_done_callback(_count_result)
+    else:
+        metrics.response(response)
+    return response
+
+
+def _count_result(future):
+    if future.exception() is None:
+        metrics.response(future.result())
+
+
+def _run(command, session):
+    if command is None:
+        return RESULTS[2001]
+    handler = HANDLERS.get(command.command, _default)
+    if handler not in SESSIONLESS and settings.EPP_REQUIRE_LOGIN and not session.logged_in:
+        return RESULTS[2002]
+    # Throttled commands are refused, not queued; a client may always log out
+    if handler is not _logout and not session.allow():
+        return RESULTS[2306]
+    return handler(command, session)
+
+
+def _hello(command, session):
+    # Keep-alive; no database access
+    return greeting()
+
+
+def _login(command, session):
+    if session.logged_in:
+        return RESULTS[2002]
+    account = credentials.authenticate(command.get(EPP_NS + 'clID'), command.get(EPP_NS + 'pw'))
+    if account is None:
+        return RESULTS[2200]
+    if not session.login(account):
+        session.closing = True
+        return RESULTS[2502]
+    return EPP_RESPONSE_SUCCESS
+
+
+def _logout(command, session):
+    session.closing = True
+    return RESULTS[1500]
+
+
+def _poll(command, session):
+    # No message queue is modelled
+    return RESULTS[1300]
+
+
+def _default(command, session):
+    return EPP_RESPONSE_SUCCESS
+
+
+def _check(command, session):
+    # Answer every <domain:name> with one lookup
+    domain_names = command.getall(DOMAIN_NAME)
+    if not domain_names:
+        return EPP_RESPONSE_SUCCESS
+    keys = [(d.split('.')[0], d.split('.')[-1]) for d in domain_names]
+    registered = index.registered(keys)
+    return epp_check_response([(d, key not in registered) for d, key in zip(domain_names, keys)])
+
+
+def _create(command, session):
+    domain_name = command.get(DOMAIN_NAME)
+    if not domain_name:
+        return EPP_RESPONSE_SUCCESS
+    labels = domain_name.split('.')
+    # Domains are stored as one name and one TLD
+    if len(labels) != 2 or not all(labels):
+        return RESULTS[2005]
+    name, tld = labels
+    # Find the drop for this domain
+    drop = Drop.objects.filter(domain__name=name, domain__tld=tld).order_by('-drop_time').first()
+    # If the drop is due, race the competitors on the scheduler instead of sleeping here
+    if drop and drop.drop_time <= clock.now():
+        if drop.status != 'pending':
+            return epp_create_response(domain_name, success=False)
+        return race_scheduler.enter(drop, session.client_id or 'You', lambda won: epp_create_response(domain_name, success=won))
+    # No drop or not due, fallback to normal create
+    domain, created = Domain.objects.get_or_create(name=name, tld=tld)
+    if created:
+        Drop.objects.create(domain=domain, drop_time=clock.now() + timezone.timedelta(days=1))
+    return epp_create_response(domain_name, success=created)
+
+
+# Command element -> handler; anything else gets a plain 1000
+HANDLERS = {
+    'hello': _hello,
+    'login': _login,
+    'logout': _logout,
+    'poll': _poll,
+    'check': _check,
+    'create': _create,
+}
+
+# Allowed before <login> when EPP_REQUIRE_LOGIN is on
+SESSIONLESS = {_hello, _login}
+
+
+def dispatch_batch(frames, session):
+    """Answer pipelined frames in order; frames after a <logout> are dropped.
+
+    A frame whose command fails gets a 2400 of its own; the frames around it
+    (and the session) carry on.
+    """
+    responses = []
+    for data in frames:
+        try:
+            response = profiler.call(dispatch, data, session) if profiler.active else dispatch(data, session)
+        except Exception:
+            logger.exception("EPP command failed")
+            response = RESULTS[2400]
+            metrics.response(response)
+        responses.append(response)
+        if session.closing:
+            break
+    return responses
+
+
+def is_pending(response):
+    return isinstance(response, Future)
+
+
+def resolve(responses):
+    # Blocks the calling (session) thread only; no DB connection is held meanwhile
+    return [r.result() if is_pending(r) else r for r in responses]
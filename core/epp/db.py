@@ -0,0 +1,72 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+
+def configure_thread_connections():
+    """Let this thread's connections live for EPP_DB_CONN_MAX_AGE.
+
+    Connection wrappers are per thread, so this leaves the web's CONN_MAX_AGE
+    alone. close_old_connections() then recycles them once they are too old
+    or, with CONN_HEALTH_CHECKS, once they stop answering.
+    """
+    for conn in connections.all():
+        conn.settings_dict = {**conn.settings_dict, 'CONN_MAX_AGE': settings.EPP_DB_CONN_MAX_AGE}
+
+
+class DatabasePool:
+    """Fixed set of threads that own every database connection of the EPP server.
+
+    Session threads and the event loop hand ORM work to the pool instead of
+    opening a connection each, so a process never holds more than ``size``
+    connections (plus one each for the race scheduler and settlement threads)
+    however many clients are connected.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._started = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='epp-db', initializer=self._init_thread)
+
+    def _init_thread(self):
+        configure_thread_connections()
+        with self._lock:
+            self._started += 1
+
+    @staticmethod
+    def _call(fn, args):
+        close_old_connections()
+        return fn(*args)
+
+    def submit(self, fn, *args):
+        return self.executor.submit(self._call, fn, args)
+
+    def run(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+    def close(self):
+        # Each pool thread closes its own connection: the barrier keeps a thread
+        # from picking up a second close job
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            started = self._started
+        if started:
+            barrier = threading.Barrier(started)
+
+            def close_connections():
+                try:
+                    barrier.wait(timeout=5)
+                except threading.BrokenBarrierError:
+                    pass
+                connections.close_all()
+
+            for _ in range(started):
+                self.executor.submit(close_connections)
+        self.executor.shutdown(wait=True)
+
@@ -0,0 +1,230 @@
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Histogram upper bounds in seconds, 50us to 10s
+BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# Commands get their own label; everything else is "other"
+COMMANDS = frozenset(('check', 'create'))
+
+RESULT_CODE = b'<result code="'
+
+HELP = {
+    'epp_commands_total': ('counter', 'EPP commands dispatched, by command.'),
+    'epp_responses_total': ('counter', 'EPP responses, by result code (greetings have none).'),
+    'epp_session_errors_total': ('counter', 'EPP sessions ended by an unexpected error.'),
+    'epp_sessions_opened_total': ('counter', 'EPP connections accepted.'),
+    'epp_sessions_closed_total': ('counter', 'EPP connections closed.'),
+    'epp_command_seconds': ('histogram', 'Time per EPP command and phase (parse, db, race_wait).'),
+    'epp_send_seconds': ('histogram', 'Time to hand one batch of responses to the socket.'),
+}
+
+
+class _Shard:
+    """One thread's metrics. Only the owning thread writes, so no locking;
+    readers copy the dicts, which the GIL makes safe."""
+
+    __slots__ = ('thread', 'counters', 'histograms')
+
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.counters = {}  # (name, labels) -> int
+        self.histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+
+    def merge(self, other):
+        for key, value in list(other.counters.items()):
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, values in list(other.histograms.items()):
+            mine = self.histograms.get(key)
+            if mine is None:
+                self.histograms[key] = list(values)
+            else:
+                for i, value in enumerate(values):
+                    mine[i] += value
+
+
+class Registry:
+    """Process-wide metrics, aggregated per thread.
+
+    Recording touches only the calling thread's shard: a dict lookup and an
+    add, no lock. Scrapes sum the shards and fold those of finished threads
+    into a retired total; a session thread folds its own in when the session
+    ends, so the shard list stays bounded even if nothing ever scrapes.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = _Shard()
+        self.gauges = {}  # name -> (help, callable)
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def release(self):
+        """Fold the calling thread's shard into the retired total."""
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            return
+        self._local.shard = None
+        with self._lock:
+            self._retired.merge(shard)
+            self._shards.remove(shard)
+
+    def inc(self, name, labels=(), amount=1):
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def observe(self, name, labels, seconds):
+        histograms = self._shard().histograms
+        key = (name, labels)
+        values = histograms.get(key)
+        if values is None:
+            values = histograms[key] = [0] * (len(BUCKETS) + 2)
+        values[bisect.bisect_left(BUCKETS, seconds)] += 1
+        values[-1] += seconds
+
+    def gauge(self, name, help, read):
+        self.gauges[name] = (help, read)
+
+    def collect(self):
+        """Return one _Shard holding the sum of every thread's metrics."""
+        total = _Shard()
+        with self._lock:
+            live = []
+            for shard in self._shards:
+                if shard.thread.is_alive():
+                    live.append(shard)
+                else:
+                    # A finished thread writes no more: fold it in for good
+                    self._retired.merge(shard)
+            self._shards = live
+            total.merge(self._retired)
+        for shard in live:
+            total.merge(shard)
+        return total
+
+    def render(self):
+        """The Prometheus text exposition format (version 0.0.4)."""
+        total = self.collect()
+        families = {}  # name -> [(labels, lines)]
+        for (name, labels), value in total.counters.items():
+            families.setdefault(name, []).append((labels, [f'{name}{_labels(labels)} {value}']))
+        for (name, labels), values in total.histograms.items():
+            lines = []
+            families.setdefault(name, []).append((labels, lines))
+            cumulative = 0
+            for bound, count in zip((*BUCKETS, '+Inf'), values):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {values[-1]:.6f}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        out = []
+        for name in sorted(families):
+            kind, help = HELP.get(name, ('untyped', name))
+            out += [f'# HELP {name} {help}', f'# TYPE {name} {kind}']
+            # Series by label set; a histogram's buckets stay in increasing le order
+            for _, lines in sorted(families[name], key=lambda series: series[0]):
+                out += lines
+        for name, (help, read) in sorted(self.gauges.items()):
+            out += [f'# HELP {name} {help}', f'# TYPE {name} gauge', f'{name} {read()}']
+        return '\n'.join(out) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+def command_label(command):
+    return command if command in COMMANDS else 'other'
+
+
+def result_code(response):
+    start = response.find(RESULT_CODE)
+    return response[start + 14:start + 18].decode() if start >= 0 else 'greeting'
+
+
+registry = Registry()
+
+
+def _active_sessions():
+    counters = registry.collect().counters
+    return counters.get(('epp_sessions_opened_total', ()), 0) - counters.get(('epp_sessions_closed_total', ()), 0)
+
+
+registry.gauge('epp_sessions_active', 'EPP connections currently open.', _active_sessions)
+registry.gauge('epp_threads', 'Threads in this server process.', threading.active_count)
+
+
+def session_opened():
+    registry.inc('epp_sessions_opened_total')
+
+
+def session_closed():
+    registry.inc('epp_sessions_closed_total')
+    # With the thread engine the session's thread ends next
+    registry.release()
+
+
+def session_failed():
+    registry.inc('epp_session_errors_total')
+
+
+def command(label, parse_seconds, handler_seconds):
+    registry.inc('epp_commands_total', (('command', label),))
+    registry.observe('epp_command_seconds', (('command', label), ('phase', 'parse')), parse_seconds)
+    registry.observe('epp_command_seconds', (('command', label), ('phase', 'db')), handler_seconds)
+
+
+def race_wait(seconds):
+    registry.observe('epp_command_seconds', (('command', 'create'), ('phase', 'race_wait')), seconds)
+
+
+def response(data):
+    registry.inc('epp_responses_total', (('code', result_code(data)),))
+
+
+def sent(seconds):
+    registry.observe('epp_send_seconds', (), seconds)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would drown the server's own output
+        pass
+
+
+def serve(host, port):
+    """Serve GET /metrics on a daemon thread; returns the HTTP server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='epp-metrics', daemon=True).start()
+    logger.info("EPP metrics on http://%s:%s/metrics", host, port)
+    return server
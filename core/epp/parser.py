@@ -0,0 +1,54 @@
+import xml.etree.ElementTree as ET
+
+EPP_NS = '{urn:ietf:params:xml:ns:epp-1.0}'
+DOMAIN_NS = '{urn:ietf:params:xml:ns:domain-1.0}'
+
+DOMAIN_NAME = DOMAIN_NS + 'name'
+
+
+class ParsedCommand:
+    """Command type of one EPP frame plus lazy access to its fields.
+
+    ``command`` is the local name of the first element under <command>
+    (check, create, ...) or, for frames like <hello/>, under <epp>. It is
+    found by position rather than by wildcard searches over the whole tree,
+    and fields are looked up by exact tag within the command element only;
+    a wildcard search is used only if the command is not in the EPP namespace.
+    """
+
+    __slots__ = ('command', 'element')
+
+    def __init__(self, command, element):
+        self.command = command
+        self.element = element
+
+    def getall(self, tag):
+        if self.element is None:
+            return []
+        if self.element.tag.startswith(EPP_NS):
+            elements = self.element.iter(tag)
+        else:
+            # Clients that use another namespace URI (or none) still get answered
+            elements = self.element.iterfind('.//{*}' + _local(tag))
+        return [text.strip() for text in (el.text for el in elements) if text and text.strip()]
+
+    def get(self, tag):
+        values = self.getall(tag)
+        return values[0] if values else None
+
+
+def _local(tag):
+    return tag[tag.rfind('}') + 1:]
+
+
+def parse_command(data):
+    """Parse one EPP frame (bytes or str); raises ET.ParseError if malformed."""
+    root = ET.fromstring(data)
+    if not len(root):
+        return ParsedCommand(None, None)
+    element = root[0]
+    if _local(element.tag) == 'command':
+        if not len(element):
+            return ParsedCommand(None, None)
+        element = element[0]
+    return ParsedCommand(_local(element.tag), element)
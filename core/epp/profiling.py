@@ -0,0 +1,207 @@
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import signal
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MODES = ('cprofile', 'stacks')
+
+# Written by the epp_profile command before it signals the server
+CONTROL_FILE = 'control.json'
+# A request older than this was meant for an earlier signal
+CONTROL_MAX_AGE = 10.0
+
+
+class Profiler:
+    """Samples EPP commands while switched on; SIGUSR1 toggles it.
+
+    Off, the only cost is the ``active`` check in dispatch_batch. On, a
+    ``rate`` share of commands runs under the process-wide cProfile.Profile
+    ("cprofile"), or is watched by a thread that samples its stack every
+    ``interval`` seconds ("stacks"). Only one profiler can be active per
+    process (Python 3.12+ raises otherwise), so in "cprofile" mode a sampled
+    command that finds it busy on another thread runs unprofiled. Stopping writes one .pstats or
+    .collapsed file (flamegraph.pl / speedscope input) to EPP_PROFILE_DIR.
+    """
+
+    def __init__(self):
+        self.active = False
+        self.mode = 'cprofile'
+        self.rate = 1.0
+        self.interval = 0.005
+        self._lock = threading.Lock()
+        self._profile_lock = threading.Lock()
+        self._profile = None
+        self._profiled = 0
+        self._running = {}  # thread ident -> number of sampled commands in flight
+        self._stacks = Counter()
+        self._sampler = None
+        self._started_at = None
+        self._applied = None  # id of the last control request acted on
+
+    def start(self, mode='cprofile', rate=1.0, interval=0.005):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode {mode!r}")
+        with self._lock:
+            if self.active:
+                return False
+            self.mode, self.rate, self.interval = mode, rate, interval
+            self._profile, self._profiled = cProfile.Profile(), 0
+            self._stacks = Counter()
+            self._started_at = time.time()
+            self.active = True
+        if mode == 'stacks':
+            self._sampler = threading.Thread(target=self._sample, name='epp-profiler', daemon=True)
+            self._sampler.start()
+        logger.warning("EPP profiler started (%s, rate %s)", mode, rate)
+        return True
+
+    def stop(self):
+        """Switch off and write the output file; returns its path, or None."""
+        with self._lock:
+            if not self.active:
+                return None
+            self.active = False
+        # Let sampled commands still in flight disable their own profiles
+        deadline = time.monotonic() + 5
+        while self._running and time.monotonic() < deadline:
+            time.sleep(0.01)
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        path = self._write()
+        logger.warning("EPP profiler stopped; wrote %s", path)
+        return path
+
+    def call(self, fn, *args):
+        """Run ``fn(*args)``, sampled at ``rate`` while the profiler is on."""
+        if not self.active or random.random() >= self.rate:
+            return fn(*args)
+        ident = threading.get_ident()
+        with self._lock:
+            self._running[ident] = self._running.get(ident, 0) + 1
+        try:
+            if self.mode == 'stacks':
+                return fn(*args)
+            return self._runcall(fn, *args)
+        finally:
+            with self._lock:
+                if self._running[ident] == 1:
+                    del self._running[ident]
+                else:
+                    self._running[ident] -= 1
+
+    def _runcall(self, fn, *args):
+        if not self._profile_lock.acquire(blocking=False):
+            return fn(*args)
+        try:
+            profile = self._profile
+            try:
+                profile.enable()
+            except ValueError:
+                # Some other tool (a debugger, an outer cProfile) holds the hook
+                return fn(*args)
+            try:
+                return fn(*args)
+            finally:
+                profile.disable()
+                self._profiled += 1
+        finally:
+            self._profile_lock.release()
+
+    def _sample(self):
+        while self.active:
+            frames = sys._current_frames()
+            for ident in list(self._running):
+                frame = frames.get(ident)
+                if frame is not None:
+                    self._stacks[_collapse(frame)] += 1
+            time.sleep(self.interval)
+
+    def _write(self):
+        directory = settings.EPP_PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self._started_at))
+        path = os.path.join(directory, f'epp-{os.getpid()}-{stamp}')
+        if self.mode == 'stacks':
+            path += '.collapsed'
+            with open(path, 'w') as f:
+                for stack, count in self._stacks.most_common():
+                    f.write(f'{stack} {count}\n')
+            return path
+        path += '.pstats'
+        if not self._profiled:
+            return None
+        with self._profile_lock:
+            pstats.Stats(self._profile).dump_stats(path)
+        return path
+
+    def toggle(self):
+        """SIGUSR1: apply a fresh control request if there is one, else switch on/off.
+
+        The file stays behind (every worker reads it), so a request is used
+        once and only while it is recent; a later plain kill -USR1 toggles.
+        """
+        request = read_control()
+        if request.get('id') == self._applied or time.time() - request.get('written_at', 0) > CONTROL_MAX_AGE:
+            request = {}
+        else:
+            self._applied = request['id']
+        action = request.get('action') or ('stop' if self.active else 'start')
+        if action == 'start':
+            self.start(
+                request.get('mode', settings.EPP_PROFILE_MODE),
+                float(request.get('rate', settings.EPP_PROFILE_RATE)),
+                float(request.get('interval', 0.005)),
+            )
+        else:
+            self.stop()
+
+
+def _collapse(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+def control_path():
+    return os.path.join(settings.EPP_PROFILE_DIR, CONTROL_FILE)
+
+
+def write_control(**request):
+    os.makedirs(settings.EPP_PROFILE_DIR, exist_ok=True)
+    request.update(id=uuid.uuid4().hex, written_at=time.time())
+    with open(control_path(), 'w') as f:
+        json.dump(request, f)
+
+
+def read_control():
+    try:
+        with open(control_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def install_signal_handler():
+    # Writing the output waits for in-flight commands: keep it off the main thread
+    def handler(signum, frame):
+        threading.Thread(target=profiler.toggle, name='epp-profiler-toggle', daemon=True).start()
+    signal.signal(signal.SIGUSR1, handler)
+
+
+profiler = Profiler()
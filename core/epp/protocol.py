@@ -0,0 +1,213 @@
+import os
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+
+from core.clock import clock
+
+IOV_MAX = os.sysconf('SC_IOV_MAX') if hasattr(os, 'sysconf') else 1024
+
+# Responses are assembled from pre-encoded byte templates: only the variable
+# parts (timestamps, domain names) are encoded per command.
+
+GREETING_HEAD, GREETING_TAIL = b'''<?xml version="1.0" encoding="UTF-8"?>
+<epp xmlns="urn:ietf:params:xml:ns:epp-1.0">
+  <greeting>
+    <svID>Mock Nominet EPP</svID>
+    <svDate>{now}</svDate>
+    <svcMenu>
+      <version>1.0</version>
+      <lang>en</lang>
+      <objURI>urn:ietf:params:xml:ns:domain-1.0</objURI>
+    </svcMenu>
+  </greeting>
+</epp>'''.split(b'{now}')
+
+RESULT_MESSAGES = {
+    1000: 'Command completed successfully',
+    1300: 'Command completed successfully; no messages',
+    1500: 'Command completed successfully; ending session',
+    2001: 'Command syntax error',
+    2002: 'Command use error',
+    2005: 'Parameter value syntax error',
+    2200: 'Authentication error',
+    2302: 'Object exists',
+    2306: 'Parameter value policy error; command rate limit exceeded',
+    2400: 'Command failed',
+    2502: 'Session limit exceeded; server closing connection',
+}
+
+# Responses that carry only a result code, one pre-encoded frame body each
+RESULTS = {
+    code: f'''<?xml version="1.0" encoding="UTF-8"?>
+<epp xmlns="urn:ietf:params:xml:ns:epp-1.0">
+  <response>
+    <result code="{code}">
+      <msg>{msg}</msg>
+    </result>
+  </response>
+</epp>'''.encode()
+    for code, msg in RESULT_MESSAGES.items()
+}
+
+EPP_RESPONSE_SUCCESS = RESULTS[1000]
+
+CHECK_HEAD = b'''<?xml version="1.0" encoding="UTF-8"?>
+<epp xmlns="urn:ietf:params:xml:ns:epp-1.0">
+  <response>
+    <result code="1000">
+      <msg>Command completed successfully</msg>
+    </result>
+    <resData>
+      <domain:chkData xmlns:domain="urn:ietf:params:xml:ns:domain-1.0">'''
+CHECK_TAIL = b'''
+      </domain:chkData>
+    </resData>
+  </response>
+</epp>'''
+# Indexed by avail
+CHECK_CD_HEAD = (
+    b'''
+        <domain:cd>
+          <domain:name avail="0">''',
+    b'''
+        <domain:cd>
+          <domain:name avail="1">''',
+)
+CHECK_CD_TAIL = b'''</domain:name>
+        </domain:cd>'''
+
+CREATE_HEAD, CREATE_TAIL = b'''<?xml version="1.0" encoding="UTF-8"?>
+<epp xmlns="urn:ietf:params:xml:ns:epp-1.0">
+  <response>
+    <result code="1000">
+      <msg>Command completed successfully</msg>
+    </result>
+    <resData>
+      <domain:creData xmlns:domain="urn:ietf:params:xml:ns:domain-1.0">
+        <domain:name>{name}</domain:name>
+      </domain:creData>
+    </resData>
+  </response>
+</epp>'''.split(b'{name}')
+
+EPP_RESPONSE_OBJECT_EXISTS = RESULTS[2302]
+
+# (second, bytes): svDate has one-second resolution, so hellos reuse the frame
+_greeting = (None, b'')
+
+
+def greeting():
+    global _greeting
+    now = clock.now().replace(microsecond=0)
+    second, data = _greeting
+    if second != now:
+        data = GREETING_HEAD + now.isoformat().encode() + GREETING_TAIL
+        _greeting = (now, data)
+    return data
+
+
+def epp_check_response(results):
+    # results: [(domain_name, avail), ...] in request order
+    parts = [CHECK_HEAD]
+    for domain_name, avail in results:
+        parts += (CHECK_CD_HEAD[bool(avail)], escape(domain_name).encode(), CHECK_CD_TAIL)
+    parts.append(CHECK_TAIL)
+    return b''.join(parts)
+
+
+def epp_create_response(domain_name, success):
+    if success:
+        return CREATE_HEAD + escape(domain_name).encode() + CREATE_TAIL
+    return EPP_RESPONSE_OBJECT_EXISTS
+
+
+class FrameError(ValueError):
+    pass
+
+
+class FrameBuffer:
+    """Preallocated receive buffer that yields complete EPP frames.
+
+    Sockets read straight into ``writable()`` (``recv_into`` or an asyncio
+    BufferedProtocol), so bytes are copied once, when a frame is sliced out.
+    Partial headers and bodies simply wait for the next read; the buffer only
+    grows, up to ``max_frame`` plus header, to fit one oversized frame.
+    """
+
+    def __init__(self, max_frame=None, size=65536):
+        self.max_frame = max_frame or settings.EPP_MAX_FRAME_BYTES
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+
+    def writable(self):
+        """Free space to receive into, compacting or growing the buffer first."""
+        if self._end == len(self._buffer):
+            pending = self._end - self._start
+            needed = max(self._pending_frame_length(), pending + 1)
+            if needed > len(self._buffer):
+                self._grow(needed)
+            elif self._start:
+                self._buffer[:pending] = self._view[self._start:self._end]
+                self._start, self._end = 0, pending
+        return self._view[self._end:]
+
+    def advance(self, nbytes):
+        """Record ``nbytes`` received into ``writable()`` and return complete frames."""
+        self._end += nbytes
+        frames = []
+        while self._end - self._start >= 4:
+            length = self._pending_frame_length()
+            if self._end - self._start < length:
+                break
+            frames.append(bytes(self._view[self._start + 4:self._start + length]))
+            self._start += length
+        if self._start == self._end:
+            self._start = self._end = 0
+        return frames
+
+    def _pending_frame_length(self):
+        if self._end - self._start < 4:
+            return 0
+        length = int.from_bytes(self._view[self._start:self._start + 4], 'big')
+        if length < 4:
+            raise FrameError(f"Invalid EPP frame length {length}")
+        if length - 4 > self.max_frame:
+            raise FrameError(f"EPP frame of {length - 4} bytes exceeds the {self.max_frame} byte limit")
+        return length
+
+    def _grow(self, needed):
+        buffer = bytearray(max(needed, 2 * len(self._buffer)))
+        pending = self._end - self._start
+        buffer[:pending] = self._view[self._start:self._end]
+        self._view.release()
+        self._buffer, self._view = buffer, memoryview(buffer)
+        self._start, self._end = 0, pending
+
+
+def frame_parts(responses):
+    """Header/payload buffers for each response, ready for scatter-gather sends.
+
+    EPP over TCP (RFC 5734): a 4-byte big-endian total length, header included.
+    """
+    parts = []
+    for data in responses:
+        parts.append((len(data) + 4).to_bytes(4, 'big'))
+        parts.append(data)
+    return parts
+
+
+def send_frames(sock, responses):
+    # sendmsg writes header and payload buffers without joining them; a short
+    # write resumes from where the kernel stopped
+    buffers = [memoryview(part) for part in frame_parts(responses)]
+    while buffers:
+        sent = sock.sendmsg(buffers[:IOV_MAX])
+        while sent:
+            if sent >= len(buffers[0]):
+                sent -= len(buffers.pop(0))
+            else:
+                buffers[0] = buffers[0][sent:]
+                sent = 0
@@ -0,0 +1,142 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from core.clock import clock
+from core.feed import record_drop_changes
+from core.models import Drop
+from . import metrics
+from .db import configure_thread_connections
+
+logger = logging.getLogger(__name__)
+
+
+class Race:
+    """One drop being contested by simulated competitors and live EPP clients.
+
+    Everything runs on virtual time measured from ``drop_time``: a competitor
+    fires ``delay_ms`` after the drop, a live client at the moment its <create>
+    arrived. The earliest arrival wins; ties go to the simulated competitor.
+    """
+
+    def __init__(self, drop, competitors):
+        self.drop_id = drop.pk
+        self.drop_time = drop.drop_time
+        self.competitors = competitors  # [(delay_ms, name)]
+        self.entries = []  # [(offset_ms, client_name, _Respond)]
+
+    @property
+    def resolve_at(self):
+        # Nobody can beat the fastest competitor once its delay has elapsed
+        if self.competitors:
+            return self.drop_time + timezone.timedelta(milliseconds=min(self.competitors)[0])
+        return self.drop_time
+
+    def winner(self):
+        candidates = [(delay, 0, name, None) for delay, name in self.competitors]
+        candidates += [(offset, 1, name, entry) for offset, name, entry in self.entries]
+        if not candidates:
+            return None, None
+        _, _, name, entry = min(candidates, key=lambda c: (c[0], c[1]))
+        return name, entry
+
+
+class RaceScheduler:
+    """Resolves every contested drop once, on a single timer thread.
+
+    Clients get a Future instead of sleeping through the competitor delays;
+    the scheduler settles the winner in one transaction and completes the
+    futures of everyone who took part.
+    """
+
+    def __init__(self):
+        self._races = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def enter(self, drop, client_name, respond):
+        """Register a live <create> for a due drop.
+
+        ``respond(won)`` builds the EPP response; the returned Future yields it.
+        A client that arrives after the race was settled joins a fresh one,
+        which finds the drop no longer pending and so loses.
+        """
+        future = Future()
+        now = clock.now()
+        competitors = None
+        while True:
+            with self._cond:
+                race = self._races.get(drop.pk)
+                if race is None and competitors is not None:
+                    race = self._races[drop.pk] = Race(drop, competitors)
+                    heapq.heappush(self._heap, (race.resolve_at, next(self._seq), drop.pk))
+                    self._ensure_thread()
+                    self._cond.notify()
+                if race is not None:
+                    offset_ms = (now - race.drop_time).total_seconds() * 1000.0
+                    race.entries.append((offset_ms, client_name, _Respond(future, respond)))
+                    return future
+            # Query outside the lock: a slow one must not hold up other
+            # callers or the timer thread
+            competitors = sorted(drop.competitors.values_list('delay_ms', 'name'))
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='epp-race', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        configure_thread_connections()
+        while True:
+            with self._cond:
+                while True:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    # Bounded by the clock, so a jump of a virtual clock is noticed
+                    wait = clock.timeout(self._heap[0][0])
+                    if wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                _, _, drop_id = heapq.heappop(self._heap)
+                race = self._races.pop(drop_id)
+            self._resolve(race)
+
+    def _resolve(self, race):
+        name, winning_entry = race.winner()
+        try:
+            close_old_connections()
+            with transaction.atomic():
+                settled = Drop.objects.filter(pk=race.drop_id, status='pending').update(status='captured', winner=name)
+                if settled:
+                    record_drop_changes([race.drop_id])
+        except Exception:
+            logger.exception("Failed to settle drop %s", race.drop_id)
+            settled = 0
+        for _, _, entry in race.entries:
+            entry.complete(bool(settled) and entry is winning_entry)
+
+
+class _Respond:
+    def __init__(self, future, respond):
+        self.future = future
+        self.respond = respond
+        self.entered = time.perf_counter()
+
+    def complete(self, won):
+        metrics.race_wait(time.perf_counter() - self.entered)
+        try:
+            self.future.set_result(self.respond(won))
+        except Exception as e:
+            self.future.set_exception(e)
+
+
+scheduler = RaceScheduler()
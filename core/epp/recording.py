@@ -0,0 +1,145 @@
+import itertools
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# File header: magic, then the monotonic and wall-clock ns of one instant, to map
+# record times (monotonic, comparable across worker files) to wall-clock time
+MAGIC = b'EPPREC02'
+HEADER = struct.Struct('>8sQQ')
+# Record: monotonic ns, session id, sequence number, kind, payload length;
+# then the payload. Frames are numbered from 1 within their session and a
+# response carries the number of the frame it answers, so records lost to a
+# full queue leave a gap rather than shifting the pairs.
+RECORD = struct.Struct('>QQIBI')
+
+OPEN, FRAME, RESPONSE, CLOSE = 1, 2, 3, 4
+
+Record = namedtuple('Record', 'ts session seq kind payload')
+
+
+class Recorder:
+    """Appends every inbound EPP frame to a binary log for epp_replay.
+
+    Session threads and the event loop only put tuples on a bounded queue;
+    a background thread packs them and writes in large chunks. When the disk
+    falls behind, records are dropped (and counted) rather than blocking.
+    Responses are logged as their result code only, so replays can compare
+    outcomes and latency. Frames are kept verbatim, <login> passwords
+    included, so the file is created readable by its owner only.
+    """
+
+    def __init__(self, path, maxsize=100000, buffer_size=1 << 20):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self.file = os.fdopen(fd, 'ab', buffering=buffer_size)
+        if self.file.tell() == 0:
+            self.file.write(HEADER.pack(MAGIC, time.monotonic_ns(), time.time_ns()))
+        self.path = path
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+        self._counts = {}  # session -> [frames, responses] numbered so far
+        # Unique across worker restarts appending to the same file
+        self._ids = itertools.count((os.getpid() & 0xFFFFFFFF) << 32 | 1)
+        self._thread = threading.Thread(target=self._run, name='epp-recorder', daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def open_session(self):
+        session = next(self._ids)
+        # Each session's counts are only touched by the thread (or loop) serving it
+        self._counts[session] = [0, 0]
+        self._put((time.monotonic_ns(), session, 0, OPEN, b''))
+        return session
+
+    def close_session(self, session):
+        self._counts.pop(session, None)
+        self._put((time.monotonic_ns(), session, 0, CLOSE, b''))
+
+    def frames(self, session, frames):
+        now = time.monotonic_ns()
+        counts = self._counts[session]
+        for data in frames:
+            counts[0] += 1
+            self._put((now, session, counts[0], FRAME, data))
+
+    def responses(self, session, responses):
+        # Both engines answer a session's frames one to one, in order
+        now = time.monotonic_ns()
+        counts = self._counts[session]
+        for data in responses:
+            code = metrics.result_code(data)
+            if code == 'greeting':
+                self._put((now, session, 0, RESPONSE, b''))
+                continue
+            counts[1] += 1
+            self._put((now, session, counts[1], RESPONSE, code.encode()))
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            # Everything queued so far goes out in one write
+            items = [self.queue.get()]
+            while len(items) < 4096:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            chunk = []
+            for item in items:
+                if item is None:
+                    stopping = True
+                    break
+                ts, session, seq, kind, payload = item
+                chunk += (RECORD.pack(ts, session, seq, kind, len(payload)), payload)
+            self.file.write(b''.join(chunk))
+            if self.queue.empty():
+                # Caught up: hand the buffer to the OS while it is quiet
+                self.file.flush()
+
+    def close(self):
+        self.queue.put(None)
+        self._thread.join()
+        self.file.close()
+        if self.dropped:
+            logger.warning("EPP recorder dropped %s records", self.dropped)
+
+
+def read_log(path):
+    """Return (wall-clock offset, iterator of Records).
+
+    A record's wall-clock time in ns is its ``ts`` plus the offset.
+    """
+    f = open(path, 'rb')
+    header = f.read(HEADER.size)
+    if len(header) < HEADER.size or header[:8] != MAGIC:
+        f.close()
+        raise ValueError(f"{path} is not an EPP recording")
+    _, mono, wall = HEADER.unpack(header)
+    return wall - mono, _records(f)
+
+
+def _records(f):
+    with f:
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                # A truncated tail (crash mid-write) ends the log
+                return
+            ts, session, seq, kind, length = RECORD.unpack(head)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield Record(ts, session, seq, kind, payload)
@@ -0,0 +1,49 @@
+from django.conf import settings
+
+from .throttle import TokenBucket, accounts
+
+
+class Session:
+    """State of one EPP connection.
+
+    Starts logged out; <login> binds it to a registrar and <logout> marks it
+    for closing once the response is sent. A connection's frames are
+    dispatched one batch at a time, so no locking is needed. close() must be
+    called when the connection ends to free the registrar's session slot.
+    """
+
+    __slots__ = ('client_id', 'closing', 'bucket')
+
+    def __init__(self):
+        self.client_id = None
+        self.closing = False
+        # Until login the server-wide per-session rate applies
+        self.bucket = TokenBucket.for_rate(settings.EPP_SESSION_RATE, settings.EPP_RATE_BURST)
+
+    @property
+    def logged_in(self):
+        return self.client_id is not None
+
+    def login(self, account):
+        """Bind to ``account``; False if the registrar has no session slot left."""
+        if not accounts.open_session(account.client_id, account.rate, account.burst, account.max_sessions):
+            return False
+        self.client_id = account.client_id
+        self.bucket = TokenBucket.for_rate(account.session_rate, account.burst)
+        return True
+
+    def allow(self):
+        """Take one command from the session and registrar buckets."""
+        if self.bucket is not None and not self.bucket.take():
+            return False
+        if self.client_id is None or accounts.take(self.client_id):
+            return True
+        # Refused for the registrar: the session's own budget stays unspent
+        if self.bucket is not None:
+            self.bucket.refund()
+        return False
+
+    def close(self):
+        if self.client_id is not None:
+            accounts.close_session(self.client_id)
+            self.client_id = None
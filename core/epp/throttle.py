@@ -0,0 +1,93 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Allows ``rate`` commands per second with bursts of up to ``capacity``.
+
+    Refilled lazily from the elapsed time on each take(): O(1), no timers.
+    """
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', '_lock')
+
+    def __init__(self, rate, capacity=0):
+        self._lock = threading.Lock()
+        self.updated = time.monotonic()
+        self.configure(rate, capacity)
+        self.tokens = self.capacity
+
+    @classmethod
+    def for_rate(cls, rate, capacity=0):
+        # A rate of 0 (or None) means unlimited: no bucket at all
+        return cls(rate, capacity) if rate else None
+
+    def configure(self, rate, capacity=0):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, self.rate))
+
+    def take(self):
+        with self._lock:
+            now = time.monotonic()
+            tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if tokens < 1.0:
+                self.tokens = tokens
+                return False
+            self.tokens = tokens - 1.0
+            return True
+
+    def refund(self):
+        """Give back a token taken for a command that was refused elsewhere."""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + 1.0)
+
+
+class _Account:
+    __slots__ = ('bucket', 'sessions')
+
+    def __init__(self):
+        self.bucket = None
+        self.sessions = 0
+
+
+class AccountLimits:
+    """Per-registrar command buckets and open session counts.
+
+    Shared by every session of this process; with several --workers each
+    worker enforces the limits on its own share of the connections.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._accounts = {}
+
+    def open_session(self, client_id, rate, burst, max_sessions):
+        """Count a new logged-in session; False if it would exceed ``max_sessions``."""
+        with self._lock:
+            account = self._accounts.get(client_id)
+            if account is None:
+                account = self._accounts[client_id] = _Account()
+            if max_sessions and account.sessions >= max_sessions:
+                return False
+            account.sessions += 1
+            # Limits are re-read from the registrar on every login
+            if not rate:
+                account.bucket = None
+            elif account.bucket is None:
+                account.bucket = TokenBucket(rate, burst)
+            else:
+                account.bucket.configure(rate, burst)
+            return True
+
+    def close_session(self, client_id):
+        with self._lock:
+            account = self._accounts.get(client_id)
+            if account is not None:
+                account.sessions = max(0, account.sessions - 1)
+
+    def take(self, client_id):
+        account = self._accounts.get(client_id)
+        return account is None or account.bucket is None or account.bucket.take()
+
+
+accounts = AccountLimits()
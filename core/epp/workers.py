@@ -0,0 +1,115 @@
+import logging
+import os
+import signal
+import time
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class Supervisor:
+    """Pre-fork N worker processes and keep them running.
+
+    Each worker binds its own listening socket with SO_REUSEPORT, so the kernel
+    spreads incoming connections across processes. Crashed workers are
+    restarted; SIGINT/SIGTERM stops every worker before the supervisor exits.
+    """
+
+    restart_delay = 1.0
+    stop_timeout = 10.0
+
+    def __init__(self, workers, target):
+        self.workers = workers
+        self.target = target
+        self.children = {}  # pid -> worker slot
+        self.stopping = False
+
+    def run(self):
+        # Workers must not inherit a DB connection opened by the parent
+        connections.close_all()
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        # epp_profile signals the supervisor; every worker toggles its profiler
+        signal.signal(signal.SIGUSR1, self._forward)
+        for slot in range(self.workers):
+            self._spawn(slot)
+        try:
+            while self.children:
+                try:
+                    pid, status = os.wait()
+                except ChildProcessError:
+                    break
+                except InterruptedError:
+                    continue
+                slot = self.children.pop(pid, None)
+                if slot is None or self.stopping:
+                    continue
+                logger.warning("EPP worker %s (pid %s) exited with status %s, restarting", slot, pid, status)
+                time.sleep(self.restart_delay)
+                if not self.stopping:
+                    self._spawn(slot)
+        finally:
+            self._stop_children()
+
+    def _spawn(self, slot):
+        pid = os.fork()
+        if pid == 0:
+            self._run_child(slot)
+        self.children[pid] = slot
+        return pid
+
+    def _run_child(self, slot):
+        code = 0
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.default_int_handler)
+            # Each worker opens its own connection on first query
+            connections.close_all()
+            self.target(slot)
+        except KeyboardInterrupt:
+            pass
+        except BaseException:
+            logger.exception("EPP worker %s crashed", slot)
+            code = 1
+        finally:
+            connections.close_all()
+            # os._exit skips atexit: flush the queued log handlers first
+            logging.shutdown()
+            os._exit(code)
+
+    def _request_stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _forward(self, signum, frame):
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _stop_children(self):
+        self.stopping = True
+        self._request_stop(signal.SIGTERM, None)
+        deadline = time.monotonic() + self.stop_timeout
+        while self.children and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                self.children.pop(pid, None)
+            else:
+                time.sleep(0.05)
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.children.clear()
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import logging
+from zoneinfo import ZoneInfo
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Drop, DropEvent
+
+logger = logging.getLogger(__name__)
+
+# Use BST (Europe/London with DST)
+LONDON_TZ = ZoneInfo("Europe/London")
+
+
+VERSION_CACHE_KEY = "drops:version"
+
+
+def normalize_sort(sort, order):
+    if sort not in ("drop_time", "created_at"): sort = "drop_time"
+    if order not in ("asc", "desc"): order = "asc"
+    return sort, order
+
+
+def recent_drops(sort="drop_time", order="asc", limit=20):
+    # Fixed query count: one for drops + domains, one for all their competitors
+    sort, order = normalize_sort(sort, order)
+    sort_prefix = "" if order == "asc" else "-"
+    return list(
+        Drop.objects.select_related("domain")
+        .prefetch_related("competitors")
+        .order_by(f"{sort_prefix}{sort}")[:limit]
+    )
+
+
+def display_status(drop, my_name):
+    # A drop captured by someone else is a miss from this user's point of view
+    if drop.status == "captured" and drop.winner != my_name:
+        return "missed"
+    return drop.status
+
+
+def serialize_drop(drop):
+    # "status" is the stored one; project() turns it into the per-user view
+    drop_time_bst = drop.drop_time.astimezone(LONDON_TZ)
+    created_at_bst = drop.created_at.astimezone(LONDON_TZ)
+    return {
+        "id": drop.id,
+        "domain": str(drop.domain),
+        "drop_time": drop_time_bst.strftime("%I:%M:%S %p"),
+        # For datetime-local input: yyyy-MM-ddTHH:mm:ss
+        "drop_time_iso": drop_time_bst.strftime("%Y-%m-%dT%H:%M:%S"),
+        "created_at": created_at_bst.strftime("%I:%M:%S %p"),
+        # Sort keys for the dashboard's event stream
+        "created_at_iso": created_at_bst.strftime("%Y-%m-%dT%H:%M:%S"),
+        "status": drop.status,
+        "winner": drop.winner or "-",
+        "competitors": [
+            {"name": c.name, "attempts": c.attempts, "delay_ms": c.delay_ms}
+            for c in drop.competitors.all()
+        ],
+    }
+
+
+def project(data, my_name):
+    if data["status"] == "captured" and data["winner"] != my_name:
+        return {**data, "status": "missed"}
+    return data
+
+
+# --- Change log ---
+
+def record_drop_changes(drop_ids, kind="changed"):
+    """Append change events for writes that bypass model signals (bulk_update, update())."""
+    DropEvent.objects.bulk_create([DropEvent(drop_id=drop_id, kind=kind) for drop_id in drop_ids])
+    cache.delete(VERSION_CACHE_KEY)
+
+
+def record_reset():
+    # Too many changes to stream one by one; clients reload the whole list
+    DropEvent.objects.create(kind="reset")
+    cache.delete(VERSION_CACHE_KEY)
+
+
+def latest_version():
+    return DropEvent.objects.order_by("-id").values_list("id", flat=True).first() or 0
+
+
+def pruned_since(since):
+    """True if events after ``since`` have already been pruned."""
+    oldest = DropEvent.objects.order_by("id").values_list("id", flat=True).first()
+    return oldest is not None and since < oldest - 1
+
+
+def current_version():
+    """(version, last_modified) of the drop change log, cached until the next write.
+
+    Writes in this process drop the cached stamp at once. With a per-process
+    cache (the LocMem default) writes from other processes, such as
+    run_eppserver, show up after RECENT_DROPS_VERSION_TTL seconds.
+    """
+    stamp = cache.get(VERSION_CACHE_KEY)
+    if stamp is None:
+        stamp = DropEvent.objects.order_by("-id").values_list("id", "created_at").first() or (0, None)
+        cache.set(VERSION_CACHE_KEY, stamp, settings.RECENT_DROPS_VERSION_TTL)
+    return stamp
+
+
+def prune_drop_events(keep=None):
+    keep = keep or settings.DROP_EVENTS_RETAIN
+    cutoff = latest_version() - keep
+    if cutoff > 0:
+        DropEvent.objects.filter(id__lte=cutoff).delete()
+
+
+def load_changes(since, limit=500):
+    """Return (version, messages, complete) for events after ``since``.
+
+    Several events for one drop collapse into its latest state, loaded with
+    a fixed number of queries. ``complete`` is False when more remain.
+    """
+    events = list(DropEvent.objects.filter(id__gt=since).order_by("id")[:limit])
+    if not events:
+        return since, [], True
+    latest = {}
+    for event in events:
+        latest.pop(event.drop_id, None)
+        latest[event.drop_id] = event
+    drops = {
+        drop.pk: drop
+        for drop in Drop.objects.filter(pk__in=[k for k in latest if k is not None])
+        .select_related("domain")
+        .prefetch_related("competitors")
+    }
+    messages = []
+    for drop_id, event in latest.items():
+        if event.kind == "reset":
+            messages.append({"version": event.id, "kind": "reset"})
+        elif drop_id in drops:
+            messages.append({"version": event.id, "kind": "changed", "drop": serialize_drop(drops[drop_id])})
+        else:
+            messages.append({"version": event.id, "kind": "deleted", "id": drop_id})
+    return events[-1].id, messages, len(events) < limit
+
+
+def format_sse(message, my_name):
+    if "drop" in message:
+        message = {**message, "drop": project(message["drop"], my_name)}
+    return f"id: {message['version']}\nevent: {message['kind']}\ndata: {json.dumps(message)}\n\n"
+
+
+class DropEventBroadcaster:
+    """One change-log poller per process, shared by every open SSE stream.
+
+    Each poll costs a constant number of queries however many dashboards are
+    connected; subscribers receive the already-serialised batch.
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+        self._task = None
+        self._version = None
+
+    async def subscribe(self):
+        queue = asyncio.Queue(maxsize=100)
+        self._subscribers.add(queue)
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._poll())
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    async def _poll(self):
+        if self._version is None:
+            self._version = await sync_to_async(latest_version)()
+        while self._subscribers:
+            try:
+                version, messages, _ = await sync_to_async(load_changes)(self._version)
+            except Exception:
+                logger.exception("Polling drop events failed")
+                version, messages = self._version, []
+            self._version = version
+            if messages:
+                for queue in list(self._subscribers):
+                    try:
+                        queue.put_nowait(messages)
+                    except asyncio.QueueFull:
+                        # Too slow to keep up; make it reload instead
+                        self.unsubscribe(queue)
+                        while not queue.empty():
+                            queue.get_nowait()
+                        queue.put_nowait(None)
+            await asyncio.sleep(settings.DROP_EVENTS_POLL_SECONDS)
+
+
+broadcaster = DropEventBroadcaster()
+
+
+async def drop_event_stream(since, my_name):
+    """Yield SSE messages for drop changes after ``since`` (None: from now on)."""
+    queue = await broadcaster.subscribe()
+    try:
+        if since is None:
+            version = await sync_to_async(latest_version)()
+        else:
+            version, messages, complete = await sync_to_async(load_changes)(since)
+            # Further behind than the retained log (or the batch): reload the list
+            if not complete or await sync_to_async(pruned_since)(since):
+                version = await sync_to_async(latest_version)()
+                messages = [{"version": version, "kind": "reset"}]
+            for message in messages:
+                yield format_sse(message, my_name)
+        yield ": connected\n\n"
+        while True:
+            try:
+                batch = await asyncio.wait_for(queue.get(), settings.DROP_EVENTS_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if batch is None:
+                yield format_sse({"version": version, "kind": "reset"}, my_name)
+                return
+            for message in batch:
+                if message["version"] > version:
+                    version = message["version"]
+                    yield format_sse(message, my_name)
+    finally:
+        broadcaster.unsubscribe(queue)
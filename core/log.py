@@ -0,0 +1,63 @@
+import atexit
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+
+# Imported by settings.LOGGING before the apps are loaded: no models here.
+
+
+class AsyncFileHandler(logging.handlers.QueueHandler):
+    """A FileHandler whose writes happen on a background thread.
+
+    Callers only put the record on a bounded queue; when it is full (the disk
+    cannot keep up) records are dropped rather than blocking the request.
+    """
+
+    def __init__(self, filename, mode='a', encoding=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.target = logging.FileHandler(filename, mode, encoding, delay=True)
+        self.listener = None
+        self._start()
+        atexit.register(self.close)
+        # The listener thread does not survive fork (run_eppserver --workers)
+        os.register_at_fork(after_in_child=self._restart_in_child)
+
+    def _start(self):
+        self.listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+
+    def _restart_in_child(self):
+        # Records still queued belong to the parent, which writes them itself
+        self.queue = queue.Queue(self.maxsize)
+        self._start()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self.listener is not None:
+            listener, self.listener = self.listener, None
+            listener.stop()
+            self.target.close()
+        super().close()
+
+
+class SampleFilter(logging.Filter):
+    """Pass one INFO/DEBUG record in every ``1 / rate``; warnings always pass."""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self._count = itertools.count()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        return bool(self.every) and next(self._count) % self.every == 0
@@ -0,0 +1,123 @@
+from django.core.management.base import BaseCommand
+import json
+import time
+import xml.etree.ElementTree as ET
+
+from core.epp.parser import DOMAIN_NAME, parse_command
+from core.epp.protocol import epp_check_response, epp_create_response, frame_parts
+
+CHECK = '''<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<epp xmlns="urn:ietf:params:xml:ns:epp-1.0">
+  <command>
+    <check>
+      <domain:check xmlns:domain="urn:ietf:params:xml:ns:domain-1.0">
+{names}
+      </domain:check>
+    </check>
+    <clTRID>ABC-12345</clTRID>
+  </command>
+</epp>'''
+
+CREATE = '''<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<epp xmlns="urn:ietf:params:xml:ns:epp-1.0">
+  <command>
+    <create>
+      <domain:create xmlns:domain="urn:ietf:params:xml:ns:domain-1.0">
+        <domain:name>example.co.uk</domain:name>
+        <domain:period unit="y">1</domain:period>
+      </domain:create>
+    </create>
+    <clTRID>ABC-12346</clTRID>
+  </command>
+</epp>'''
+
+
+def legacy_codec(data):
+    # The original path: full tree, sequential wildcard searches, str formatting
+    root = ET.fromstring(data)
+    if root.find('.//{*}check') is not None:
+        names = [el.text.strip() for el in root.iterfind('.//{*}name') if el.text and el.text.strip()]
+        cds = ''.join(f'''
+        <domain:cd>
+          <domain:name avail="1">{name}</domain:name>
+        </domain:cd>''' for name in names)
+        xml = f'''<?xml version="1.0" encoding="UTF-8"?>
+<epp xmlns="urn:ietf:params:xml:ns:epp-1.0">
+  <response>
+    <result code="1000">
+      <msg>Command completed successfully</msg>
+    </result>
+    <resData>
+      <domain:chkData xmlns:domain="urn:ietf:params:xml:ns:domain-1.0">{cds}
+      </domain:chkData>
+    </resData>
+  </response>
+</epp>'''
+    elif root.find('.//{*}create') is not None:
+        name = root.find('.//{*}name').text.strip()
+        xml = f'''<?xml version="1.0" encoding="UTF-8"?>
+<epp xmlns="urn:ietf:params:xml:ns:epp-1.0">
+  <response>
+    <result code="1000">
+      <msg>Command completed successfully</msg>
+    </result>
+    <resData>
+      <domain:creData xmlns:domain="urn:ietf:params:xml:ns:domain-1.0">
+        <domain:name>{name}</domain:name>
+      </domain:creData>
+    </resData>
+  </response>
+</epp>'''
+    data = xml.encode('utf-8')
+    return (len(data) + 4).to_bytes(4, 'big') + data
+
+
+def current_codec(data):
+    command = parse_command(data)
+    if command.command == 'check':
+        response = epp_check_response([(name, True) for name in command.getall(DOMAIN_NAME)])
+    elif command.command == 'create':
+        response = epp_create_response(command.get(DOMAIN_NAME), success=True)
+    return frame_parts([response])
+
+
+class Command(BaseCommand):
+    help = (
+        'Microbenchmark the EPP codec on one core: parse a command frame and build its '
+        'framed response, with the original ElementTree/str-format path ("before") and the '
+        'current parser/byte templates ("after"). No database access. Prints JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=2.0, help='Time per case and codec.')
+
+    def handle(self, *args, **options):
+        cases = {
+            'check_1': CHECK.format(names='        <domain:name>example.co.uk</domain:name>').encode(),
+            'check_20': CHECK.format(names='\n'.join(
+                f'        <domain:name>example{i}.co.uk</domain:name>' for i in range(20)
+            )).encode(),
+            'create': CREATE.encode(),
+        }
+        report = {}
+        for case, data in cases.items():
+            before = self.commands_per_second(legacy_codec, data, options['seconds'])
+            after = self.commands_per_second(current_codec, data, options['seconds'])
+            report[case] = {
+                'before_per_sec': round(before),
+                'after_per_sec': round(after),
+                'speedup': round(after / before, 2),
+            }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def commands_per_second(self, codec, data, seconds):
+        codec(data)
+        count, started = 0, time.perf_counter()
+        deadline = started + seconds
+        while True:
+            for _ in range(200):
+                codec(data)
+            count += 200
+            now = time.perf_counter()
+            if now >= deadline:
+                return count / (now - started)
@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+import json
+import random
+import statistics
+import time
+
+from core.models import Domain, Drop
+from core.seeding import seed_drops
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the hot EPP check and settlement queries against the configured database '
+        '(SQLite by default, Postgres via DJANGO_DB_ENGINE). Prints JSON with per-query '
+        'latency percentiles and the query plan.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--domains', type=int, default=1_000_000, help='Domain rows the benchmark expects.')
+        parser.add_argument('--seed', action='store_true', help='Bulk-create missing domains/drops first (writes to the database!).')
+        parser.add_argument('--iterations', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        existing = Domain.objects.count()
+        if existing < options['domains']:
+            if not options['seed']:
+                raise CommandError(f"Only {existing} domains; rerun with --seed to create {options['domains'] - existing} more.")
+            self.stderr.write(f"Seeding {options['domains'] - existing} domains...")
+            # Spread drops around now so the settlement range scan has realistic bounds
+            seed_drops(
+                options['domains'] - existing, prefix='bench',
+                base_time=timezone.now() - timezone.timedelta(days=7),
+                spacing=timezone.timedelta(seconds=1), batch_size=5000,
+            )
+        sample = list(Domain.objects.order_by('?').values_list('name', 'tld')[:200])
+        if not sample:
+            raise CommandError("No domains to benchmark.")
+        now = timezone.now()
+
+        def check():
+            name, tld = random.choice(sample)
+            return Domain.objects.filter(name=name, tld=tld).exists()
+
+        def create_drop_lookup():
+            name, tld = random.choice(sample)
+            return Drop.objects.filter(domain__name=name, domain__tld=tld).order_by('-drop_time').first()
+
+        queries = {
+            'check': check,
+            'check_batch_20': lambda: list(
+                Domain.objects.filter(name__in=[n for n, _ in random.sample(sample, 20)]).values_list('name', 'tld')
+            ),
+            'create_drop_lookup': create_drop_lookup,
+            'settlement_due': lambda: list(
+                Drop.objects.filter(status='pending', drop_time__lte=now).values_list('id', flat=True)[:500]
+            ),
+            'recent_drops': lambda: list(Drop.objects.order_by('drop_time').values_list('id', flat=True)[:20]),
+            'last_drop': lambda: Drop.objects.order_by('-drop_time').values_list('drop_time', flat=True).first(),
+        }
+        plans = {
+            'check': Domain.objects.filter(name='x', tld='com').explain(),
+            'settlement_due': Drop.objects.filter(status='pending', drop_time__lte=now)[:500].explain(),
+            'recent_drops': Drop.objects.order_by('drop_time')[:20].explain(),
+        }
+        report = {
+            'vendor': connection.vendor,
+            'domains': Domain.objects.count(),
+            'drops': Drop.objects.count(),
+            'iterations': options['iterations'],
+            'queries': {},
+            'plans': plans,
+        }
+        for name, run in queries.items():
+            run()  # warm the page cache
+            timings = []
+            for _ in range(options['iterations']):
+                started = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - started) * 1000.0)
+            timings.sort()
+            report['queries'][name] = {
+                'p50_ms': round(statistics.median(timings), 4),
+                'p99_ms': round(timings[int(len(timings) * 0.99) - 1], 4),
+                'max_ms': round(timings[-1], 4),
+            }
+        self.stdout.write(json.dumps(report, indent=2))
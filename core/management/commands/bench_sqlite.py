@@ -0,0 +1,129 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+from django.utils import timezone
+import json
+import os
+import tempfile
+import threading
+import time
+
+from core.models import Domain, Drop
+
+
+class Command(BaseCommand):
+    help = (
+        'Concurrency stress test for SQLite: runs EPP-create writers, settlement '
+        'transactions and dashboard readers against a scratch database with the stock '
+        'settings and with the DJANGO_SQLITE_PROFILE=concurrent options, and prints both as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--settlers', type=int, default=2)
+        parser.add_argument('--readers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        report = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for profile, db_options in (('stock', {}), ('concurrent', settings.SQLITE_CONCURRENT_OPTIONS)):
+                alias = f'bench_{profile}'
+                connections.settings[alias] = {
+                    **connections.settings['default'],
+                    'ENGINE': 'django.db.backends.sqlite3',
+                    'NAME': os.path.join(tmp, f'{profile}.sqlite3'),
+                    'OPTIONS': db_options,
+                    'CONN_MAX_AGE': None,
+                }
+                call_command('migrate', database=alias, verbosity=0)
+                report[profile] = self.run_profile(alias, options)
+                connections[alias].close()
+        stock, tuned = report['stock'], report['concurrent']
+        report['speedup'] = {
+            kind: round(tuned[kind]['ops_per_sec'] / stock[kind]['ops_per_sec'], 2) if stock[kind]['ops_per_sec'] else None
+            for kind in ('create', 'settle', 'read')
+        }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run_profile(self, alias, options):
+        domain_table, drop_table = Domain._meta.db_table, Drop._meta.db_table
+        deadline = time.monotonic() + options['seconds']
+        lock = threading.Lock()
+        results = {kind: {'ops': 0, 'locked': 0, 'latencies': []} for kind in ('create', 'settle', 'read')}
+        counter = iter(range(10 ** 9))
+
+        def create(cursor):
+            # What the EPP fallback <create> writes: a domain and its next drop
+            name = f'stress{next(counter)}'
+            now = timezone.now()
+            cursor.execute(f'INSERT INTO {domain_table} (name, tld, created_at) VALUES (%s, %s, %s)', [name, 'com', now])
+            cursor.execute(
+                f'INSERT INTO {drop_table} (domain_id, drop_time, clear_after_minutes, created_at, status) '
+                f'VALUES (%s, %s, 5, %s, %s)',
+                [cursor.lastrowid, now, now, 'pending'],
+            )
+
+        def settle(cursor):
+            # Read-then-write, like settle_due_drops()
+            cursor.execute(
+                f'SELECT id FROM {drop_table} WHERE status = %s AND drop_time <= %s LIMIT 50',
+                ['pending', timezone.now()],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            if ids:
+                cursor.execute(
+                    f"UPDATE {drop_table} SET status = 'missed' WHERE id IN ({', '.join(['%s'] * len(ids))})", ids
+                )
+
+        def read(cursor):
+            cursor.execute(
+                f'SELECT d.id, m.name FROM {drop_table} d JOIN {domain_table} m ON m.id = d.domain_id '
+                f'ORDER BY d.drop_time DESC LIMIT 20'
+            )
+            cursor.fetchall()
+
+        def worker(kind, operation, atomic):
+            local = {'ops': 0, 'locked': 0, 'latencies': []}
+            connection = connections[alias]
+            try:
+                while time.monotonic() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        if atomic:
+                            with transaction.atomic(using=alias), connection.cursor() as cursor:
+                                operation(cursor)
+                        else:
+                            with connection.cursor() as cursor:
+                                operation(cursor)
+                    except OperationalError:
+                        local['locked'] += 1
+                        continue
+                    local['ops'] += 1
+                    local['latencies'].append((time.perf_counter() - started) * 1000.0)
+            finally:
+                connection.close()
+            with lock:
+                for key in ('ops', 'locked'):
+                    results[kind][key] += local[key]
+                results[kind]['latencies'] += local['latencies']
+
+        threads = (
+            [threading.Thread(target=worker, args=('create', create, True)) for _ in range(options['writers'])]
+            + [threading.Thread(target=worker, args=('settle', settle, True)) for _ in range(options['settlers'])]
+            + [threading.Thread(target=worker, args=('read', read, False)) for _ in range(options['readers'])]
+        )
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        summary = {}
+        for kind, result in results.items():
+            latencies = sorted(result.pop('latencies'))
+            summary[kind] = {
+                'ops_per_sec': round(result['ops'] / options['seconds'], 1),
+                'locked_errors': result['locked'],
+                'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1], 2) if latencies else None,
+            }
+        return summary
@@ -0,0 +1,285 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+import asyncio
+import json
+import random
+import re
+import secrets
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from core.clock import clock
+from core.models import Competitor, Domain, Drop, Registrar
+
+EPP = '<?xml version="1.0" encoding="UTF-8"?><epp xmlns="urn:ietf:params:xml:ns:epp-1.0">{}</epp>'
+DOMAIN = 'xmlns:domain="urn:ietf:params:xml:ns:domain-1.0"'
+RESULT_CODE = re.compile(rb'<result code="(\d+)"')
+
+# Seconds a session may wait for its <login> answer before it counts as an error
+LOGIN_TIMEOUT = 60
+
+
+def frame(xml):
+    # EPP over TCP (RFC 5734): 4-byte big-endian total length, header included
+    data = xml.encode()
+    return (len(data) + 4).to_bytes(4, 'big') + data
+
+
+def login_frame(client_id, password):
+    return frame(EPP.format(f'<command><login><clID>{client_id}</clID><pw>{password}</pw></login></command>'))
+
+
+def check_frame(names):
+    items = ''.join(f'<domain:name>{name}</domain:name>' for name in names)
+    return frame(EPP.format(f'<command><check><domain:check {DOMAIN}>{items}</domain:check></check></command>'))
+
+
+def create_frame(name):
+    return frame(EPP.format(
+        f'<command><create><domain:create {DOMAIN}><domain:name>{name}</domain:name></domain:create></create></command>'
+    ))
+
+
+HELLO = frame(EPP.format('<hello/>'))
+LOGOUT = frame(EPP.format('<command><logout/></command>'))
+
+
+async def read_frame(reader):
+    header = await reader.readexactly(4)
+    return await reader.readexactly(int.from_bytes(header, 'big') - 4)
+
+
+def result_code(response):
+    match = RESULT_CODE.search(response)
+    return match.group(1).decode() if match else 'greeting'
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 3)
+
+
+class Command(BaseCommand):
+    help = (
+        'EPP load generator: opens N concurrent sessions, logs in and replays a check/create/hello '
+        'mix around a freshly scheduled Drop. Prints throughput and p50/p99/p999 latency as JSON. '
+        'With --spawn it starts run_eppserver itself against the configured (SQLite by default) '
+        'database. Client and server share no process, but a single client process can saturate '
+        'one core before a multi-worker server does.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=700)
+        parser.add_argument('--spawn', action='store_true', help='Start run_eppserver on a free local port for the run.')
+        parser.add_argument('--engine', choices=['thread', 'asyncio'], default='asyncio', help='Server engine with --spawn.')
+        parser.add_argument('--workers', type=int, default=1, help='Server worker processes with --spawn.')
+        parser.add_argument('--sessions', type=int, default=50, help='Concurrent EPP sessions.')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load.')
+        parser.add_argument(
+            '--mix', default='check=80,create=15,hello=5',
+            help='Relative weights of check, create and hello commands.',
+        )
+        parser.add_argument('--check-names', type=int, default=5, help='Domain names per <check>.')
+        parser.add_argument('--pipeline', type=int, default=1, help='Commands each session sends before reading responses.')
+        parser.add_argument(
+            '--drop-at', type=float, default=None,
+            help='Seconds into the run at which the seeded drop falls due. Default: half of --duration.',
+        )
+        parser.add_argument('--competitors', type=int, default=3, help='Simulated competitors on the seeded drop.')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded registrar, domain and drop.')
+        parser.add_argument('--max-p99-ms', type=float, default=None, help='Fail if overall p99 latency exceeds this.')
+        parser.add_argument('--min-throughput', type=float, default=None, help='Fail if commands/sec falls below this.')
+
+    def handle(self, *args, **options):
+        mix = self.parse_mix(options['mix'])
+        drop_at = options['duration'] / 2 if options['drop_at'] is None else options['drop_at']
+        client_id, password = f'load{secrets.token_hex(3)}', secrets.token_urlsafe(12)
+        registrar = Registrar(client_id=client_id)
+        registrar.set_password(password)
+        registrar.save()
+        server = domain = None
+        host, port = options['host'], options['port']
+        try:
+            if options['spawn']:
+                host, port = '127.0.0.1', self.free_port()
+                server = self.spawn_server(port, options)
+            domain = Domain.objects.create(name=f'loadgen{secrets.token_hex(4)}', tld='com')
+            drop = Drop.objects.create(domain=domain, drop_time=clock.now() + timezone.timedelta(days=1))
+            Competitor.objects.bulk_create([
+                Competitor(drop=drop, name=f'loadbot{i}', delay_ms=random.randint(50, 500))
+                for i in range(options['competitors'])
+            ])
+            # Sessions log in first; the drop is then rescheduled relative to the start of
+            # the load (in clock time: a faster virtual clock reaches it sooner)
+            reschedule = lambda: Drop.objects.filter(pk=drop.pk).update(
+                drop_time=clock.now() + timezone.timedelta(seconds=drop_at * clock.speed)
+            )
+            report = asyncio.run(self.run_load(host, port, client_id, password, str(domain), mix, options, reschedule))
+            report['drop'] = self.drop_outcome(drop, client_id)
+        finally:
+            if server is not None:
+                self.stop_server(server)
+            if not options['keep']:
+                if domain is not None:
+                    domain.delete()
+                registrar.delete()
+        self.stdout.write(json.dumps(report, indent=2))
+        overall = report['latency_ms']['all']
+        if options['max_p99_ms'] is not None and (overall['p99'] is None or overall['p99'] > options['max_p99_ms']):
+            raise CommandError(f"p99 {overall['p99']} ms exceeds {options['max_p99_ms']} ms")
+        if options['min_throughput'] is not None and report['throughput_per_sec'] < options['min_throughput']:
+            raise CommandError(f"Throughput {report['throughput_per_sec']}/s below {options['min_throughput']}/s")
+
+    def parse_mix(self, mix):
+        weights = {}
+        for part in mix.split(','):
+            kind, _, weight = part.partition('=')
+            if kind.strip() not in ('check', 'create', 'hello') or not weight.strip().isdigit():
+                raise CommandError(f"Bad --mix entry {part!r}; expected e.g. check=80,create=15,hello=5")
+            weights[kind.strip()] = int(weight)
+        if not sum(weights.values()):
+            raise CommandError('--mix weights are all zero')
+        return weights
+
+    def free_port(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    def spawn_server(self, port, options):
+        command = [
+            sys.executable, str(settings.BASE_DIR / 'manage.py'), 'run_eppserver',
+            '--host', '127.0.0.1', '--port', str(port),
+            '--engine', options['engine'], '--workers', str(options['workers']),
+        ]
+        server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'run_eppserver exited with status {server.returncode}')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return server
+            except OSError:
+                time.sleep(0.1)
+        self.stop_server(server)
+        raise CommandError('run_eppserver did not start listening within 30s')
+
+    def stop_server(self, server):
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+    async def run_load(self, host, port, client_id, password, drop_domain, mix, options, on_ready):
+        kinds, weights = list(mix), list(mix.values())
+        latencies = {kind: [] for kind in kinds}
+        codes = {}
+        errors = []
+        logged_in = 0
+        ready = asyncio.Event()
+        deadline = None
+
+        def next_frame():
+            kind = random.choices(kinds, weights)[0]
+            if kind == 'check':
+                # The contested name plus some that are almost certainly free
+                names = [drop_domain] + [f'free{secrets.token_hex(5)}.com' for _ in range(options['check_names'] - 1)]
+                return kind, check_frame(names)
+            if kind == 'create':
+                return kind, create_frame(drop_domain)
+            return kind, HELLO
+
+        async def session():
+            nonlocal logged_in
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+            except OSError as e:
+                errors.append(f'connect: {e}')
+                return
+            try:
+                await read_frame(reader)
+                # A server that was already running sees the new registrar at its
+                # next credentials refresh; until then logins get 2200
+                retry_until = time.monotonic() + settings.EPP_CREDENTIALS_REFRESH_SECONDS + 1
+                while True:
+                    writer.write(login_frame(client_id, password))
+                    code = result_code(await asyncio.wait_for(read_frame(reader), LOGIN_TIMEOUT))
+                    if code != '2200' or time.monotonic() > retry_until:
+                        break
+                    await asyncio.sleep(0.5)
+                if code != '1000':
+                    errors.append(f'login: {code}')
+                    return
+                logged_in += 1
+                await ready.wait()
+                while time.perf_counter() < deadline:
+                    batch = [next_frame() for _ in range(options['pipeline'])]
+                    sent = time.perf_counter()
+                    writer.write(b''.join(data for _, data in batch))
+                    for kind, _ in batch:
+                        response = await read_frame(reader)
+                        latencies[kind].append((time.perf_counter() - sent) * 1000.0)
+                        code = result_code(response)
+                        codes[code] = codes.get(code, 0) + 1
+                writer.write(LOGOUT)
+                await read_frame(reader)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                errors.append(f'{type(e).__name__}: {e}')
+            finally:
+                writer.close()
+
+        async def start():
+            nonlocal deadline
+            # Login cost (a password hash per session) is not part of the measurement
+            while logged_in + len(errors) < options['sessions']:
+                await asyncio.sleep(0.01)
+            await asyncio.to_thread(on_ready)
+            deadline = time.perf_counter() + options['duration']
+            ready.set()
+            return time.perf_counter()
+
+        started, *_ = await asyncio.gather(start(), *(session() for _ in range(options['sessions'])))
+        elapsed = time.perf_counter() - started
+        report_latency = {}
+        for kind, values in [*latencies.items(), ('all', [v for values in latencies.values() for v in values])]:
+            values.sort()
+            report_latency[kind] = {
+                'count': len(values),
+                'p50': percentile(values, 0.50),
+                'p99': percentile(values, 0.99),
+                'p999': percentile(values, 0.999),
+                'max': round(values[-1], 3) if values else None,
+            }
+        completed = report_latency['all']['count']
+        return {
+            'sessions': options['sessions'],
+            'logged_in': logged_in,
+            'pipeline': options['pipeline'],
+            'mix': mix,
+            'duration_s': round(elapsed, 3),
+            'commands': completed,
+            'throughput_per_sec': round(completed / elapsed, 1),
+            'latency_ms': report_latency,
+            'result_codes': codes,
+            'errors': errors[:20],
+            'error_count': len(errors),
+        }
+
+    def drop_outcome(self, drop, client_id):
+        # Give the race scheduler and settlement a moment to record the result
+        deadline = time.monotonic() + 5
+        while True:
+            drop.refresh_from_db()
+            if drop.status != 'pending' or time.monotonic() > deadline or drop.drop_time > clock.now():
+                break
+            time.sleep(0.2)
+        return {'status': drop.status, 'winner': drop.winner, 'won_by_loadgen': drop.winner == client_id}
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+import os
+import signal
+import time
+
+from core.epp.profiling import MODES, write_control
+
+
+class Command(BaseCommand):
+    help = (
+        'Start or stop the sampling profiler of a running run_eppserver (the supervisor pid with --workers). '
+        f'Output goes to EPP_PROFILE_DIR ({settings.EPP_PROFILE_DIR}) when profiling stops.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['start', 'stop'])
+        parser.add_argument('pid', type=int, help='Process id of run_eppserver.')
+        parser.add_argument('--mode', choices=MODES, default=settings.EPP_PROFILE_MODE,
+                            help='cprofile: .pstats file. stacks: .collapsed file for flame graphs.')
+        parser.add_argument('--rate', type=float, default=settings.EPP_PROFILE_RATE,
+                            help='Share of EPP commands to sample (0-1).')
+        parser.add_argument('--interval', type=float, default=0.005, help='Seconds between stack samples (stacks mode).')
+        parser.add_argument('--duration', type=float, default=None,
+                            help='With start: profile for this many seconds, then stop.')
+
+    def handle(self, *args, **options):
+        if not 0 < options['rate'] <= 1:
+            raise CommandError('--rate must be in (0, 1]')
+        if options['action'] == 'stop':
+            self.signal(options['pid'], action='stop')
+            return
+        self.signal(options['pid'], action='start', mode=options['mode'], rate=options['rate'], interval=options['interval'])
+        if options['duration']:
+            time.sleep(options['duration'])
+            # The server has read the start request by now
+            self.signal(options['pid'], action='stop')
+
+    def signal(self, pid, **request):
+        write_control(**request)
+        try:
+            os.kill(pid, signal.SIGUSR1)
+        except ProcessLookupError:
+            raise CommandError(f'No process {pid}')
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {request['action']} to {pid}; see the server log for the output file."
+        ))
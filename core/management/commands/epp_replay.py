@@ -0,0 +1,241 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+import asyncio
+import datetime
+import heapq
+import json
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+
+from core.epp.parser import parse_command
+from core.epp.recording import CLOSE, FRAME, OPEN, RESPONSE, read_log
+from core.feed import record_drop_changes
+from core.management.commands.epp_loadgen import percentile, read_frame, result_code
+from core.models import Drop
+
+# Seconds to wait for outstanding responses after a session's last frame
+DRAIN_TIMEOUT = 30
+
+
+class RecordedSession:
+    __slots__ = ('opened', 'closed', 'frames', 'responses')
+
+    def __init__(self, opened):
+        self.opened = opened
+        self.closed = None
+        self.frames = []  # [(ts, payload, seq)]
+        self.responses = {}  # seq -> (ts, code)
+
+    def complete(self):
+        """False if the recorder dropped any of this session's frames or responses."""
+        seqs = [seq for _, _, seq in self.frames]
+        return seqs == list(range(1, len(seqs) + 1)) and self.responses.keys() == set(seqs)
+
+
+def command_name(payload):
+    try:
+        return parse_command(payload).command or 'none'
+    except ET.ParseError:
+        return 'malformed'
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay logs written by run_eppserver --record against an EPP server: every recorded session '
+        'reconnects and resends its frames at their original offsets (or --speed times faster), '
+        'then latency and result codes are compared with the recording, as JSON. The target database '
+        'needs the recorded registrars; --retime-drops reschedules the recorded drops to match.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('logs', nargs='+', help='Recording files (one per worker with --workers).')
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=700)
+        parser.add_argument('--speed', type=float, default=1.0, help='Time scale: 2 replays twice as fast.')
+        parser.add_argument(
+            '--retime-drops', action='store_true',
+            help='Before replaying, move drops that fell due during the recording to the same (scaled) '
+                 'offset from the replay start and mark them pending again. Only for a copy of the '
+                 'recorded database.',
+        )
+
+    def handle(self, *args, **options):
+        if options['speed'] <= 0:
+            raise CommandError('--speed must be positive')
+        sessions, wall_offset = self.load(options['logs'])
+        if not sessions:
+            raise CommandError('No sessions in the recording')
+        first = min(s.opened for s in sessions.values())
+        last = max(s.closed or (s.frames[-1][0] if s.frames else s.opened) for s in sessions.values())
+        # Sessions connect a moment after now, leaving time for the drop update
+        start = time.time() + 0.5
+        if options['retime_drops']:
+            self.retime_drops(first + wall_offset, last + wall_offset, start, options['speed'])
+        report = asyncio.run(self.replay(sessions, first, start, options))
+        report['recorded_seconds'] = round((last - first) / 1e9, 3)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def load(self, paths):
+        sessions = {}
+        wall_offset = None
+        streams = []
+        for index, path in enumerate(paths):
+            try:
+                offset, records = read_log(path)
+            except (OSError, ValueError) as e:
+                raise CommandError(str(e))
+            wall_offset = offset if wall_offset is None else wall_offset
+            # Session ids are unique per file; key by file as well
+            streams.append(((r.ts, index, r) for r in records))
+        for _, index, record in heapq.merge(*streams, key=lambda item: item[:2]):
+            key = (index, record.session)
+            session = sessions.get(key)
+            if session is None:
+                # A session already open when recording started begins at its first record
+                session = sessions[key] = RecordedSession(record.ts)
+            if record.kind == FRAME:
+                session.frames.append((record.ts, record.payload, record.seq))
+            elif record.kind == RESPONSE:
+                # Paired with its frame by number: a dropped record must not shift the rest
+                if record.seq:
+                    session.responses[record.seq] = (record.ts, record.payload.decode())
+            elif record.kind == CLOSE:
+                session.closed = record.ts
+            elif record.kind != OPEN:
+                raise CommandError(f'Unknown record kind {record.kind}')
+        return sessions, wall_offset
+
+    def retime_drops(self, recorded_from, recorded_to, start, speed):
+        # Wall-clock ns of the recording -> the same offset into the replay
+        def moved(drop_time):
+            offset = (drop_time.timestamp() * 1e9 - recorded_from) / speed / 1e9
+            return datetime.datetime.fromtimestamp(start + offset, tz=datetime.timezone.utc)
+
+        window = [datetime.datetime.fromtimestamp(ns / 1e9, tz=datetime.timezone.utc) for ns in (recorded_from, recorded_to)]
+        drops = list(Drop.objects.filter(drop_time__range=window))
+        for drop in drops:
+            drop.drop_time, drop.status, drop.winner = moved(drop.drop_time), 'pending', None
+        with transaction.atomic():
+            Drop.objects.bulk_update(drops, ['drop_time', 'status', 'winner'])
+            record_drop_changes([drop.pk for drop in drops])
+        self.stderr.write(f'Retimed {len(drops)} drops to the replay clock.')
+
+    async def replay(self, sessions, first, start, options):
+        loop = asyncio.get_running_loop()
+        speed = options['speed']
+        # Loop time at which recorded monotonic ns ``ts`` is due
+        base = loop.time() + (start - time.time())
+
+        def due(ts):
+            return base + (ts - first) / 1e9 / speed
+
+        results = []  # [(command, recorded latency ms, recorded code, replay latency ms, replay code)]
+        incomplete = 0
+        errors = []
+        lags = []
+
+        async def run(session):
+            nonlocal incomplete
+            await asyncio.sleep(max(0, due(session.opened) - loop.time()))
+            if not session.complete():
+                incomplete += 1
+            recorded = []
+            for frame_ts, payload, seq in session.frames:
+                # A frame whose response was not recorded is replayed but not compared
+                response_ts, code = session.responses.get(seq, (frame_ts, None))
+                latency = (response_ts - frame_ts) / 1e6 if code is not None else None
+                recorded.append((command_name(payload), latency, code))
+            replayed = [None] * len(session.frames)
+            try:
+                reader, writer = await asyncio.open_connection(options['host'], options['port'])
+            except OSError as e:
+                errors.append(f'connect: {e}')
+                return
+            sent = deque()
+
+            async def receive():
+                # Responses come back in frame order; the server closes after <logout>
+                try:
+                    for _ in session.frames:
+                        response = await read_frame(reader)
+                        index, at = sent.popleft()
+                        replayed[index] = ((time.perf_counter() - at) * 1000.0, result_code(response))
+                except (OSError, asyncio.IncompleteReadError):
+                    pass
+
+            try:
+                await read_frame(reader)
+                receiver = asyncio.create_task(receive())
+                for index, (ts, payload, _) in enumerate(session.frames):
+                    delay = due(ts) - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    if receiver.done():
+                        break
+                    lags.append(max(0.0, -delay) * 1000.0)
+                    sent.append((index, time.perf_counter()))
+                    writer.write((len(payload) + 4).to_bytes(4, 'big') + payload)
+                try:
+                    await asyncio.wait_for(receiver, DRAIN_TIMEOUT)
+                except asyncio.TimeoutError:
+                    errors.append('timeout waiting for responses')
+            except (OSError, asyncio.IncompleteReadError) as e:
+                errors.append(f'{type(e).__name__}: {e}')
+            finally:
+                writer.close()
+            for index, (command, latency, code) in enumerate(recorded):
+                replay = replayed[index] or (None, 'none')
+                results.append((command, latency, code, *replay))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run(session) for session in sessions.values()))
+        elapsed = time.perf_counter() - started
+        return self.report(results, errors, lags, len(sessions), incomplete, speed, elapsed)
+
+    def report(self, results, errors, lags, sessions, incomplete, speed, elapsed):
+        def latency(values):
+            values = sorted(v for v in values if v is not None)
+            return {
+                'count': len(values),
+                'p50': percentile(values, 0.50),
+                'p99': percentile(values, 0.99),
+                'max': round(values[-1], 3) if values else None,
+            }
+
+        by_command = {}
+        changed = {}
+        unrecorded = 0
+        for command, recorded_ms, recorded_code, replay_ms, replay_code in results:
+            entry = by_command.setdefault(command, ([], []))
+            entry[0].append(recorded_ms)
+            entry[1].append(replay_ms)
+            if recorded_code is None:
+                unrecorded += 1
+            elif recorded_code != replay_code:
+                key = f'{recorded_code}->{replay_code}'
+                changed[key] = changed.get(key, 0) + 1
+        lags.sort()
+        return {
+            'sessions': sessions,
+            # Sessions with records the recorder dropped under load
+            'incomplete_sessions': incomplete,
+            'speed': speed,
+            'replay_seconds': round(elapsed, 3),
+            'commands': len(results),
+            # Recorded latency is server-side (frame read to response ready);
+            # replay latency is client-side round trip
+            'latency_ms': {
+                command: {'recorded': latency(recorded), 'replay': latency(replay)}
+                for command, (recorded, replay) in sorted(by_command.items())
+            },
+            'outcomes': {
+                'same': len(results) - unrecorded - sum(changed.values()),
+                'changed': dict(sorted(changed.items(), key=lambda item: -item[1])),
+                'unrecorded': unrecorded,
+            },
+            # How far behind schedule frames were sent; large values mean the replay client lagged
+            'send_lag_ms': {'p50': percentile(lags, 0.50), 'p99': percentile(lags, 0.99), 'max': percentile(lags, 1.0)},
+            'errors': errors[:20],
+            'error_count': len(errors),
+        }
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.credentials import generate_token
+from core.models import ApiToken, Registrar
+
+
+class Command(BaseCommand):
+    help = 'Issue an API token for the capture endpoints. The token is printed once; only its digest is stored.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('client_id', help='Registrar that owns the token.')
+
+    def handle(self, *args, **options):
+        registrar = Registrar.objects.filter(client_id=options['client_id']).first()
+        if registrar is None:
+            raise CommandError(f"No registrar {options['client_id']}; create it with set_registrar first.")
+        token, prefix, digest = generate_token()
+        ApiToken.objects.create(registrar=registrar, prefix=prefix, digest=digest)
+        self.stdout.write(token)
@@ -1,133 +1,230 @@
-from django.core.management.base import BaseCommand
-from django.utils import timezone
-from core.models import Domain, Drop
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+import asyncio
+import logging
+import os
+import socket
 import socketserver
 import threading
-import xml.etree.ElementTree as ET
-
-EPP_GREETING = '''<?xml version="1.0" encoding="UTF-8"?>
-<epp xmlns="urn:ietf:params:xml:ns:epp-1.0">
-  <greeting>
-    <svID>Mock Nominet EPP</svID>
-    <svDate>{now}</svDate>
-    <svcMenu>
-      <version>1.0</version>
-      <lang>en</lang>
-      <objURI>urn:ietf:params:xml:ns:domain-1.0</objURI>
-    </svcMenu>
-  </greeting>
-</epp>'''
-
-EPP_RESPONSE_SUCCESS = '''<?xml version="1.0" encoding="UTF-8"?>
-<epp xmlns="urn:ietf:params:xml:ns:epp-1.0">
-  <response>
-    <result code="1000">
-      <msg>Command completed successfully</msg>
-    </result>
-  </response>
-</epp>'''
+import time
+
+from core.availability import index
+from core.epp import metrics
+from core.epp.commands import dispatch_batch, resolve
+from core.epp.db import DatabasePool
+from core.epp.profiling import install_signal_handler
+from core.epp.recording import Recorder
+from core.epp.protocol import FrameBuffer, FrameError, greeting, send_frames
+from core.epp.session import Session
+from core.clock import SimClock, clock
+from core.settlement import SettlementWorker
+
+logger = logging.getLogger('core.epp')
 
 class EPPHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        metrics.session_opened()
+        self.recorder = self.server.recorder
+        if self.recorder is not None:
+            self.record_id = self.recorder.open_session()
+
     def handle(self):
-        from core.models import Domain, Drop, Competitor
-        import time
-        greeting = EPP_GREETING.format(now=timezone.now().isoformat())
-        self.send_epp(greeting)
+        self.frames = FrameBuffer()
+        self.session = Session()
+        # An idle session times out in recv() and is closed below
+        self.request.settimeout(settings.EPP_IDLE_TIMEOUT or None)
+        self.send_epp(greeting())
         while True:
             try:
-                data = self.receive_epp()
-                if not data:
+                frames = self.receive_epp()
+                if not frames:
                     break
-                root = ET.fromstring(data)
-                # Handle <check> command
-                if root.find('.//{*}check') is not None:
-                    domain_name = self._extract_domain_name(root)
-                    if domain_name:
-                        exists = Domain.objects.filter(name=domain_name.split('.')[0], tld=domain_name.split('.')[-1]).exists()
-                        if exists:
-                            response = self._epp_check_response(domain_name, avail=False)
-                        else:
-                            response = self._epp_check_response(domain_name, avail=True)
-                        self.send_epp(response)
-                    else:
-                        self.send_epp(EPP_RESPONSE_SUCCESS)
-                # Handle <create> command
-                elif root.find('.//{*}create') is not None:
-                    domain_name = self._extract_domain_name(root)
-                    if domain_name:
-                        name, tld = domain_name.split('.')
-                        # Find the drop for this domain
-                        try:
-                            domain_obj = Domain.objects.get(name=name, tld=tld)
-                            drop = Drop.objects.filter(domain=domain_obj).order_by('-drop_time').first()
-                        except Domain.DoesNotExist:
-                            drop = None
-                        # If drop exists and is due, simulate all competitors
-                        if drop and drop.drop_time <= timezone.now():
-                            competitors = list(drop.competitors.all())
-                            # Add the real request as a competitor with delay 0
-                            competitors.append(type('RealCompetitor', (), {'name': 'You', 'delay_ms': 0, 'is_real': True})())
-                            # Sort by delay
-                            competitors.sort(key=lambda c: c.delay_ms)
-                            winner = None
-                            for comp in competitors:
-                                time.sleep(comp.delay_ms / 1000.0)
-                                # Check if domain is still available
-                                exists = Domain.objects.filter(name=name, tld=tld).exists()
-                                if not exists:
-                                    Domain.objects.create(name=name, tld=tld)
-                                    Drop.objects.create(domain=Domain.objects.get(name=name, tld=tld), drop_time=timezone.now() + timezone.timedelta(days=1))
-                                    winner = comp
-                                    break
-                            if winner and getattr(winner, 'is_real', False):
-                                response = self._epp_create_response(domain_name, success=True)
-                            else:
-                                response = self._epp_create_response(domain_name, success=False)
-                            self.send_epp(response)
-                        else:
-                            # No drop or not due, fallback to normal create
-                            domain, created = Domain.objects.get_or_create(name=name, tld=tld)
-                            if created:
-                                Drop.objects.create(domain=domain, drop_time=timezone.now() + timezone.timedelta(days=1))
-                                response = self._epp_create_response(domain_name, success=True)
-                            else:
-                                response = self._epp_create_response(domain_name, success=False)
-                            self.send_epp(response)
-                    else:
-                        self.send_epp(EPP_RESPONSE_SUCCESS)
-                else:
-                    self.send_epp(EPP_RESPONSE_SUCCESS)
-            except Exception as e:
-                # Optionally log the error
+                if self.recorder is not None:
+                    self.recorder.frames(self.record_id, frames)
+                # ORM work runs on the shared pool; this thread never opens a connection
+                responses = resolve(self.server.db_pool.run(dispatch_batch, frames, self.session))
+                if self.recorder is not None:
+                    self.recorder.responses(self.record_id, responses)
+                self.send_epp(*responses)
+                if self.session.closing:
+                    break
+            except (TimeoutError, ConnectionError):
+                # Idle timeout or the client went away
+                break
+            except FrameError as e:
+                logger.warning("Closing EPP session: %s", e)
                 break
+            except Exception:
+                logger.exception("EPP session failed")
+                metrics.session_failed()
+                break
+
+    def finish(self):
+        if hasattr(self, 'session'):
+            self.session.close()
+        # Nothing should be open on a session thread, but never leak one per client
+        connections.close_all()
+        metrics.session_closed()
+        if self.recorder is not None:
+            self.recorder.close_session(self.record_id)
 
-    def send_epp(self, xml):
-        data = xml.encode('utf-8')
-        length = len(data) + 4
-        self.request.sendall(length.to_bytes(4, 'big') + data)
+    def send_epp(self, *responses):
+        # Pipelined responses go out together, header and payload buffers unjoined
+        started = time.perf_counter()
+        send_frames(self.request, responses)
+        metrics.sent(time.perf_counter() - started)
 
     def receive_epp(self):
-        # Read 4-byte length prefix
-        length_bytes = self.request.recv(4)
-        if not length_bytes or len(length_bytes) < 4:
-            return None
-        length = int.from_bytes(length_bytes, 'big')
-        data = b''
-        while len(data) < length - 4:
-            chunk = self.request.recv(length - 4 - len(data))
-            if not chunk:
-                break
-            data += chunk
-        return data.decode('utf-8')
+        # Read ahead straight into the session buffer: one recv may hold several
+        # pipelined frames or only part of one (even part of the length prefix)
+        while True:
+            nbytes = self.request.recv_into(self.frames.writable())
+            if not nbytes:
+                return None
+            frames = self.frames.advance(nbytes)
+            if frames:
+                return frames
+
+class EPPTCPServer(socketserver.ThreadingTCPServer):
+    """Thread per session. Keeps the open client sockets so a stop can end
+    idle sessions (blocked in recv() for up to EPP_IDLE_TIMEOUT) at once and
+    server_close() does not wait on them."""
+
+    def __init__(self, *args, **kwargs):
+        self.clients = set()
+        self.clients_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def process_request(self, request, client_address):
+        with self.clients_lock:
+            self.clients.add(request)
+        super().process_request(request, client_address)
+
+    def shutdown_request(self, request):
+        with self.clients_lock:
+            self.clients.discard(request)
+        super().shutdown_request(request)
+
+    def close_clients(self):
+        with self.clients_lock:
+            clients = list(self.clients)
+        for request in clients:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+class ReusePortTCPServer(EPPTCPServer):
+    # Lets several worker processes bind the same port; the kernel shards accepts
+    allow_reuse_port = True
 
 class Command(BaseCommand):
     help = 'Run a mock EPP TCP server (Nominet style) on port 700.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='0.0.0.0')
+        parser.add_argument('--port', type=int, default=700)
+        parser.add_argument(
+            '--engine', choices=['thread', 'asyncio'], default='thread',
+            help='thread: one OS thread per session. asyncio: one event loop for all sessions, DB work in a thread pool.',
+        )
+        parser.add_argument(
+            '--db-pool-size', type=int, default=settings.EPP_DB_POOL_SIZE,
+            help='Threads (and so DB connections) per worker that run all ORM work. Default: EPP_DB_POOL_SIZE.',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of worker processes sharing the port via SO_REUSEPORT. Crashed workers are restarted.',
+        )
+        parser.add_argument(
+            '--metrics-port', type=int, default=settings.EPP_METRICS_PORT,
+            help='Serve Prometheus metrics at http://<metrics-host>:<port>/metrics; worker N uses port + N. '
+                 '0 disables. Default: EPP_METRICS_PORT.',
+        )
+        parser.add_argument('--metrics-host', default='127.0.0.1')
+        parser.add_argument(
+            '--record', metavar='PATH',
+            help='Append every inbound EPP frame (and each response\'s result code) to a binary log '
+                 'for epp_replay. Worker N writes PATH.N. Logins are recorded verbatim.',
+        )
+        parser.add_argument(
+            '--settle-interval', type=float, default=1.0,
+            help='Seconds between background drop settlement passes (first worker only). 0 disables; run settle_drops instead.',
+        )
+        parser.add_argument(
+            '--clock-auto-jump', type=float, default=None, metavar='LEAD',
+            help='With CLOCK_BACKEND=core.clock.SimClock: whenever settlement finds nothing to do, jump the '
+                 'clock to LEAD seconds before the next drop, so a whole schedule runs in seconds.',
+        )
+
     def handle(self, *args, **options):
-        HOST, PORT = '0.0.0.0', 700
-        with socketserver.ThreadingTCPServer((HOST, PORT), EPPHandler) as server:
-            self.stdout.write(self.style.SUCCESS(f"Mock EPP server running on {HOST}:{PORT}"))
+        HOST, PORT = options['host'], options['port']
+        workers = options['workers']
+        if options['clock_auto_jump'] is not None:
+            if not isinstance(clock, SimClock):
+                raise CommandError('--clock-auto-jump needs CLOCK_BACKEND=core.clock.SimClock')
+            if options['settle_interval'] <= 0:
+                raise CommandError('--clock-auto-jump runs with background settlement (--settle-interval > 0)')
+        if workers <= 1:
+            self.serve(HOST, PORT, options, reuse_port=False, slot=0)
+            return
+        from core.epp.workers import Supervisor
+        self.stdout.write(self.style.SUCCESS(f"Starting {workers} EPP workers on {HOST}:{PORT}"))
+        Supervisor(workers, lambda slot: self.serve(HOST, PORT, options, reuse_port=True, slot=slot)).run()
+        self.stdout.write(self.style.WARNING("Shutting down EPP server."))
+
+    def serve(self, host, port, options, reuse_port, slot):
+        label = f"{options['engine']}, pid {os.getpid()}" if reuse_port else options['engine']
+        if settings.EPP_AVAILABILITY_INDEX:
+            index.load()
+        if options['settle_interval'] > 0 and slot == 0:
+            SettlementWorker(options['settle_interval'], options['clock_auto_jump']).start()
+        # kill -USR1 (or manage.py epp_profile) toggles the sampling profiler
+        install_signal_handler()
+        if options['metrics_port']:
+            # Each worker process has its own counters, so its own port
+            metrics.serve(options['metrics_host'], options['metrics_port'] + slot)
+        # The main thread only needed a connection for startup
+        connections.close_all()
+        db_pool = DatabasePool(options['db_pool_size'])
+        recorder = None
+        if options['record']:
+            recorder = Recorder(f"{options['record']}.{slot}" if reuse_port else options['record'])
+        try:
+            if options['engine'] == 'asyncio':
+                self.serve_asyncio(host, port, db_pool, recorder, reuse_port, label)
+            else:
+                self.serve_threads(host, port, db_pool, recorder, reuse_port, label)
+        finally:
+            db_pool.close()
+            # Workers leave through os._exit: flush the log here, not at exit
+            if recorder is not None:
+                recorder.close()
+
+    def serve_threads(self, host, port, db_pool, recorder, reuse_port, label):
+        server_class = ReusePortTCPServer if reuse_port else EPPTCPServer
+        with server_class((host, port), EPPHandler) as server:
+            server.db_pool = db_pool
+            server.recorder = recorder
+            self.stdout.write(self.style.SUCCESS(f"Mock EPP server ({label}) running on {host}:{port}"))
             try:
                 server.serve_forever()
             except KeyboardInterrupt:
+                if not reuse_port:
+                    self.stdout.write(self.style.WARNING("Shutting down EPP server."))
+            finally:
+                # Open sessions end now, so their threads finish before the pool and recorder close
+                server.close_clients()
+
+    def serve_asyncio(self, host, port, db_pool, recorder, reuse_port, label):
+        from core.epp import aio
+        nofile = aio.raise_nofile_limit()
+        started = lambda server: self.stdout.write(self.style.SUCCESS(
+            f"Mock EPP server ({label}) running on {host}:{port}, fd limit {nofile}"
+        ))
+        try:
+            asyncio.run(aio.serve(host, port, db_pool, recorder, reuse_port=reuse_port, started=started))
+        except KeyboardInterrupt:
+            if not reuse_port:
                 self.stdout.write(self.style.WARNING("Shutting down EPP server."))
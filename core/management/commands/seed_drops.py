@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+import time
+
+from core.seeding import seed_drops
+
+
+class Command(BaseCommand):
+    help = 'Bulk-create random domains with pending drops for load tests.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000)
+        parser.add_argument('--clear-after', type=int, default=5, help='Minutes after the drop before it counts as missed.')
+        parser.add_argument('--spacing', type=float, default=120.0, help='Seconds between consecutive drop times.')
+        parser.add_argument('--prefix', default='domain', help='Name prefix for generated domains.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = seed_drops(
+            options['count'],
+            clear_after_minutes=options['clear_after'],
+            spacing=timezone.timedelta(seconds=options['spacing']),
+            prefix=options['prefix'],
+            batch_size=options['batch_size'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Seeded {count} domains and drops in {elapsed:.2f}s."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Registrar
+
+
+class Command(BaseCommand):
+    help = 'Create or update an EPP registrar account (the clID/pw used in <login>).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('client_id')
+        parser.add_argument('password')
+        parser.add_argument('--inactive', action='store_true', help='Disable logins for this registrar.')
+
+    def handle(self, *args, **options):
+        registrar = Registrar.objects.filter(client_id=options['client_id']).first() or Registrar(client_id=options['client_id'])
+        created = registrar.pk is None
+        registrar.set_password(options['password'])
+        registrar.is_active = not options['inactive']
+        registrar.save()
+        self.stdout.write(self.style.SUCCESS(f"{'Created' if created else 'Updated'} registrar {registrar.client_id}."))
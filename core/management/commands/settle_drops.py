@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.clock import SimClock, clock
+from core.feed import prune_drop_events
+from core.settlement import jump_to_next_drop, settle_due_drops
+
+
+class Command(BaseCommand):
+    help = 'Settle due drops (captured/missed). Runs continuously unless --once is given.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds (of clock time) between settlement passes.')
+        parser.add_argument(
+            '--auto-jump', type=float, default=None, metavar='LEAD',
+            help='With CLOCK_BACKEND=core.clock.SimClock: when nothing is left to settle, jump the clock '
+                 'to LEAD seconds before the next drop.',
+        )
+        parser.add_argument('--once', action='store_true', help='Run a single pass and exit.')
+
+    def handle(self, *args, **options):
+        if options['auto_jump'] is not None and not isinstance(clock, SimClock):
+            raise CommandError('--auto-jump needs CLOCK_BACKEND=core.clock.SimClock')
+        if options['once']:
+            count = settle_due_drops()
+            self.stdout.write(self.style.SUCCESS(f"Settled {count} drops."))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Settling due drops every {options['interval']}s"))
+        try:
+            while True:
+                count = settle_due_drops()
+                prune_drop_events()
+                if count:
+                    self.stdout.write(f"Settled {count} drops.")
+                if options['auto_jump'] is not None and (moved := jump_to_next_drop(options['auto_jump'])):
+                    self.stdout.write(f"Clock moved to {moved.isoformat()}")
+                clock.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING("Stopping drop settlement."))
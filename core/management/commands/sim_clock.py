@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.clock import SimClock, clock
+from core.settlement import jump_to_next_drop
+
+
+class Command(BaseCommand):
+    help = (
+        'Show or move the virtual clock (CLOCK_BACKEND=core.clock.SimClock) shared by the web and '
+        'run_eppserver: jump to the next drop, advance, set a time or speed, or reset to real time.'
+    )
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest='action')
+        subcommands.add_parser('show', help='Print the current clock time and speed.')
+        next_drop = subcommands.add_parser('next', help='Jump to the next pending drop.')
+        next_drop.add_argument('--lead', type=float, default=0.0, help='Stop this many seconds before it.')
+        advance = subcommands.add_parser('advance', help='Move the clock forward.')
+        advance.add_argument('seconds', type=float)
+        at = subcommands.add_parser('set', help='Move the clock to an ISO 8601 time.')
+        at.add_argument('when')
+        speed = subcommands.add_parser('speed', help='Run the clock this many times faster than real time.')
+        speed.add_argument('factor', type=float)
+        subcommands.add_parser('reset', help='Back to real time at SIM_CLOCK_SPEED.')
+
+    def handle(self, *args, **options):
+        if not isinstance(clock, SimClock):
+            raise CommandError('The clock is real time; set CLOCK_BACKEND=core.clock.SimClock')
+        action = options['action'] or 'show'
+        if action == 'next':
+            if jump_to_next_drop(options['lead']) is None:
+                self.stdout.write('Nothing to jump to: no later pending drop, or a race is on.')
+        elif action == 'advance':
+            if options['seconds'] < 0:
+                raise CommandError('The clock only moves forward; use set or reset.')
+            clock.set(clock.now() + timezone.timedelta(seconds=options['seconds']))
+        elif action == 'set':
+            when = parse_datetime(options['when'])
+            if when is None:
+                raise CommandError(f"Not an ISO 8601 time: {options['when']}")
+            clock.set(when if timezone.is_aware(when) else timezone.make_aware(when))
+        elif action == 'speed':
+            if options['factor'] <= 0:
+                raise CommandError('Speed must be positive')
+            clock.set(speed=options['factor'])
+        elif action == 'reset':
+            clock.reset()
+        self.stdout.write(f'{clock.now().isoformat()} (x{clock.speed:g})')
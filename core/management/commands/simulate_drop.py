@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand, CommandError
+import json
+
+from core.models import Drop
+from core.simulation import DEFAULTS, check_params, drop_competitors, simulate
+
+
+def delay_override(value):
+    name, _, delay = value.rpartition('=')
+    if not name or not delay.isdigit():
+        raise ValueError(value)
+    return name, int(delay)
+
+
+class Command(BaseCommand):
+    help = (
+        "Monte Carlo simulation of a drop's race from its competitors' attempts and delay_ms: "
+        'win probability and capture latency per competitor, as JSON. --sweep tries a range of '
+        'delay_ms values for one competitor.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('drop', help='Drop id, or a domain name (its latest drop).')
+        parser.add_argument('--trials', type=int, default=DEFAULTS['trials'])
+        parser.add_argument('--jitter-ms', type=float, default=DEFAULTS['jitter_ms'],
+                            help='Standard deviation of each attempt\'s arrival time.')
+        parser.add_argument('--spacing-ms', type=float, default=DEFAULTS['spacing_ms'],
+                            help='Gap between one competitor\'s successive attempts.')
+        parser.add_argument('--release-window-ms', type=float, default=DEFAULTS['release_window_ms'],
+                            help='The name is released uniformly within this long after drop_time.')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--set', dest='overrides', action='append', default=[], type=delay_override,
+                            metavar='NAME=DELAY_MS', help='Try another delay_ms for a competitor (adds it if new).')
+        parser.add_argument('--sweep', metavar='NAME', help='Competitor whose delay_ms is swept.')
+        parser.add_argument('--delays', default='0:500:25', metavar='START:STOP:STEP',
+                            help='delay_ms values for --sweep (STOP exclusive).')
+
+    def handle(self, *args, **options):
+        drop = self.get_drop(options['drop'])
+        if options['trials'] < 1:
+            raise CommandError('--trials must be at least 1')
+        try:
+            check_params(options['jitter_ms'], options['spacing_ms'], options['release_window_ms'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        params = {
+            'trials': options['trials'],
+            'jitter_ms': options['jitter_ms'],
+            'spacing_ms': options['spacing_ms'],
+            'release_window_ms': options['release_window_ms'],
+            'seed': options['seed'],
+        }
+        overrides = dict(options['overrides'])
+        try:
+            # Also rejects a --set or --sweep name that several competitors share
+            drop_competitors(drop, {**overrides, **({options['sweep']: 0} if options['sweep'] else {})})
+        except ValueError as e:
+            raise CommandError(str(e))
+        if not options['sweep']:
+            report = simulate(drop_competitors(drop, overrides), **params)
+            report['drop'] = drop.pk
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        try:
+            start, stop, step = (int(part) for part in options['delays'].split(':'))
+            delays = range(start, stop, step)
+        except ValueError:
+            raise CommandError('--delays must be START:STOP:STEP in whole milliseconds')
+        sweep = []
+        for delay in delays:
+            report = simulate(drop_competitors(drop, {**overrides, options['sweep']: delay}), **params)
+            mine = next(c for c in report['competitors'] if c['name'] == options['sweep'])
+            sweep.append({
+                'delay_ms': delay,
+                'win_probability': mine['win_probability'],
+                'mean_win_latency_ms': mine['mean_win_latency_ms'],
+            })
+        self.stdout.write(json.dumps({'drop': drop.pk, 'competitor': options['sweep'], 'sweep': sweep}, indent=2))
+
+    def get_drop(self, value):
+        if value.isdigit():
+            drop = Drop.objects.filter(pk=int(value)).first()
+        else:
+            name, _, tld = value.rpartition('.')
+            drop = Drop.objects.filter(domain__name=name, domain__tld=tld).order_by('-drop_time').first()
+        if drop is None:
+            raise CommandError(f'No drop {value}')
+        return drop
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_changecounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DropEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('drop_id', models.BigIntegerField(blank=True, null=True)),
+                ('kind', models.CharField(choices=[('changed', 'Changed'), ('deleted', 'Deleted'), ('reset', 'Reset')], default='changed', max_length=16)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
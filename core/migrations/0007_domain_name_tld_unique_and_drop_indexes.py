@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_dropevent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='domain',
+            name='name',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='competitor',
+            index=models.Index(fields=['created_at'], name='competitor_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='domain',
+            index=models.Index(fields=['created_at'], name='domain_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='drop',
+            index=models.Index(fields=['status', 'drop_time'], name='drop_status_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='drop',
+            index=models.Index(fields=['drop_time'], name='drop_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='drop',
+            index=models.Index(fields=['created_at'], name='drop_created_at_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='domain',
+            constraint=models.UniqueConstraint(fields=('name', 'tld'), name='domain_name_tld_unique'),
+        ),
+    ]
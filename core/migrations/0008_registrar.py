@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_domain_name_tld_unique_and_drop_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Registrar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_id', models.CharField(max_length=16, unique=True)),
+                ('password', models.CharField(max_length=128)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_registrar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registrar',
+            name='burst',
+            field=models.PositiveIntegerField(blank=True, help_text='Commands allowed back to back before the rates apply.', null=True),
+        ),
+        migrations.AddField(
+            model_name='registrar',
+            name='max_sessions',
+            field=models.PositiveIntegerField(blank=True, help_text='Concurrent logged-in sessions.', null=True),
+        ),
+        migrations.AddField(
+            model_name='registrar',
+            name='rate',
+            field=models.FloatField(blank=True, help_text='Commands per second across all sessions.', null=True),
+        ),
+        migrations.AddField(
+            model_name='registrar',
+            name='session_rate',
+            field=models.FloatField(blank=True, help_text='Commands per second per session.', null=True),
+        ),
+    ]
@@ -1,12 +1,22 @@
+from django.contrib.auth.hashers import make_password
 from django.db import models
 
 # Create your models here.
 
 class Domain(models.Model):
-    name = models.CharField(max_length=255, unique=True)
+    name = models.CharField(max_length=255)
     tld = models.CharField(max_length=20)  # e.g., com, uk, eu, etc.
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # Also serves every (name, tld) lookup from EPP <check>/<create>
+            models.UniqueConstraint(fields=["name", "tld"], name="domain_name_tld_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["created_at"], name="domain_created_at_idx"),
+        ]
+
     def __str__(self):
         return f"{self.name}.{self.tld}"
 
@@ -23,6 +33,15 @@ class Drop(models.Model):
     status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="pending")
     winner = models.CharField(max_length=255, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Settlement: status="pending" AND drop_time <= now
+            models.Index(fields=["status", "drop_time"], name="drop_status_time_idx"),
+            # Recent-drops ordering and "last scheduled drop" lookups
+            models.Index(fields=["drop_time"], name="drop_time_idx"),
+            models.Index(fields=["created_at"], name="drop_created_at_idx"),
+        ]
+
     def __str__(self):
         return f"Drop for {self.domain} at {self.drop_time}"
 
@@ -34,5 +53,73 @@ class Competitor(models.Model):
     delay_ms = models.PositiveIntegerField(default=100)  # Simulated network delay in milliseconds
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at"], name="competitor_created_at_idx"),
+        ]
+
     def __str__(self):
         return f"{self.name} (Drop: {self.drop})"
+
+class ChangeCounter(models.Model):
+    # Version stamps shared between processes (web, EPP workers) for in-memory caches
+    name = models.CharField(max_length=64, unique=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}={self.value}"
+
+    @classmethod
+    def current(cls, name):
+        return cls.objects.filter(name=name).values_list("value", flat=True).first() or 0
+
+    @classmethod
+    def bump(cls, name):
+        if not cls.objects.filter(name=name).update(value=models.F("value") + 1):
+            cls.objects.get_or_create(name=name)
+            cls.objects.filter(name=name).update(value=models.F("value") + 1)
+        return cls.current(name)
+
+class DropEvent(models.Model):
+    # Append-only change log for drops and their competitors; the id is the
+    # monotonic version streamed to dashboards (Last-Event-ID resumes from it)
+    KIND_CHOICES = [
+        ("changed", "Changed"),
+        ("deleted", "Deleted"),
+        ("reset", "Reset"),
+    ]
+    drop_id = models.BigIntegerField(null=True, blank=True)  # not a FK: deleted drops keep their events
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES, default="changed")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} drop {self.drop_id}"
+
+class Registrar(models.Model):
+    # EPP client accounts; <login> is checked against these (see core/credentials.py)
+    client_id = models.CharField(max_length=16, unique=True)  # EPP clID
+    password = models.CharField(max_length=128)  # Django password hash, never the raw value
+    is_active = models.BooleanField(default=True)
+    # Throttling; blank falls back to the EPP_* defaults in settings, 0 means unlimited
+    session_rate = models.FloatField(null=True, blank=True, help_text="Commands per second per session.")
+    rate = models.FloatField(null=True, blank=True, help_text="Commands per second across all sessions.")
+    burst = models.PositiveIntegerField(null=True, blank=True, help_text="Commands allowed back to back before the rates apply.")
+    max_sessions = models.PositiveIntegerField(null=True, blank=True, help_text="Concurrent logged-in sessions.")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.client_id
+
+    def set_password(self, raw_password):
+        self.password = make_password(raw_password)
+
+class ApiToken(models.Model):
+    # Token for the HTTP capture API; only the digest is stored (see core/credentials.py)
+    registrar = models.ForeignKey(Registrar, on_delete=models.CASCADE, related_name="api_tokens")
+    prefix = models.CharField(max_length=8, unique=True)  # public part, identifies the token
+    digest = models.CharField(max_length=64)  # SHA-256 hex of the whole token
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.registrar} {self.prefix}…"
@@ -0,0 +1,63 @@
+import random
+
+from django.db import transaction
+from django.utils import timezone
+
+from .availability import domains_changed
+from .clock import clock
+from .feed import record_reset
+from .models import Domain, Drop
+
+TLD_CHOICES = ["com", "net", "org", "uk", "eu", "info", "io", "co"]
+
+# Stay under SQLite's bound-parameter limit for name__in lookups
+LOOKUP_CHUNK = 500
+
+
+def unique_names(count, prefix="domain"):
+    """Return ``count`` random names that no existing Domain uses."""
+    width = max(5, len(str(count)) + 2)
+    low, high = 10 ** (width - 1), 10 ** width
+    names, seen = [], set()
+    while len(names) < count:
+        need = count - len(names)
+        candidates = [f"{prefix}{n}" for n in random.sample(range(low, high), need)]
+        candidates = [name for name in candidates if name not in seen]
+        seen.update(candidates)
+        taken = set()
+        for i in range(0, len(candidates), LOOKUP_CHUNK):
+            chunk = candidates[i:i + LOOKUP_CHUNK]
+            taken.update(Domain.objects.filter(name__in=chunk).values_list("name", flat=True))
+        names.extend(name for name in candidates if name not in taken)
+    return names
+
+
+def seed_drops(count, clear_after_minutes=5, spacing=None, base_time=None, prefix="domain", batch_size=1000):
+    """Create ``count`` random domains, each with a pending drop, using bulk inserts.
+
+    Drops are spaced ``spacing`` apart (2 minutes by default; zero puts them
+    all at once) after the last scheduled drop, or after now. Returns the number of drops created.
+    """
+    if spacing is None:
+        spacing = timezone.timedelta(minutes=2)
+    if base_time is None:
+        last_drop = Drop.objects.order_by("-drop_time").first()
+        base_time = last_drop.drop_time if last_drop else clock.now()
+    names = unique_names(count, prefix)
+    with transaction.atomic():
+        for start in range(0, count, batch_size):
+            domains = Domain.objects.bulk_create(
+                [Domain(name=name, tld=random.choice(TLD_CHOICES)) for name in names[start:start + batch_size]]
+            )
+            Drop.objects.bulk_create([
+                Drop(
+                    domain=domain,
+                    drop_time=base_time + spacing * (start + i + 1),
+                    clear_after_minutes=clear_after_minutes,
+                )
+                for i, domain in enumerate(domains)
+            ])
+        # bulk_create skips model signals: tell the availability index and dashboards
+        transaction.on_commit(domains_changed)
+        transaction.on_commit(record_reset)
+    return count
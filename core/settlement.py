@@ -0,0 +1,106 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .clock import clock
+from .feed import prune_drop_events, record_drop_changes
+from .models import Drop
+
+logger = logging.getLogger(__name__)
+
+
+def settle_due_drops(now=None, batch_size=500):
+    """Settle every pending drop that is due, in one transaction.
+
+    A drop with competitors is captured by the fastest one once its delay
+    has elapsed plus SETTLEMENT_GRACE_SECONDS. The grace leaves drops that
+    live EPP clients are racing to the race scheduler, which resolves them
+    at the fastest competitor's time. A drop nobody competes for is missed
+    after ``clear_after_minutes``.
+    Returns the number of drops settled.
+    """
+    now = now or clock.now()
+    grace = timezone.timedelta(seconds=settings.SETTLEMENT_GRACE_SECONDS)
+    settled = []
+    with transaction.atomic():
+        drops = (
+            Drop.objects.select_for_update()
+            .filter(status="pending", drop_time__lte=now)
+            .prefetch_related("competitors")
+        )
+        for drop in drops:
+            competitors = list(drop.competitors.all())
+            if competitors:
+                winner = min(competitors, key=lambda c: c.delay_ms)
+                if now < drop.drop_time + timezone.timedelta(milliseconds=winner.delay_ms) + grace:
+                    continue
+                drop.status = "captured"
+                drop.winner = winner.name
+            else:
+                if now < drop.drop_time + timezone.timedelta(minutes=drop.clear_after_minutes):
+                    continue
+                drop.status = "missed"
+                drop.winner = None
+            settled.append(drop)
+        Drop.objects.bulk_update(settled, ["status", "winner"], batch_size=batch_size)
+        # bulk_update skips model signals, so log the changes for dashboards here
+        record_drop_changes([drop.pk for drop in settled])
+    return len(settled)
+
+
+def jump_to_next_drop(lead=0.0):
+    """Move a virtual clock ahead to the next moment something can happen.
+
+    That is ``lead`` seconds before the next pending drop, or the time a due
+    drop nobody competes for is missed, whichever comes first. Nothing moves
+    while a contested drop is due but unsettled: its race is on. Returns the
+    new time, or None.
+    """
+    now = clock.now()
+    due = Drop.objects.filter(status="pending", drop_time__lte=now)
+    if due.filter(competitors__isnull=False).exists():
+        return None
+    targets = [
+        drop_time + timezone.timedelta(minutes=clear_after)
+        for drop_time, clear_after in due.values_list("drop_time", "clear_after_minutes")
+    ]
+    upcoming = (
+        Drop.objects.filter(status="pending", drop_time__gt=now)
+        .order_by("drop_time").values_list("drop_time", flat=True).first()
+    )
+    if upcoming is not None:
+        targets.append(upcoming - timezone.timedelta(seconds=lead))
+    target = min(targets, default=None)
+    if target is None or target <= now:
+        return None
+    clock.set(target)
+    return target
+
+
+class SettlementWorker(threading.Thread):
+    """Daemon thread that runs settle_due_drops() every ``interval`` seconds
+    of clock time. With ``auto_jump`` (seconds of lead) it also moves a
+    virtual clock to the next drop whenever nothing is left to settle."""
+
+    def __init__(self, interval, auto_jump=None):
+        super().__init__(name="drop-settlement", daemon=True)
+        self.interval = interval
+        self.auto_jump = auto_jump
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(clock.real_seconds(self.interval)):
+            try:
+                close_old_connections()
+                settle_due_drops()
+                prune_drop_events()
+                if self.auto_jump is not None:
+                    jump_to_next_drop(self.auto_jump)
+            except Exception:
+                logger.exception("Drop settlement failed")
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,118 @@
+import threading
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import credentials
+from .availability import VERSION_COUNTER, index
+from .feed import record_drop_changes
+from .models import ApiToken, ChangeCounter, Competitor, Domain, Drop, Registrar
+
+
+_local = threading.local()
+
+
+class DomainChanges:
+    """The Domain writes of one transaction, applied together on commit.
+
+    The shared counter is bumped once per transaction rather than once per
+    row, so a bulk delete in the admin does not queue up on its row.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.registered = {}  # (name, tld) -> registered after the transaction
+        self.reload = False
+        # Where apply() goes among the commit hooks, and the savepoints it
+        # belongs to: a rollback that drops a write made within those drops
+        # apply() as well
+        self.position = len(connection.run_on_commit)
+        self.savepoint_ids = set(connection.savepoint_ids)
+
+    def pending(self, connection):
+        """Whether apply() is still due when ``connection`` commits."""
+        hooks = connection.run_on_commit
+        return connection is self.connection and len(hooks) > self.position and hooks[self.position][1] == self.apply
+
+    def record(self, name, tld, registered):
+        # None stands for an atomic block without a savepoint, which cannot
+        # roll back on its own
+        if registered is None or not set(self.connection.savepoint_ids) - {None} <= self.savepoint_ids:
+            # A rename (the old key is unknown), or a write in a savepoint
+            # that may roll back on its own: reload rather than guess
+            self.reload = True
+        else:
+            self.registered[name, tld] = registered
+
+    def apply(self):
+        if getattr(_local, "domain_changes", None) is self:
+            _local.domain_changes = None
+        version = ChangeCounter.bump(VERSION_COUNTER)
+        if self.reload:
+            index.invalidate()
+        else:
+            index.changed(
+                [key for key, registered in self.registered.items() if registered],
+                [key for key, registered in self.registered.items() if not registered],
+                version,
+            )
+
+
+def domain_changed(name, tld, registered):
+    """Note a Domain write (``registered`` None for a rename) for the commit
+    of the current transaction."""
+    connection = transaction.get_connection()
+    changes = getattr(_local, "domain_changes", None)
+    if changes is None or not changes.pending(connection):
+        # First write of this transaction, or the last transaction rolled back
+        changes = DomainChanges(connection)
+        if connection.in_atomic_block:
+            _local.domain_changes = changes
+            transaction.on_commit(changes.apply)
+    changes.record(name, tld, registered)
+    if not connection.in_atomic_block:
+        # Autocommit: the write is committed already
+        changes.apply()
+
+
+@receiver(post_save, sender=Domain)
+def domain_saved(sender, instance, created, **kwargs):
+    # Renamed in the dashboard or admin: the old key is unknown here
+    domain_changed(instance.name, instance.tld, True if created else None)
+
+
+@receiver(post_delete, sender=Domain)
+def domain_deleted(sender, instance, **kwargs):
+    domain_changed(instance.name, instance.tld, False)
+
+
+@receiver(post_save, sender=Drop)
+def drop_saved(sender, instance, **kwargs):
+    drop_id = instance.pk
+    transaction.on_commit(lambda: record_drop_changes([drop_id]))
+
+
+@receiver(post_delete, sender=Drop)
+def drop_deleted(sender, instance, **kwargs):
+    drop_id = instance.pk
+    transaction.on_commit(lambda: record_drop_changes([drop_id], kind="deleted"))
+
+
+@receiver(post_save, sender=Competitor)
+@receiver(post_delete, sender=Competitor)
+def competitor_changed(sender, instance, **kwargs):
+    drop_id = instance.drop_id
+    transaction.on_commit(lambda: record_drop_changes([drop_id]))
+
+
+@receiver(post_save, sender=Registrar)
+@receiver(post_delete, sender=Registrar)
+@receiver(post_save, sender=ApiToken)
+@receiver(post_delete, sender=ApiToken)
+def registrar_changed(sender, instance, **kwargs):
+    def apply():
+        ChangeCounter.bump(credentials.VERSION_COUNTER)
+        credentials.credentials.invalidate()
+        credentials.api_tokens.invalidate()
+    transaction.on_commit(apply)
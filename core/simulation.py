@@ -0,0 +1,125 @@
+"""Monte Carlo model of a drop race, for tuning a bot's ``delay_ms`` offline.
+
+The live race (core.epp.race) and settlement pick ``min(delay_ms)``. Here
+every competitor fires ``attempts`` creates (at least one): attempt k
+leaves ``delay_ms + k * spacing_ms`` after the drop time and arrives with
+normally distributed jitter. The registry releases the name at a uniform
+random moment within ``release_window_ms`` of the drop time. Attempts that
+arrive earlier fail, which is what extra attempts buy. The earliest arrival
+after the release wins. With no jitter and no release window this is the
+deterministic min(delay_ms) race, ties included.
+"""
+
+import math
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+
+from .models import Competitor
+
+DEFAULTS = {
+    'trials': 20000,
+    'jitter_ms': 25.0,
+    'spacing_ms': 50.0,
+    'release_window_ms': 200.0,
+}
+
+# Largest jitter_ms, spacing_ms and release_window_ms accepted: a minute
+MAX_MS = 60000.0
+
+# Trials per batch, lowered so that batch * total attempts stays within
+# SIMULATION_MAX_SAMPLES floats
+BATCH = 10000
+
+
+def check_params(jitter_ms, spacing_ms, release_window_ms):
+    """Raise ValueError unless the timing parameters are finite and in range."""
+    for name, value in (('jitter_ms', jitter_ms), ('spacing_ms', spacing_ms), ('release_window_ms', release_window_ms)):
+        if not math.isfinite(value) or not 0 <= value <= MAX_MS:
+            raise ValueError(f"{name} must be between 0 and {MAX_MS:g}")
+
+
+def simulate(competitors, trials=DEFAULTS['trials'], jitter_ms=DEFAULTS['jitter_ms'],
+             spacing_ms=DEFAULTS['spacing_ms'], release_window_ms=DEFAULTS['release_window_ms'], seed=None):
+    """Run the race ``trials`` times for ``competitors``, a list of
+    (name, attempts, delay_ms) tuples, and return a JSON-ready dict.
+
+    Per competitor: the share of trials it wins, the mean capture latency
+    (ms after the drop time) of those wins, and the chance that any of its
+    attempts lands after the release, with that latency's p50/p95.
+    """
+    if not competitors:
+        return {'trials': trials, 'competitors': [], 'nobody': 1.0}
+    rng = np.random.default_rng(seed)
+    attempts = np.array([min(max(1, a), settings.COMPETITOR_MAX_ATTEMPTS) for _, a, _ in competitors])
+    batch = max(1, min(BATCH, settings.SIMULATION_MAX_SAMPLES // int(attempts.sum())))
+    # One column per attempt, each competitor's attempts side by side
+    owner_start = np.concatenate(([0], np.cumsum(attempts)[:-1]))
+    owner = np.repeat(np.arange(len(competitors)), attempts)
+    attempt_index = np.arange(attempts.sum()) - np.repeat(owner_start, attempts)
+    sent = np.array([d for _, _, d in competitors], dtype=float)[owner] + attempt_index * spacing_ms
+
+    wins = np.zeros(len(competitors), dtype=np.int64)
+    win_latency = np.zeros(len(competitors))
+    own_latencies = [[] for _ in competitors]
+    for done in range(0, trials, batch):
+        n = min(batch, trials - done)
+        arrival = sent + rng.normal(0.0, jitter_ms, (n, sent.size)) if jitter_ms else np.broadcast_to(sent, (n, sent.size))
+        arrival = np.maximum(arrival, 0.0)
+        release = rng.uniform(0.0, release_window_ms, (n, 1)) if release_window_ms else np.zeros((n, 1))
+        # Too early: the name is not free yet
+        landed = np.where(arrival >= release, arrival, np.inf)
+        capture = np.minimum.reduceat(landed, owner_start, axis=1)  # (n, competitors)
+        winner = np.argmin(capture, axis=1)
+        best = capture[np.arange(n), winner]
+        won = np.isfinite(best)
+        wins += np.bincount(winner[won], minlength=len(competitors))
+        win_latency += np.bincount(winner[won], weights=best[won], minlength=len(competitors))
+        for i in range(len(competitors)):
+            column = capture[:, i]
+            own_latencies[i].append(column[np.isfinite(column)])
+
+    results = []
+    for i, (name, _, delay_ms) in enumerate(competitors):
+        own = np.concatenate(own_latencies[i])
+        results.append({
+            'name': name,
+            'attempts': int(attempts[i]),
+            'delay_ms': delay_ms,
+            'win_probability': round(wins[i] / trials, 4),
+            'mean_win_latency_ms': round(win_latency[i] / wins[i], 2) if wins[i] else None,
+            'success_probability': round(own.size / trials, 4),
+            'p50_latency_ms': round(float(np.percentile(own, 50)), 2) if own.size else None,
+            'p95_latency_ms': round(float(np.percentile(own, 95)), 2) if own.size else None,
+        })
+    return {
+        'trials': trials,
+        'jitter_ms': jitter_ms,
+        'spacing_ms': spacing_ms,
+        'release_window_ms': release_window_ms,
+        'competitors': results,
+        'nobody': round(1 - wins.sum() / trials, 4),
+    }
+
+
+def drop_competitors(drop, overrides=None, add_new=True):
+    """(name, attempts, delay_ms) for a drop's competitors.
+
+    ``overrides`` maps a competitor name to a delay_ms to try instead; names
+    not yet competing join with one attempt, or raise ValueError if not
+    ``add_new``. Names are not unique (the capture API names competitors
+    after the domain), so overriding one that several competitors share
+    raises ValueError.
+    """
+    overrides = dict(overrides or {})
+    rows = list(Competitor.objects.filter(drop=drop).order_by('pk').values_list('name', 'attempts', 'delay_ms'))
+    names = Counter(name for name, _, _ in rows)
+    shared = [name for name in overrides if names[name] > 1]
+    if shared:
+        raise ValueError(f"several competitors are named {', '.join(map(repr, shared))}")
+    competitors = [(name, attempts, overrides.pop(name, delay_ms)) for name, attempts, delay_ms in rows]
+    if overrides and not add_new:
+        raise ValueError(f"no competitor named {', '.join(map(repr, overrides))}")
+    competitors += [(name, 1, delay_ms) for name, delay_ms in overrides.items()]
+    return competitors
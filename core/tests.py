@@ -1,3 +1,1167 @@
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.backends.signals import connection_created
+from django.test import TestCase, TransactionTestCase, override_settings
+from unittest import mock
+import asyncio
+import io
+import json
+import logging
+import numpy as np
+import os
+import pstats
+import re
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
 
-# Create your tests here.
+from .availability import VERSION_COUNTER, domains_changed, index
+from .clock import SimClock
+from .credentials import api_tokens, credentials, generate_token
+from .epp import aio, metrics
+from .epp.commands import dispatch, dispatch_batch
+from .epp.db import DatabasePool
+from .epp.parser import DOMAIN_NAME, parse_command
+from .epp.profiling import profiler, write_control
+from .epp.protocol import FrameBuffer, FrameError, epp_check_response, epp_create_response
+from .epp.race import Race, RaceScheduler
+from .epp.recording import CLOSE, FRAME, OPEN, RESPONSE, Recorder, read_log
+from .epp.session import Session
+from .epp.workers import Supervisor
+from .feed import (
+    DropEventBroadcaster, drop_event_stream, latest_version, load_changes, prune_drop_events, record_drop_changes,
+)
+from .log import AsyncFileHandler
+from .management.commands.run_eppserver import EPPHandler, EPPTCPServer
+from .models import ApiToken, ChangeCounter, Competitor, Domain, Drop, DropEvent, Registrar
+from .seeding import seed_drops, unique_names
+from .settlement import jump_to_next_drop, settle_due_drops
+
+
+class RecentDropsQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("alice", password="pw")
+        self.client.force_login(self.user)
+
+    def add_drops(self, count, competitors_per_drop):
+        now = timezone.now()
+        for i in range(count):
+            domain = Domain.objects.create(name=f"querytest{Drop.objects.count()}", tld="com")
+            drop = Drop.objects.create(domain=domain, drop_time=now - timezone.timedelta(minutes=i))
+            for j in range(competitors_per_drop):
+                Competitor.objects.create(drop=drop, name=f"bot{j}", delay_ms=10 * j)
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_api_recent_drops_query_count_is_constant(self):
+        url = reverse("api_recent_drops")
+        self.add_drops(2, 1)
+        small = self.count_queries(url)
+        self.add_drops(15, 5)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_dashboard_query_count_is_constant(self):
+        url = reverse("dashboard")
+        self.add_drops(2, 1)
+        small = self.count_queries(url)
+        self.add_drops(15, 5)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_get_does_not_rewrite_status(self):
+        self.add_drops(1, 0)
+        Drop.objects.update(status="captured", winner="bob")
+        response = self.client.get(reverse("api_recent_drops"))
+        self.assertEqual(response.json()["drops"][0]["status"], "missed")
+        self.client.get(reverse("dashboard"))
+        self.assertEqual(Drop.objects.get().status, "captured")
+
+
+class RecentDropsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("alice", password="pw")
+        self.client.force_login(self.user)
+        self.url = reverse("api_recent_drops")
+        with self.captureOnCommitCallbacks(execute=True):
+            domain = Domain.objects.create(name="cached", tld="com")
+            self.drop = Drop.objects.create(domain=domain, drop_time=timezone.now())
+
+    def test_unchanged_poll_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([q for q in ctx.captured_queries if "core_drop" in q["sql"]])
+
+    def test_write_invalidates(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Competitor.objects.create(drop=self.drop, name="bot")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["drops"][0]["competitors"][0]["name"], "bot")
+
+    def test_sort_and_order_with_sort_keys(self):
+        # The dashboard re-sorts streamed drops by these keys, as the API does
+        with self.captureOnCommitCallbacks(execute=True):
+            domain = Domain.objects.create(name="later", tld="com")
+            later = Drop.objects.create(domain=domain, drop_time=self.drop.drop_time - timezone.timedelta(hours=1))
+        Drop.objects.filter(pk=later.pk).update(created_at=self.drop.created_at + timezone.timedelta(minutes=1))
+        for query, expected in [
+            ("", [later.pk, self.drop.pk]),
+            ("?sort=drop_time&order=desc", [self.drop.pk, later.pk]),
+            ("?sort=created_at&order=desc", [later.pk, self.drop.pk]),
+            ("?sort=created_at&order=asc", [self.drop.pk, later.pk]),
+        ]:
+            drops = self.client.get(self.url + query).json()["drops"]
+            self.assertEqual([d["id"] for d in drops], expected, query)
+            key = "created_at_iso" if "created_at" in query else "drop_time_iso"
+            keys = [d[key] for d in drops]
+            self.assertEqual(keys, sorted(keys, reverse="desc" in query))
+
+    def test_etag_varies_per_user(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.client.force_login(User.objects.create_user("bob", password="pw"))
+        self.assertNotEqual(self.client.get(self.url)["ETag"], etag)
+
+
+def epp_command(body):
+    return f'<epp xmlns="urn:ietf:params:xml:ns:epp-1.0"><command>{body}</command></epp>'.encode()
+
+
+LOGIN = epp_command("<login><clID>reg1</clID><pw>secret</pw></login>")
+HELLO = b'<epp xmlns="urn:ietf:params:xml:ns:epp-1.0"><hello/></epp>'
+CHECK = epp_command(
+    '<check><domain:check xmlns:domain="urn:ietf:params:xml:ns:domain-1.0">'
+    "<domain:name>free.com</domain:name></domain:check></check>"
+)
+
+
+@override_settings(EPP_AVAILABILITY_INDEX=True, EPP_AVAILABILITY_REFRESH_SECONDS=3600)
+class AvailabilityIndexTests(TestCase):
+    CANDIDATES = {("alpha", "com"), ("beta", "com"), ("gamma", "net"), ("renamed", "com")}
+
+    def setUp(self):
+        index.load()
+
+    def assertMatchesDatabase(self, queries=0):
+        # Applied by the signals in this process: no reload needed
+        with self.assertNumQueries(queries):
+            registered = index.registered(self.CANDIDATES)
+        self.assertEqual(registered, self.CANDIDATES & set(Domain.objects.values_list("name", "tld")))
+
+    def test_create_delete_and_register_again(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            alpha = Domain.objects.create(name="alpha", tld="com")
+            Domain.objects.create(name="beta", tld="com")
+        self.assertMatchesDatabase()
+        with self.captureOnCommitCallbacks(execute=True):
+            alpha.delete()
+        self.assertMatchesDatabase()
+        with self.captureOnCommitCallbacks(execute=True):
+            Domain.objects.create(name="alpha", tld="com")
+        self.assertMatchesDatabase()
+
+    def test_rename_and_bulk_writes_reload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            beta = Domain.objects.create(name="beta", tld="com")
+        with self.captureOnCommitCallbacks(execute=True):
+            beta.name = "renamed"
+            beta.save()
+        self.assertMatchesDatabase(queries=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Domain.objects.bulk_create([Domain(name="gamma", tld="net")])
+            Domain.objects.filter(name="renamed").update(name="alpha")
+            transaction.on_commit(domains_changed)
+        self.assertMatchesDatabase(queries=2)
+
+    def test_one_bump_per_transaction(self):
+        version = ChangeCounter.current(VERSION_COUNTER)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            alpha = Domain.objects.create(name="alpha", tld="com")
+            Domain.objects.create(name="beta", tld="com")
+            Domain.objects.create(name="gamma", tld="net")
+            alpha.delete()
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(ChangeCounter.current(VERSION_COUNTER), version + 1)
+        self.assertMatchesDatabase()
+
+    def test_rolled_back_writes_are_not_applied(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                Domain.objects.create(name="gamma", tld="net")
+                raise RuntimeError
+            # The rolled back savepoint took the first batch with it
+            Domain.objects.create(name="alpha", tld="com")
+        self.assertMatchesDatabase()
+        with self.captureOnCommitCallbacks(execute=True):
+            Domain.objects.create(name="beta", tld="com")
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                Domain.objects.get(name="alpha").delete()
+                raise RuntimeError
+        # Which writes survived is unknown here: reload
+        self.assertMatchesDatabase(queries=2)
+
+    def test_write_in_another_process_is_picked_up(self):
+        Domain.objects.bulk_create([Domain(name="gamma", tld="net")])
+        # What another worker's domain_saved does here: bump the shared counter
+        ChangeCounter.bump(VERSION_COUNTER)
+        # Stale until the refresh interval has passed
+        self.assertEqual(index.registered(self.CANDIDATES), set())
+        with self.settings(EPP_AVAILABILITY_REFRESH_SECONDS=0):
+            self.assertMatchesDatabase(queries=3)
+
+
+class SeedingTests(TestCase):
+    def test_unique_names_skip_repeats_and_existing_names(self):
+        Domain.objects.bulk_create([Domain(name=f"domain{n}", tld="com") for n in (100002, 100005)])
+        draws = iter([
+            [100001, 100002, 100003, 100004, 100005],  # two are taken
+            [100003, 100006],  # 100003 was drawn already
+            [100007],
+        ])
+        with mock.patch("core.seeding.LOOKUP_CHUNK", 2), \
+                mock.patch("core.seeding.random.sample", side_effect=lambda population, k: next(draws)[:k]):
+            names = unique_names(5)
+        self.assertEqual(names, ["domain100001", "domain100003", "domain100004", "domain100006", "domain100007"])
+
+    def test_seed_drops_in_batches_and_signals_after_commit(self):
+        index.load()
+        version = ChangeCounter.current(VERSION_COUNTER)
+        base = timezone.now()
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            with CaptureQueriesContext(connection) as ctx:
+                seed_drops(5, spacing=timezone.timedelta(0), base_time=base, prefix="seed", batch_size=2)
+        inserts = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(sum('"core_domain"' in sql for sql in inserts), 3)
+        self.assertEqual(sum('"core_drop"' in sql for sql in inserts), 3)
+        self.assertEqual(set(Drop.objects.values_list("drop_time", flat=True)), {base})
+        # Nothing is announced until the transaction commits
+        self.assertFalse(DropEvent.objects.filter(kind="reset").exists())
+        self.assertEqual(ChangeCounter.current(VERSION_COUNTER), version)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(ChangeCounter.current(VERSION_COUNTER), version + 1)
+        self.assertTrue(DropEvent.objects.filter(kind="reset").exists())
+        self.assertEqual(index.registered(Domain.objects.values_list("name", "tld")), set(Domain.objects.values_list("name", "tld")))
+
+
+def legacy_check_response(results):
+    # The response as built before the byte templates, names escaped
+    cds = "".join(f"""
+        <domain:cd>
+          <domain:name avail="{'1' if avail else '0'}">{escape(name)}</domain:name>
+        </domain:cd>""" for name, avail in results)
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<epp xmlns="urn:ietf:params:xml:ns:epp-1.0">
+  <response>
+    <result code="1000">
+      <msg>Command completed successfully</msg>
+    </result>
+    <resData>
+      <domain:chkData xmlns:domain="urn:ietf:params:xml:ns:domain-1.0">{cds}
+      </domain:chkData>
+    </resData>
+  </response>
+</epp>""".encode()
+
+
+def legacy_create_response(name):
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<epp xmlns="urn:ietf:params:xml:ns:epp-1.0">
+  <response>
+    <result code="1000">
+      <msg>Command completed successfully</msg>
+    </result>
+    <resData>
+      <domain:creData xmlns:domain="urn:ietf:params:xml:ns:domain-1.0">
+        <domain:name>{escape(name)}</domain:name>
+      </domain:creData>
+    </resData>
+  </response>
+</epp>""".encode()
+
+
+class EPPCodecTests(TestCase):
+    def test_command_is_found_under_command_or_epp(self):
+        self.assertEqual(parse_command(HELLO).command, "hello")
+        command = parse_command(CHECK)
+        self.assertEqual(command.command, "check")
+        self.assertEqual(command.getall(DOMAIN_NAME), ["free.com"])
+        self.assertIsNone(parse_command(epp_command("")).command)
+        self.assertIsNone(parse_command(b'<epp xmlns="urn:ietf:params:xml:ns:epp-1.0"/>').command)
+
+    def test_other_namespaces_fall_back_to_a_wildcard_search(self):
+        bare = b"<epp><command><check><check><name>a.com</name><name> b.net </name></check></check></command></epp>"
+        command = parse_command(bare)
+        self.assertEqual((command.command, command.getall(DOMAIN_NAME)), ("check", ["a.com", "b.net"]))
+        # In the EPP namespace only the exact tag is searched for
+        command = parse_command(epp_command("<check><name>a.com</name></check>"))
+        command.element = mock.Mock(wraps=command.element, tag=command.element.tag)
+        self.assertEqual(command.getall(DOMAIN_NAME), [])
+        command.element.iterfind.assert_not_called()
+
+    def test_templates_match_the_legacy_responses(self):
+        results = [("free.com", True), ("taken.net", False), ("a&b.com", True), ("<x>.org", False)]
+        self.assertEqual(epp_check_response(results), legacy_check_response(results))
+        self.assertEqual(epp_check_response([]), legacy_check_response([]))
+        for name in ["example.com", "a&b<c>.com"]:
+            response = epp_create_response(name, success=True)
+            self.assertEqual(response, legacy_create_response(name))
+            self.assertEqual(ET.fromstring(response).find(f".//{DOMAIN_NAME}").text, name)
+        names = [el.text for el in ET.fromstring(epp_check_response(results)).iter(DOMAIN_NAME)]
+        self.assertEqual(names, [name for name, _ in results])
+
+
+def epp_frame(payload):
+    return (len(payload) + 4).to_bytes(4, "big") + payload
+
+
+class FrameBufferTests(TestCase):
+    def receive(self, frames, data):
+        """Copy ``data`` in as one read (several if it overflows the free space)."""
+        received = []
+        while data:
+            view = frames.writable()
+            chunk, data = data[:len(view)], data[len(view):]
+            view[:len(chunk)] = chunk
+            received += frames.advance(len(chunk))
+        return received
+
+    def test_length_prefix_split_across_reads(self):
+        frames = FrameBuffer(size=64)
+        data = epp_frame(HELLO)
+        self.assertEqual(self.receive(frames, data[:2]), [])
+        self.assertEqual(self.receive(frames, data[2:10]), [])
+        self.assertEqual(self.receive(frames, data[10:]), [HELLO])
+
+    def test_several_frames_in_one_read(self):
+        frames = FrameBuffer()
+        data = epp_frame(LOGIN) + epp_frame(CHECK) + epp_frame(HELLO)
+        self.assertEqual(self.receive(frames, data + epp_frame(CHECK)[:7]), [LOGIN, CHECK, HELLO])
+        self.assertEqual(self.receive(frames, epp_frame(CHECK)[7:]), [CHECK])
+
+    def test_frame_larger_than_the_buffer_grows_it(self):
+        frames = FrameBuffer(size=16)
+        payload = b"x" * 1000
+        self.assertEqual(self.receive(frames, epp_frame(payload) + epp_frame(HELLO)), [payload, HELLO])
+        self.assertGreaterEqual(len(frames._buffer), len(payload) + 4)
+
+    def test_oversized_frame_is_rejected(self):
+        frames = FrameBuffer(max_frame=100, size=16)
+        self.assertEqual(self.receive(frames, epp_frame(b"y" * 100)), [b"y" * 100])
+        with self.assertRaises(FrameError):
+            self.receive(frames, epp_frame(b"y" * 101))
+        with self.assertRaises(FrameError):
+            self.receive(FrameBuffer(), (3).to_bytes(4, "big"))
+
+
+@override_settings(
+    EPP_REQUIRE_LOGIN=True,
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+)
+class EPPSessionTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar = Registrar(client_id="reg1")
+            registrar.set_password("secret")
+            registrar.save()
+        self.session = Session()
+
+    def tearDown(self):
+        # Frees the registrar's session slot in the process-wide table
+        self.session.close()
+
+    def assertResult(self, response, code):
+        self.assertIn(f'<result code="{code}">'.encode(), response)
+
+    def test_commands_need_login(self):
+        self.assertResult(dispatch(CHECK, self.session), 2002)
+        self.assertResult(dispatch(LOGIN, self.session), 1000)
+        self.assertEqual(self.session.client_id, "reg1")
+        self.assertIn(b'avail="1">free.com', dispatch(CHECK, self.session))
+
+    def test_bad_password_and_inactive_registrar(self):
+        bad = epp_command("<login><clID>reg1</clID><pw>wrong</pw></login>")
+        self.assertResult(dispatch(bad, self.session), 2200)
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar = Registrar.objects.get(client_id="reg1")
+            registrar.is_active = False
+            registrar.save()
+        self.assertResult(dispatch(LOGIN, self.session), 2200)
+        self.assertFalse(self.session.logged_in)
+
+    def test_hello_is_answered_without_queries(self):
+        with self.assertNumQueries(0):
+            response = dispatch(HELLO, self.session)
+        self.assertIn(b"<greeting>", response)
+
+    def test_logout_ends_the_batch(self):
+        logout = epp_command("<logout/>")
+        responses = dispatch_batch([LOGIN, logout, CHECK], self.session)
+        self.assertEqual(len(responses), 2)
+        self.assertResult(responses[1], 1500)
+        self.assertTrue(self.session.closing)
+
+    def test_failing_frame_keeps_the_rest_of_the_batch(self):
+        def create(name):
+            return epp_command(
+                '<create><domain:create xmlns:domain="urn:ietf:params:xml:ns:domain-1.0">'
+                f"<domain:name>{name}</domain:name></domain:create></create>"
+            )
+
+        def broken(command, session):
+            raise RuntimeError("boom")
+
+        frames = [LOGIN, create("good.com"), create("foo.co.uk"), epp_command("<poll/>"), CHECK]
+        with mock.patch.dict("core.epp.commands.HANDLERS", poll=broken), self.assertLogs("core.epp.commands"):
+            responses = dispatch_batch(frames, self.session)
+        self.assertEqual(len(responses), 5)
+        self.assertResult(responses[1], 1000)
+        self.assertResult(responses[2], 2005)
+        self.assertResult(responses[3], 2400)
+        self.assertIn(b'avail="1">free.com', responses[4])
+        self.assertTrue(Domain.objects.filter(name="good", tld="com").exists())
+        self.assertFalse(self.session.closing)
+
+    def update_registrar(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar = Registrar.objects.get(client_id="reg1")
+            for name, value in fields.items():
+                setattr(registrar, name, value)
+            registrar.save()
+
+    def test_throttled_commands_get_2306(self):
+        self.update_registrar(session_rate=0.001, burst=3)
+        self.assertResult(dispatch(LOGIN, self.session), 1000)
+        responses = dispatch_batch([CHECK] * 5, self.session)
+        self.assertEqual([b'code="2306"' in r for r in responses], [False] * 3 + [True] * 2)
+        self.assertResult(dispatch(epp_command("<logout/>"), self.session), 1500)
+
+    def test_registrar_throttle_leaves_the_session_budget(self):
+        self.update_registrar(session_rate=0.001, rate=0.001, burst=3)
+        other = Session()
+        self.addCleanup(other.close)
+        self.assertResult(dispatch(LOGIN, other), 1000)
+        self.assertFalse(any(b'code="2306"' in r for r in dispatch_batch([CHECK] * 3, other)))
+        # The registrar's three tokens are spent
+        self.assertResult(dispatch(LOGIN, self.session), 1000)
+        self.assertTrue(all(b'code="2306"' in r for r in dispatch_batch([CHECK] * 5, self.session)))
+        self.assertAlmostEqual(self.session.bucket.tokens, 3, places=2)
+
+    def test_session_limit_gets_2502(self):
+        self.update_registrar(max_sessions=1)
+        first, second = Session(), Session()
+        self.assertResult(dispatch(LOGIN, first), 1000)
+        self.assertResult(dispatch(LOGIN, second), 2502)
+        self.assertTrue(second.closing)
+        first.close()
+        self.assertResult(dispatch(LOGIN, self.session), 1000)
+
+    def test_commands_are_counted_in_metrics(self):
+        def counters():
+            return metrics.registry.collect().counters
+
+        before = counters()
+        # A thread that has finished still counts once its shard is folded in
+        thread = threading.Thread(target=dispatch_batch, args=([HELLO, b"<epp"], Session()))
+        thread.start()
+        thread.join()
+        dispatch_batch([LOGIN, CHECK], self.session)
+        after = counters()
+        for key, delta in [
+            (("epp_commands_total", (("command", "check"),)), 1),
+            (("epp_commands_total", (("command", "other"),)), 3),
+            (("epp_responses_total", (("code", "1000"),)), 2),
+            (("epp_responses_total", (("code", "2001"),)), 1),
+            (("epp_responses_total", (("code", "greeting"),)), 1),
+        ]:
+            self.assertEqual(after.get(key, 0) - before.get(key, 0), delta, key)
+        text = metrics.registry.render()
+        self.assertIn("# TYPE epp_command_seconds histogram", text)
+        self.assertRegex(text, r'epp_command_seconds_bucket\{command="check",phase="parse",le="\+Inf"\} \d+')
+
+    def test_histogram_buckets_render_in_le_order(self):
+        dispatch_batch([LOGIN, CHECK, HELLO], self.session)
+        metrics.sent(0.003)
+        series = {}
+        lines = metrics.registry.render().splitlines()
+        for i, line in enumerate(lines):
+            match = re.match(r'(\w+)_bucket\{(.*?),?le="([^"]+)"\} \d+$', line)
+            if match:
+                series.setdefault(match.group(1, 2), []).append((i, match.group(3)))
+        self.assertIn(("epp_send_seconds", ""), series)
+        for (name, labels), buckets in series.items():
+            positions = [i for i, _ in buckets]
+            bounds = [float(le) for _, le in buckets]
+            self.assertEqual(positions, list(range(positions[0], positions[0] + len(buckets))), name)
+            self.assertEqual(bounds, sorted(bounds), name)
+            self.assertEqual(bounds[-1], float("inf"), name)
+            suffix = "{" + labels + "}" if labels else ""
+            self.assertTrue(lines[positions[-1] + 1].startswith(f"{name}_sum{suffix} "), name)
+            self.assertTrue(lines[positions[-1] + 2].startswith(f"{name}_count{suffix} "), name)
+
+    def test_closed_sessions_do_not_keep_shards(self):
+        def session():
+            metrics.session_opened()
+            dispatch_batch([HELLO], Session())
+            metrics.session_closed()
+
+        before = metrics.registry.collect().counters
+        shards = len(metrics.registry._shards)
+        for _ in range(50):
+            thread = threading.Thread(target=session)
+            thread.start()
+            thread.join()
+        self.assertLessEqual(len(metrics.registry._shards), shards)
+        after = metrics.registry.collect().counters
+        key = ("epp_sessions_closed_total", ())
+        self.assertEqual(after[key] - before.get(key, 0), 50)
+
+    def test_profiler_writes_pstats_only_while_on(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(EPP_PROFILE_DIR=directory):
+            dispatch_batch([HELLO], self.session)
+            self.assertIsNone(profiler.stop())
+            profiler.start("cprofile", rate=1.0)
+            try:
+                dispatch_batch([HELLO, HELLO], self.session)
+            finally:
+                path = profiler.stop()
+            stats = pstats.Stats(path)
+            calls = {func[2]: stat[1] for func, stat in stats.stats.items()}
+            self.assertEqual(calls["dispatch"], 2)
+
+    def test_plain_sigusr1_toggles_after_an_epp_profile_request(self):
+        # profiler.toggle() is what the SIGUSR1 handler runs
+        with tempfile.TemporaryDirectory() as directory, self.settings(EPP_PROFILE_DIR=directory):
+            try:
+                write_control(action="stop")
+                profiler.toggle()
+                self.assertFalse(profiler.active)
+                profiler.toggle()  # the stop request was used up
+                self.assertTrue(profiler.active)
+                write_control(action="start", mode="stacks", rate=1.0)
+                profiler.toggle()  # a fresh request wins over toggling
+                self.assertTrue(profiler.active)
+                self.assertEqual(profiler.mode, "cprofile")
+                profiler.toggle()
+                self.assertFalse(profiler.active)
+                write_control(action="start", mode="stacks", rate=1.0)
+                with mock.patch("core.epp.profiling.time.time", return_value=time.time() + 60):
+                    profiler.toggle()  # too old for this signal: plain toggle, default mode
+                self.assertEqual(profiler.mode, settings.EPP_PROFILE_MODE)
+            finally:
+                profiler.stop()
+
+    def test_profiler_toggles_under_concurrent_commands(self):
+        errors, done = [], threading.Event()
+
+        def run():
+            session = Session()
+            try:
+                while not done.is_set():
+                    dispatch_batch([HELLO, HELLO], session)
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        with tempfile.TemporaryDirectory() as directory, self.settings(EPP_PROFILE_DIR=directory):
+            try:
+                for _ in range(3):
+                    profiler.start("cprofile", rate=1.0)
+                    time.sleep(0.05)
+                    path = profiler.stop()
+                    self.assertIn("dispatch", {func[2] for func in pstats.Stats(path).stats})
+            finally:
+                done.set()
+                for thread in threads:
+                    thread.join()
+        self.assertEqual(errors, [])
+
+
+def capture_batch(*names):
+    items = "".join(
+        f"<capture><drop:name>{name}</drop:name><drop:delay_ms>50</drop:delay_ms></capture>" for name in names
+    )
+    return f'<epp xmlns:drop="urn:drop"><command>{items}</command></epp>'
+
+
+@override_settings(DROP_EVENTS_POLL_SECONDS=0.01)
+class DropEventStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("alice", password="pw")
+        now = timezone.now()
+        self.drops = [
+            Drop.objects.create(domain=Domain.objects.create(name=f"stream{i}", tld="com"), drop_time=now)
+            for i in range(2)
+        ]
+        record_drop_changes([self.drops[0].pk])
+        self.since = latest_version()
+
+    async def read_until_connected(self, stream):
+        messages = []
+        async for chunk in stream:
+            chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+            if chunk == ": connected\n\n":
+                return messages
+            messages.append(chunk)
+
+    def parse(self, chunk):
+        fields = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+        return int(fields["id"]), fields["event"], json.loads(fields["data"])
+
+    async def get(self, **kwargs):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse("api_drop_events"), **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return response.streaming_content
+
+    async def test_resume_collapses_events_per_drop(self):
+        first, second = self.drops
+        await sync_to_async(record_drop_changes)([first.pk, second.pk, first.pk])
+        await sync_to_async(Drop.objects.filter(pk=first.pk).update)(status="captured", winner="alice")
+        await sync_to_async(record_drop_changes)([first.pk])
+        for kwargs in [{"headers": {"Last-Event-ID": str(self.since)}}, {"data": {"since": self.since}}]:
+            stream = await self.get(**kwargs)
+            messages = [self.parse(chunk) for chunk in await self.read_until_connected(stream)]
+            await stream.aclose()
+            # One message per drop, in the order of their latest events
+            self.assertEqual([data["drop"]["id"] for _, _, data in messages], [second.pk, first.pk])
+            self.assertEqual(messages[-1][0], await sync_to_async(latest_version)())
+            self.assertEqual(messages[-1][2]["drop"]["status"], "captured")
+
+    @override_settings(DROP_EVENTS_RETAIN=2)
+    async def test_client_behind_the_retained_log_gets_reset(self):
+        await sync_to_async(record_drop_changes)([drop.pk for drop in self.drops] * 2)
+        await sync_to_async(prune_drop_events)()
+        stream = await self.get(headers={"Last-Event-ID": str(self.since)})
+        messages = [self.parse(chunk) for chunk in await self.read_until_connected(stream)]
+        await stream.aclose()
+        self.assertEqual([event for _, event, _ in messages], ["reset"])
+
+    async def test_one_poller_feeds_every_stream(self):
+        polls = []
+
+        def load(since):
+            result = load_changes(since)
+            polls.append(result[1])
+            return result
+
+        with mock.patch("core.feed.broadcaster", DropEventBroadcaster()) as shared, \
+                mock.patch("core.feed.load_changes", load):
+            streams = [drop_event_stream(None, "alice") for _ in range(3)]
+            for stream in streams:
+                self.assertEqual(await self.read_until_connected(stream), [])
+            self.assertEqual(len(shared._subscribers), 3)
+            await sync_to_async(record_drop_changes)([self.drops[1].pk])
+            for stream in streams:
+                _, event, data = self.parse(await anext(stream))
+                self.assertEqual((event, data["drop"]["id"]), ("changed", self.drops[1].pk))
+                await stream.aclose()
+        self.assertEqual(len([batch for batch in polls if batch]), 1)
+        self.assertEqual(shared._subscribers, set())
+
+    def test_wsgi_gets_204(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("api_drop_events")).status_code, 204)
+
+
+@mock.patch.dict("os.environ", {"API_TOKEN": "t0ken"})
+class CaptureBatchTests(TestCase):
+    def setUp(self):
+        # The legacy token is read from the environment when the table loads
+        api_tokens.invalidate()
+        now = timezone.now()
+        for i in range(40):
+            domain = Domain.objects.create(name=f"batch{i}", tld="com")
+            Drop.objects.create(domain=domain, drop_time=now + timezone.timedelta(minutes=i))
+
+    async def post(self, body):
+        return await self.async_client.post(
+            reverse("api_capture_batch"), body, content_type="application/xml",
+            headers={"Authorization": "Token t0ken"},
+        )
+
+    async def test_results_per_capture(self):
+        response = await self.post(capture_batch("batch0.com", "nosuch.com", "nodot", "batch1.com"))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        codes = [int(code) for code in re.findall(r'<drop:result code="(\d+)"', body)]
+        self.assertEqual(codes, [1000, 2303, 2002, 1000])
+        self.assertEqual(await Competitor.objects.filter(delay_ms=50).acount(), 2)
+
+    @override_settings(COMPETITOR_MAX_ATTEMPTS=10)
+    async def test_too_many_attempts(self):
+        body = capture_batch("batch0.com", "batch1.com").replace(
+            "<drop:delay_ms>", "<drop:attempts>10</drop:attempts><drop:delay_ms>", 1
+        ).replace("</capture><capture>", "</capture><capture><drop:attempts>11</drop:attempts>")
+        response = await self.post(body)
+        codes = [int(code) for code in re.findall(r'<drop:result code="(\d+)"', response.content.decode())]
+        self.assertEqual(codes, [1000, 2002])
+
+    def test_query_count_is_constant(self):
+        def post(names):
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.post(
+                    reverse("api_capture_batch"), capture_batch(*names), content_type="application/xml",
+                    headers={"Authorization": "Token t0ken"},
+                )
+            return len(ctx.captured_queries)
+        post(["batch0.com"])  # loads the token table
+        small = post(["batch1.com", "batch2.com"])
+        self.assertEqual(post([f"batch{i}.com" for i in range(3, 40)]), small)
+        self.assertEqual(Competitor.objects.count(), 40)
+
+    async def test_requires_token(self):
+        response = await self.async_client.post(
+            reverse("api_capture_batch"), capture_batch("batch0.com"), content_type="application/xml",
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+@mock.patch.dict("os.environ", {"API_TOKEN": "legacy"})
+class ApiTokenTests(TestCase):
+    def setUp(self):
+        api_tokens.invalidate()
+        self.token, prefix, digest = generate_token()
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar = Registrar.objects.create(client_id="reg1", password="!")
+            self.api_token = ApiToken.objects.create(registrar=registrar, prefix=prefix, digest=digest)
+
+    def test_registrar_and_legacy_tokens(self):
+        self.assertEqual(api_tokens.authenticate(self.token), "reg1")
+        self.assertEqual(api_tokens.authenticate("legacy"), "API_TOKEN")
+        self.assertIsNone(api_tokens.authenticate(self.token[:-1] + "x"))
+        self.assertIsNone(api_tokens.authenticate(""))
+
+    def test_revoked_token_is_rejected_without_restart(self):
+        self.assertEqual(api_tokens.authenticate(self.token), "reg1")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api_token.is_active = False
+            self.api_token.save()
+        self.assertIsNone(api_tokens.authenticate(self.token))
+
+
+class RecordingTests(TestCase):
+    def test_log_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/epp.log"
+            recorder = Recorder(path)
+            session = recorder.open_session()
+            recorder.frames(session, [LOGIN, CHECK])
+            recorder.responses(session, [b'<result code="1000">', b'<result code="2306">'])
+            recorder.close_session(session)
+            recorder.close()
+            offset, records = read_log(path)
+            records = list(records)
+        self.assertEqual([r.kind for r in records], [OPEN, FRAME, FRAME, RESPONSE, RESPONSE, CLOSE])
+        self.assertEqual({r.session for r in records}, {session})
+        self.assertEqual([r.payload for r in records[1:5]], [LOGIN, CHECK, b"1000", b"2306"])
+        self.assertEqual([r.seq for r in records], [0, 1, 2, 1, 2, 0])
+        self.assertEqual(sorted(records, key=lambda r: r.ts), records)
+        self.assertAlmostEqual((records[0].ts + offset) / 1e9, time.time(), delta=60)
+
+
+class RaceSchedulerTests(TransactionTestCase):
+    # The scheduler settles on its own thread, which must see committed rows
+
+    def setUp(self):
+        self.scheduler = RaceScheduler()
+        self.domain = Domain.objects.create(name="racetest", tld="com")
+
+    def due_drop(self, ago_ms, *delays):
+        drop = Drop.objects.create(domain=self.domain, drop_time=timezone.now() - timezone.timedelta(milliseconds=ago_ms))
+        for i, delay in enumerate(delays):
+            Competitor.objects.create(drop=drop, name=f"bot{i}", delay_ms=delay)
+        return drop
+
+    def enter(self, drop, name):
+        return self.scheduler.enter(drop, name, lambda won: won)
+
+    def test_client_ahead_of_the_competitors_wins(self):
+        drop = self.due_drop(0, 300, 400)
+        first, second = self.enter(drop, "me"), self.enter(drop, "you")
+        self.assertIs(first.result(timeout=5), True)
+        self.assertIs(second.result(timeout=5), False)
+        drop.refresh_from_db()
+        self.assertEqual((drop.status, drop.winner), ("captured", "me"))
+
+    def test_late_client_loses(self):
+        drop = self.due_drop(500, 50)
+        self.assertIs(self.enter(drop, "me").result(timeout=5), False)
+        drop.refresh_from_db()
+        self.assertEqual(drop.winner, "bot0")
+        # Once settled, a straggler still gets an answer
+        self.assertIs(self.enter(drop, "late").result(timeout=5), False)
+
+    def test_ties_go_to_the_competitor(self):
+        drop = self.due_drop(0, 100)
+        race = Race(drop, [(100, "bot0")])
+        race.entries = [(100.0, "me", None), (99.0, "early", "entry")]
+        self.assertEqual(race.winner(), ("early", "entry"))
+        race.entries = [(100.0, "me", None)]
+        self.assertEqual(race.winner(), ("bot0", None))
+
+
+def send_frames_to(sock, *payloads):
+    sock.sendall(b"".join(epp_frame(payload) for payload in payloads))
+
+
+def read_frame(sock):
+    header = b""
+    while len(header) < 4:
+        chunk = sock.recv(4 - len(header))
+        if not chunk:
+            return None
+        header += chunk
+    payload = b""
+    length = int.from_bytes(header, "big") - 4
+    while len(payload) < length:
+        payload += sock.recv(length - len(payload))
+    return payload
+
+
+def create_frame(name):
+    return epp_command(
+        '<create><domain:create xmlns:domain="urn:ietf:params:xml:ns:domain-1.0">'
+        f"<domain:name>{name}</domain:name></domain:create></create>"
+    )
+
+
+@override_settings(
+    EPP_REQUIRE_LOGIN=True,
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+)
+class EPPServerTests(TransactionTestCase):
+    # The servers do their ORM work on pool threads, which must see committed rows
+
+    def setUp(self):
+        registrar = Registrar(client_id="reg1")
+        registrar.set_password("secret")
+        registrar.save()
+        credentials.invalidate()
+        self.db_pool = DatabasePool(2)
+        self.addCleanup(self.db_pool.close)
+
+    def serve_asyncio(self):
+        started = threading.Event()
+        state = {}
+
+        def on_start(server):
+            state.update(server=server, loop=asyncio.get_running_loop())
+            started.set()
+
+        def run():
+            try:
+                asyncio.run(aio.serve("127.0.0.1", 0, self.db_pool, started=on_start))
+            except asyncio.CancelledError:
+                pass
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.assertTrue(started.wait(5))
+
+        def stop():
+            state["loop"].call_soon_threadsafe(state["server"].close)
+            thread.join(5)
+        self.addCleanup(stop)
+        return state["server"].sockets[0].getsockname()
+
+    def connect(self, address):
+        sock = socket.create_connection(address, timeout=5)
+        self.addCleanup(sock.close)
+        self.assertIn(b"<greeting>", read_frame(sock))
+        return sock
+
+    def test_asyncio_session(self):
+        sock = self.connect(self.serve_asyncio())
+        send_frames_to(sock, LOGIN)
+        self.assertIn(b'<result code="1000">', read_frame(sock))
+        # Pipelined: both frames in one write, answered in order
+        send_frames_to(sock, CHECK, create_frame("aiotest.com"))
+        self.assertIn(b'avail="1">free.com', read_frame(sock))
+        self.assertIn(b"<domain:name>aiotest.com</domain:name>", read_frame(sock))
+        send_frames_to(sock, epp_command("<logout/>"))
+        self.assertIn(b'<result code="1500">', read_frame(sock))
+        self.assertIsNone(read_frame(sock))
+        self.assertTrue(Domain.objects.filter(name="aiotest", tld="com").exists())
+
+    def test_thread_engine_keeps_orm_work_on_the_pool(self):
+        opened = []
+
+        def track(sender, connection, **kwargs):
+            opened.append((threading.current_thread().name, connection))
+
+        connection_created.connect(track)
+        self.addCleanup(connection_created.disconnect, track)
+        server = EPPTCPServer(("127.0.0.1", 0), EPPHandler)
+        server.db_pool, server.recorder = self.db_pool, None
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            for i in range(20):
+                sock = self.connect(server.server_address)
+                send_frames_to(sock, LOGIN, CHECK, create_frame(f"pooltest{i}.com"), epp_command("<logout/>"))
+                responses = [read_frame(sock) for _ in range(4)]
+                self.assertIn(b"<domain:name>pooltest", responses[2])
+                sock.close()
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+        self.assertTrue(opened)
+        self.assertEqual({name.split("_")[0] for name, _ in opened}, {"epp-db"})
+        self.assertLessEqual(len({id(conn) for _, conn in opened}), self.db_pool.size)
+        # SQLite keeps an in-memory test database open on close(): record the calls
+        wrapper = type(opened[0][1])
+        with mock.patch.object(wrapper, "close", autospec=True, side_effect=wrapper.close) as close:
+            self.db_pool.close()
+        closed = {id(call.args[0]) for call in close.call_args_list}
+        self.assertLessEqual({id(conn) for _, conn in opened}, closed)
+
+    def test_replay_pairs_responses_with_their_frames(self):
+        logout = epp_command("<logout/>")
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/epp.log"
+            recorder = Recorder(path)
+            session = recorder.open_session()
+            put = recorder._put
+
+            def drop_check(item):
+                # As if the queue were full when the <check> frame arrived
+                if item[3] == FRAME and item[4] == CHECK:
+                    recorder.dropped += 1
+                else:
+                    put(item)
+
+            with mock.patch.object(recorder, "_put", side_effect=drop_check):
+                recorder.frames(session, [LOGIN, CHECK, create_frame("replaytest.com"), logout])
+            recorder.responses(session, [
+                b'<result code="1000">', b'<result code="1000">', b'<result code="1000">', b'<result code="1500">',
+            ])
+            recorder.close_session(session)
+            recorder.close()
+            host, port = self.serve_asyncio()
+            out = io.StringIO()
+            call_command("epp_replay", path, "--host", host, "--port", str(port), "--speed", "100", stdout=out, stderr=io.StringIO())
+        report = json.loads(out.getvalue())
+        self.assertEqual(report["incomplete_sessions"], 1)
+        self.assertEqual(report["commands"], 3)
+        # Paired by position, <logout> would have been compared with the create's 1000
+        self.assertEqual(report["outcomes"], {"same": 3, "changed": {}, "unrecorded": 0})
+        self.assertEqual(report["errors"], [])
+        self.assertTrue(Domain.objects.filter(name="replaytest", tld="com").exists())
+
+    @override_settings(EPP_IDLE_TIMEOUT=0.2)
+    def test_asyncio_idle_timeout(self):
+        sock = self.connect(self.serve_asyncio())
+        started = time.monotonic()
+        self.assertIsNone(read_frame(sock))
+        self.assertLess(time.monotonic() - started, 3)
+
+
+class EPPTCPServerTests(TestCase):
+    def test_stop_ends_idle_sessions(self):
+        finished = threading.Event()
+
+        class Idle(socketserver.BaseRequestHandler):
+            def handle(self):
+                self.request.recv(1)
+
+            def finish(self):
+                finished.set()
+
+        server = EPPTCPServer(("127.0.0.1", 0), Idle)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        client = socket.create_connection(server.server_address)
+        self.addCleanup(client.close)
+        deadline = time.monotonic() + 5
+        while not server.clients and time.monotonic() < deadline:
+            time.sleep(0.01)
+        server.shutdown()
+        thread.join()
+        server.close_clients()
+        started = time.monotonic()
+        server.server_close()
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertTrue(finished.is_set())
+        self.assertEqual(server.clients, set())
+
+
+class WorkerLoggingTests(TestCase):
+    def test_crashed_worker_traceback_reaches_the_file(self):
+        def crash(slot):
+            raise RuntimeError("boom")
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/worker.log"
+            handler = AsyncFileHandler(path)
+            workers_logger = logging.getLogger("core.epp.workers")
+            workers_logger.addHandler(handler)
+            try:
+                pid = Supervisor(1, crash)._spawn(0)
+                _, status = os.waitpid(pid, 0)
+            finally:
+                workers_logger.removeHandler(handler)
+                handler.close()
+            self.assertEqual(os.waitstatus_to_exitcode(status), 1)
+            with open(path) as f:
+                text = f.read()
+        self.assertIn("EPP worker 0 crashed", text)
+        self.assertIn("RuntimeError: boom", text)
+
+
+class DropSimulationTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("alice", password="pw"))
+        domain = Domain.objects.create(name="simtest", tld="com")
+        self.drop = Drop.objects.create(domain=domain, drop_time=timezone.now())
+        Competitor.objects.create(drop=self.drop, name="fast", attempts=1, delay_ms=60)
+        Competitor.objects.create(drop=self.drop, name="spray", attempts=5, delay_ms=90)
+        self.url = reverse("api_drop_simulation", args=[self.drop.pk])
+
+    def win_probabilities(self, **params):
+        response = self.client.get(self.url, {"seed": 1, "trials": 2000, **params})
+        self.assertEqual(response.status_code, 200)
+        return {c["name"]: c["win_probability"] for c in response.json()["competitors"]}
+
+    def test_without_jitter_the_fastest_always_wins(self):
+        # The deterministic race that settlement runs
+        self.assertEqual(self.win_probabilities(jitter_ms=0, release_window_ms=0), {"fast": 1.0, "spray": 0.0})
+
+    def test_attempts_cover_the_release_window(self):
+        wins = self.win_probabilities()
+        self.assertGreater(wins["spray"], wins["fast"])
+        self.assertAlmostEqual(sum(wins.values()), 1.0, places=3)
+
+    def test_delay_override_and_bad_input(self):
+        wins = self.win_probabilities(jitter_ms=0, release_window_ms=0, delay=["spray:10"])
+        self.assertEqual(wins, {"fast": 0.0, "spray": 1.0})
+        self.assertEqual(self.client.get(self.url, {"trials": 10 ** 9}).status_code, 400)
+        for delay in ["spray", ":5", "newbot:5"]:
+            self.assertEqual(self.client.get(self.url, {"delay": delay}).status_code, 400, delay)
+
+    def test_non_finite_and_out_of_range_timings_are_rejected(self):
+        for key in ["jitter_ms", "spacing_ms", "release_window_ms"]:
+            for value in ["nan", "inf", "-inf", "-1", "1e9"]:
+                response = self.client.get(self.url, {key: value})
+                self.assertEqual(response.status_code, 400, (key, value))
+                self.assertIn(key, response.json()["error"])
+
+    def test_shared_competitor_name_cannot_be_overridden(self):
+        Competitor.objects.create(drop=self.drop, name="spray", attempts=1, delay_ms=5)
+        response = self.client.get(self.url, {"delay": "spray:10"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("several competitors", response.json()["error"])
+        self.assertEqual(self.client.get(self.url, {"delay": "fast:10"}).status_code, 200)
+        with self.assertRaisesMessage(CommandError, "several competitors"):
+            call_command("simulate_drop", str(self.drop.pk), "--sweep", "spray", stdout=io.StringIO())
+
+    @override_settings(COMPETITOR_MAX_ATTEMPTS=10, SIMULATION_MAX_SAMPLES=1000)
+    def test_attempts_are_clamped_and_batches_capped(self):
+        Competitor.objects.filter(name="spray").update(attempts=10 ** 9)
+        batches = []
+        rng = np.random.default_rng(1)
+
+        def normal(loc, scale, size):
+            batches.append(size)
+            return rng.normal(loc, scale, size)
+
+        recording = mock.Mock(wraps=rng, normal=normal)
+        with mock.patch("core.simulation.np.random.default_rng", return_value=recording):
+            response = self.client.get(self.url, {"seed": 1, "trials": 500})
+        spray = response.json()["competitors"][1]
+        self.assertEqual(spray["attempts"], 10)
+        self.assertEqual(batches[0], (90, 11))
+        self.assertEqual(sum(n for n, _ in batches), 500)
+
+
+@override_settings(SETTLEMENT_GRACE_SECONDS=2.0)
+class SettlementTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+
+    def drop(self, name, seconds_ago, *delays, clear_after_minutes=5):
+        domain = Domain.objects.create(name=name, tld="com")
+        drop = Drop.objects.create(
+            domain=domain, drop_time=self.now - timezone.timedelta(seconds=seconds_ago),
+            clear_after_minutes=clear_after_minutes,
+        )
+        for i, delay in enumerate(delays):
+            Competitor.objects.create(drop=drop, name=f"{name}-bot{i}", delay_ms=delay)
+        return drop
+
+    def test_grace_period_then_fastest_competitor_wins(self):
+        # Fastest competitor at 0.5s: in grace until 2.5s after the drop
+        waiting = self.drop("waiting", 2.4, 900, 500)
+        due = [self.drop(f"due{i}", 2.6, 900, 500) for i in range(3)]
+        unclaimed = self.drop("unclaimed", 61, clear_after_minutes=1)
+        events = DropEvent.objects.count()
+        # batch_size=2 takes bulk_update through more than one batch
+        self.assertEqual(settle_due_drops(now=self.now, batch_size=2), 4)
+        waiting.refresh_from_db()
+        self.assertEqual((waiting.status, waiting.winner), ("pending", None))
+        for drop in due:
+            drop.refresh_from_db()
+            self.assertEqual((drop.status, drop.winner), ("captured", f"{drop.domain.name}-bot1"))
+        unclaimed.refresh_from_db()
+        self.assertEqual((unclaimed.status, unclaimed.winner), ("missed", None))
+        self.assertEqual(
+            sorted(DropEvent.objects.order_by("id")[events:].values_list("drop_id", flat=True)),
+            sorted(drop.pk for drop in [*due, unclaimed]),
+        )
+        self.assertEqual(settle_due_drops(now=self.now), 0)
+
+
+class SimClockTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with self.settings(SIM_CLOCK_FILE=f"{directory.name}/clock.json", SIM_CLOCK_SPEED=1000.0):
+            self.clock = SimClock()
+
+    def test_runs_at_speed_and_is_shared_through_the_file(self):
+        start = self.clock.now()
+        time.sleep(0.01)
+        self.assertGreaterEqual((self.clock.now() - start).total_seconds(), 10)
+        with self.settings(SIM_CLOCK_FILE=self.clock.path):
+            other = SimClock()
+        target = timezone.now() + timezone.timedelta(days=3)
+        self.clock.set(target, speed=1.0)
+        self.assertAlmostEqual(other.now().timestamp(), target.timestamp(), delta=1)
+        self.assertEqual(other.speed, 1.0)
+
+    def test_jump_to_next_drop_waits_for_races(self):
+        self.clock.set(timezone.now(), speed=1.0)
+        domain = Domain.objects.create(name="clocktest", tld="com")
+        later = Drop.objects.create(domain=domain, drop_time=self.clock.now() + timezone.timedelta(hours=2))
+        due = Drop.objects.create(domain=domain, drop_time=self.clock.now() - timezone.timedelta(seconds=1))
+        Competitor.objects.create(drop=due, name="bot", delay_ms=100)
+        with mock.patch("core.settlement.clock", self.clock):
+            self.assertIsNone(jump_to_next_drop())
+            Drop.objects.filter(pk=due.pk).update(status="captured")
+            self.assertEqual(jump_to_next_drop(lead=5), later.drop_time - timezone.timedelta(seconds=5))
+            self.assertAlmostEqual((later.drop_time - self.clock.now()).total_seconds(), 5, delta=1)
@@ -5,5 +5,8 @@ urlpatterns = [
     path('', views.dashboard, name='home'),  # This makes / show the dashboard
     path('dashboard/', views.dashboard, name='dashboard'),
     path('api/capture/', views.api_capture, name='api_capture'),
+    path('api/capture/batch/', views.api_capture_batch, name='api_capture_batch'),
     path('api/recent-drops/', views.api_recent_drops, name='api_recent_drops'),
+    path('api/drop-events/', views.api_drop_events, name='api_drop_events'),
+    path('api/drops/<int:drop_id>/simulation/', views.api_drop_simulation, name='api_drop_simulation'),
 ]
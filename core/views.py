@@ -18,6 +18,8 @@ def api_add_competitor(request):
         delay_ms = int(data.get("delay_ms", 100))
         if not drop_id or not name:
             raise ValueError("Missing drop_id or name")
+        if attempts > settings.COMPETITOR_MAX_ATTEMPTS:
+            raise ValueError(f"attempts must be at most {settings.COMPETITOR_MAX_ATTEMPTS}")
     except Exception as e:
         return JsonResponse({"error": f"Invalid input: {e}"}, status=400)
     try:
@@ -35,75 +37,113 @@ from django.utils.timesince import timesince
 from django.contrib.auth.decorators import login_required as _login_required
 from django.utils.decorators import method_decorator
 from django.views.decorators.http import require_GET
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_cookie
+from django.core.cache import cache
+from django.conf import settings
+import hashlib
+from .feed import current_version, drop_event_stream, normalize_sort, project, recent_drops, serialize_drop, display_status
+def _recent_drops_variant(request):
+    # The body depends only on the change-log version, the sort and the user's projection
+    version, _ = current_version()
+    sort, order = normalize_sort(request.GET.get("sort"), request.GET.get("order"))
+    user = hashlib.sha1(request.user.get_username().encode()).hexdigest()[:12]
+    return version, sort, order, user
+
+def _recent_drops_etag(request):
+    return "-".join(str(part) for part in _recent_drops_variant(request))
+
+def _recent_drops_last_modified(request):
+    return current_version()[1]
+
 @require_GET
 @_login_required
+@vary_on_cookie
+@condition(etag_func=_recent_drops_etag, last_modified_func=_recent_drops_last_modified)
 def api_recent_drops(request):
-    # --- Automatic capture logic (same as dashboard) ---
-    from django.utils import timezone
-    from django.db import transaction
-    now = timezone.now()
-    with transaction.atomic():
-        for drop in Drop.objects.select_for_update().filter(status="pending", drop_time__lte=now):
-            competitors = list(drop.competitors.all())
-            if competitors:
-                winner = min(competitors, key=lambda c: c.delay_ms)
-                drop.status = "captured"
-                drop.winner = winner.name
-                drop.save()
-            else:
-                clear_time = drop.drop_time + timezone.timedelta(minutes=drop.clear_after_minutes)
-                if now >= clear_time:
-                    drop.status = "missed"
-                    drop.winner = None
-                    drop.save()
-    sort = request.GET.get("sort", "drop_time")
-    order = request.GET.get("order", "asc")
-    if sort not in ("drop_time", "created_at"): sort = "drop_time"
-    if order not in ("asc", "desc"): order = "asc"
-    sort_prefix = "" if order == "asc" else "-"
-    drops = Drop.objects.order_by(f"{sort_prefix}{sort}")[:20]
-    my_name = request.user.username if request.user.is_authenticated else None
-    drop_list = []
-    import pytz
-    from django.conf import settings
-    # Use BST (Europe/London with DST)
-    tz = pytz.timezone("Europe/London")
-    for drop in drops:
-        if drop.status == "captured" and drop.winner != my_name:
-            drop_status = "missed"
-        elif drop.status == "captured" and drop.winner == my_name:
-            drop_status = "captured"
-        else:
-            drop_status = drop.status
-        drop_time_bst = drop.drop_time.astimezone(tz)
-        created_at_bst = drop.created_at.astimezone(tz)
-        # For datetime-local input: yyyy-MM-ddTHH:mm:ss
-        drop_time_iso = drop_time_bst.strftime("%Y-%m-%dT%H:%M:%S")
-        drop_list.append({
-            "id": drop.id,
-            "domain": str(drop.domain),
-            "drop_time": drop_time_bst.strftime("%I:%M:%S %p"),
-            "drop_time_iso": drop_time_iso,
-            "created_at": created_at_bst.strftime("%I:%M:%S %p"),
-            "status": drop_status,
-            "winner": drop.winner or "-",
-            "competitors": [
-                {"name": c.name, "attempts": c.attempts, "delay_ms": c.delay_ms}
-                for c in drop.competitors.all()
-            ]
-        })
-    import json
-    return HttpResponse(json.dumps({"drops": drop_list}), content_type="application/json")
+    # Due drops are settled by the settle_drops worker (or run_eppserver); this view only reads.
+    # Unchanged polls end in a 304 from @condition before reaching here.
+    version, sort, order, user = _recent_drops_variant(request)
+    cache_key = f"drops:list:{version}:{sort}:{order}:{user}"
+    body = cache.get(cache_key)
+    if body is None:
+        my_name = request.user.username if request.user.is_authenticated else None
+        drop_list = [project(serialize_drop(drop), my_name) for drop in recent_drops(sort, order)]
+        body = json.dumps({"drops": drop_list, "version": version})
+        cache.set(cache_key, body, settings.RECENT_DROPS_CACHE_SECONDS)
+    response = HttpResponse(body, content_type="application/json")
+    # Let the browser keep the body but revalidate it on every poll
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+# Monte Carlo race simulation for one drop, e.g. to tune a bot's delay_ms.
+# ?delay=name:120 (repeatable) tries another delay_ms for a competitor.
+@require_GET
+@_login_required
+def api_drop_simulation(request, drop_id):
+    drop = Drop.objects.filter(pk=drop_id).first()
+    if drop is None:
+        return JsonResponse({"error": "Drop not found."}, status=404)
+    try:
+        params = {
+            key: type(default)(request.GET.get(key, default)) for key, default in simulation.DEFAULTS.items()
+        }
+        seed = request.GET.get("seed")
+        params["seed"] = int(seed) if seed else None
+        overrides = {}
+        for value in request.GET.getlist("delay"):
+            name, _, delay = value.rpartition(":")
+            if not name:
+                raise ValueError("delay must be name:ms")
+            overrides[name] = int(delay)
+        if not 1 <= params["trials"] <= settings.SIMULATION_MAX_TRIALS:
+            raise ValueError(f"trials must be between 1 and {settings.SIMULATION_MAX_TRIALS}")
+        simulation.check_params(params["jitter_ms"], params["spacing_ms"], params["release_window_ms"])
+        competitors = simulation.drop_competitors(drop, overrides, add_new=False)
+    except ValueError as e:
+        return JsonResponse({"error": f"Invalid input: {e}"}, status=400)
+    report = simulation.simulate(competitors, **params)
+    report["drop"] = drop.pk
+    return JsonResponse(report)
+
+# Server-sent events: pushes drop/competitor changes as they happen.
+# Needs an ASGI server (eppmock.asgi); under WSGI it answers 204 and the dashboard keeps polling.
+@require_GET
+@_login_required
+async def api_drop_events(request):
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    since = request.headers.get("Last-Event-ID") or request.GET.get("since")
+    since = int(since) if since and since.isdigit() else None
+    user = await request.auser()
+    response = StreamingHttpResponse(drop_event_stream(since, user.username), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
+import logging
 import os
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape
+from asgiref.sync import sync_to_async
+from .capture import capture_response, parse_captures, register_captures
+from .credentials import api_tokens
+from . import simulation
 # ...existing code...
 
+# Sampled and written off-thread (see LOGGING in settings)
+access_log = logging.getLogger("core.access")
+
+def _api_token_owner(request):
+    # Registrar client_id for a valid "Authorization: Token ..." header, else None
+    return api_tokens.authenticate(request.headers.get("Authorization", "").removeprefix("Token "))
+
 # API endpoint for external capture requests
 @csrf_exempt
 def api_capture(request):
-    import logging
-    logging.info("Received a request at /api/capture/ from %s", request.META.get('REMOTE_ADDR'))
     if request.method != "POST":
         return HttpResponse("""
 <epp xmlns:drop="urn:drop">
@@ -114,9 +154,9 @@ def api_capture(request):
     </response>
 </epp>
 """, content_type="application/xml", status=405)
-    api_token = os.environ.get("API_TOKEN")
-    auth = request.headers.get("Authorization", "").replace("Token ", "")
-    if not api_token or auth != api_token:
+    owner = _api_token_owner(request)
+    access_log.info("capture from %s by %s", request.META.get("REMOTE_ADDR"), owner or "-")
+    if owner is None:
         return HttpResponse("""
 <epp xmlns:drop="urn:drop">
     <response>
@@ -126,7 +166,6 @@ def api_capture(request):
     </response>
 </epp>
 """, content_type="application/xml", status=401)
-    from xml.etree import ElementTree as ET
     try:
         xml = ET.fromstring(request.body.decode())
         ns = {'drop': 'urn:drop'}
@@ -143,7 +182,8 @@ def api_capture(request):
             raise Exception("Missing <drop:name>")
         attempts = int(attempts) if attempts and attempts.isdigit() else 1
         delay_ms = int(delay_ms) if delay_ms and delay_ms.isdigit() else 100
-        from .models import Drop, Competitor
+        if attempts > settings.COMPETITOR_MAX_ATTEMPTS:
+            raise Exception(f"<drop:attempts> must be at most {settings.COMPETITOR_MAX_ATTEMPTS}")
         # Split domain_name into name and tld
         if '.' not in domain_name:
             raise Exception("Invalid domain format")
@@ -197,33 +237,74 @@ def api_capture(request):
     </response>
 </epp>
 """, content_type="application/xml", status=404)
+# Batch variant of api_capture: many <capture> elements in one POST, answered together.
+# Async: all pending drops come from one query and the competitors from one bulk insert.
+@csrf_exempt
+async def api_capture_batch(request):
+    if request.method != "POST":
+        return HttpResponse("""
+<epp xmlns:drop="urn:drop">
+    <response>
+        <result code="2001">
+            <msg>POST required</msg>
+        </result>
+    </response>
+</epp>
+""", content_type="application/xml", status=405)
+    owner = await sync_to_async(_api_token_owner)(request)
+    access_log.info("capture batch from %s by %s", request.META.get("REMOTE_ADDR"), owner or "-")
+    if owner is None:
+        return HttpResponse("""
+<epp xmlns:drop="urn:drop">
+    <response>
+        <result code="2200">
+            <msg>Unauthorized</msg>
+        </result>
+    </response>
+</epp>
+""", content_type="application/xml", status=401)
+    try:
+        captures = parse_captures(request.body)
+        if len(captures) > settings.CAPTURE_BATCH_MAX:
+            raise ValueError(f"At most {settings.CAPTURE_BATCH_MAX} captures per request")
+    except ValueError as e:
+        return HttpResponse(f"""
+<epp xmlns:drop="urn:drop">
+    <response>
+        <result code="2002">
+            <msg>Invalid input: {escape(str(e))}</msg>
+        </result>
+    </response>
+</epp>
+""", content_type="application/xml", status=400)
+    captures = await register_captures(captures)
+    return HttpResponse(capture_response(captures), content_type="application/xml")
+
 from django.shortcuts import render, redirect
 from django import forms
 from .models import Domain, Drop, Competitor
-from django.db.models import F
+from django.db.models import F, Q
 
 from django.utils import timezone
-from django.db import transaction
 from django.contrib.auth.decorators import login_required
-import random
+from .clock import clock
+from .seeding import seed_drops
 
 # Create your views here.
 
-TLD_CHOICES = ["com", "net", "org", "uk", "eu", "info", "io", "co"]
-
 class DomainForm(forms.ModelForm):
     class Meta:
         model = Domain
         fields = ["name", "tld"]
 
 class RandomDomainForm(forms.Form):
-    count = forms.IntegerField(min_value=1, max_value=100, initial=5, label="Number of random domains")
+    count = forms.IntegerField(min_value=1, max_value=10000, initial=5, label="Number of random domains")
     clear_after_minutes = forms.IntegerField(min_value=1, max_value=60, initial=5, label="Clear After (minutes)")
 
 class CompetitorForm(forms.Form):
-    drop = forms.ModelChoiceField(queryset=Drop.objects.all())
+    drop = forms.ModelChoiceField(queryset=Drop.objects.select_related("domain"))
     name = forms.CharField(max_length=255)
-    attempts = forms.IntegerField(min_value=1, initial=1)
+    attempts = forms.IntegerField(min_value=1, max_value=settings.COMPETITOR_MAX_ATTEMPTS, initial=1)
 
 @login_required
 def dashboard(request):
@@ -232,69 +313,38 @@ def dashboard(request):
     competitor_form = CompetitorForm()
     message = None
 
-    # --- Automatic capture logic ---
-    now = timezone.now()
+    # Due drops are settled by the settle_drops worker (or run_eppserver), not here
     my_name = request.user.username if request.user.is_authenticated else None
-    with transaction.atomic():
-        for drop in Drop.objects.select_for_update().filter(status="pending", drop_time__lte=now):
-            competitors = list(drop.competitors.all())
-            if competitors:
-                winner = min(competitors, key=lambda c: c.delay_ms)
-                drop.status = "captured"
-                drop.winner = winner.name
-            else:
-                drop.status = "missed"
-                drop.winner = None
-            drop.save()
 
     # Sorting logic for drops
-    sort = request.GET.get("sort", "drop_time")
-    order = request.GET.get("order", "asc")
-    if sort not in ("drop_time", "created_at"): sort = "drop_time"
-    if order not in ("asc", "desc"): order = "asc"
-    sort_prefix = "" if order == "asc" else "-"
-    drops = list(Drop.objects.order_by(f"{sort_prefix}{sort}")[:20])
-    for drop in drops:
-        if drop.status == "captured" and drop.winner != my_name:
-            drop.status = "missed"
-            drop.save(update_fields=["status"])
-            drop.display_status = "missed"
-        elif drop.status == "captured" and drop.winner == my_name:
-            drop.display_status = "captured"
-        else:
-            drop.display_status = drop.status
+    drops = recent_drops(request.GET.get("sort", "drop_time"), request.GET.get("order", "asc"))
 
     if request.method == "POST":
         if "remove_missed_drops" in request.POST:
-            removed_count, _ = Drop.objects.filter(status="missed").delete()
+            # Includes drops captured by someone else, which this user missed
+            missed = Q(status="missed") | (Q(status="captured") & ~Q(winner=my_name))
+            removed_count, _ = Drop.objects.filter(missed).delete()
             message = f"Removed {removed_count} missed drops."
         elif "add_domain" in request.POST:
             domain_form = DomainForm(request.POST)
             if domain_form.is_valid():
                 domain = domain_form.save()
                 last_drop = Drop.objects.order_by('-drop_time').first()
-                base_time = last_drop.drop_time if last_drop else timezone.now()
+                base_time = last_drop.drop_time if last_drop else clock.now()
                 drop_time = base_time + timezone.timedelta(minutes=2)
                 Drop.objects.create(domain=domain, drop_time=drop_time)
                 message = "Domain added and ready for catch."
             # Refresh drops list after add
-            drops = list(Drop.objects.order_by("-created_at")[:20])
+            drops = recent_drops("created_at", "desc")
         elif "generate_domains" in request.POST:
             random_form = RandomDomainForm(request.POST)
             if random_form.is_valid():
                 count = random_form.cleaned_data["count"]
                 clear_after = random_form.cleaned_data["clear_after_minutes"]
-                last_drop = Drop.objects.order_by('-drop_time').first()
-                base_time = last_drop.drop_time if last_drop else timezone.now()
-                for i in range(count):
-                    name = "domain" + str(random.randint(10000, 99999))
-                    tld = random.choice(TLD_CHOICES)
-                    domain = Domain.objects.create(name=name, tld=tld)
-                    drop_time = base_time + timezone.timedelta(minutes=2 * (i + 1))
-                    Drop.objects.create(domain=domain, drop_time=drop_time, clear_after_minutes=clear_after)
+                seed_drops(count, clear_after_minutes=clear_after)
                 message = f"{count} random domains generated and ready for catch."
             # Refresh drops list after generate
-            drops = list(Drop.objects.order_by("-created_at")[:20])
+            drops = recent_drops("created_at", "desc")
         elif "edit_drop_time" in request.POST:
             drop_id = request.POST.get('drop_id')
             new_time = request.POST.get('new_drop_time')
@@ -342,7 +392,9 @@ def dashboard(request):
 
     domains = Domain.objects.all().order_by("-created_at")[:20]
     # drops already set above
-    competitors = Competitor.objects.all().order_by("-created_at")[:20]
+    for drop in drops:
+        drop.display_status = display_status(drop, my_name)
+    competitors = Competitor.objects.select_related("drop__domain").order_by("-created_at")[:20]
 
     return render(request, "core/dashboard.html", {
         "domain_form": domain_form,
@@ -101,6 +101,106 @@ else:
             'NAME': BASE_DIR / 'db.sqlite3',
         }
     }
+# Opt-in high-concurrency SQLite profile: DJANGO_SQLITE_PROFILE=concurrent
+SQLITE_CONCURRENT_OPTIONS = {
+    # Applied on every new connection. WAL lets readers run alongside the writer;
+    # synchronous=NORMAL is durable across app crashes in WAL mode.
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA busy_timeout=20000;'
+        'PRAGMA mmap_size=268435456;'
+        'PRAGMA cache_size=-65536;'
+        'PRAGMA temp_store=MEMORY;'
+    ),
+    # Take the write lock at BEGIN: concurrent writers then wait on busy_timeout
+    # instead of failing with "database is locked" when a read lock is upgraded
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': 20,
+}
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3' and os.environ.get('DJANGO_SQLITE_PROFILE') == 'concurrent':
+    DATABASES['default']['OPTIONS'] = SQLITE_CONCURRENT_OPTIONS
+# Persistent connections for the web process (Django default 0: close after each request)
+DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DJANGO_DB_CONN_MAX_AGE', '0'))
+# Ping a reused connection before handing it out, recycling ones the server dropped
+DATABASES['default']['CONN_HEALTH_CHECKS'] = os.environ.get('DJANGO_DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
+
+# Mock EPP server
+# Answer <check> from an in-memory (name, tld) index instead of querying Domain
+EPP_AVAILABILITY_INDEX = os.environ.get('EPP_AVAILABILITY_INDEX', 'True') == 'True'
+# How often a process looks for Domain changes made by other processes
+EPP_AVAILABILITY_REFRESH_SECONDS = float(os.environ.get('EPP_AVAILABILITY_REFRESH_SECONDS', '1.0'))
+# Largest EPP command frame accepted; bigger ones close the session
+EPP_MAX_FRAME_BYTES = int(os.environ.get('EPP_MAX_FRAME_BYTES', str(1024 * 1024)))
+# Sessions must <login> as a Registrar before any other command (hello excepted)
+EPP_REQUIRE_LOGIN = os.environ.get('EPP_REQUIRE_LOGIN', 'True') == 'True'
+# Close sessions that send nothing for this many seconds (0 disables)
+EPP_IDLE_TIMEOUT = float(os.environ.get('EPP_IDLE_TIMEOUT', '600'))
+# Throttling defaults for registrars that leave the fields blank (0: unlimited).
+# Throttled commands get 2306; a login past the session limit gets 2502.
+EPP_SESSION_RATE = float(os.environ.get('EPP_SESSION_RATE', '0'))
+EPP_REGISTRAR_RATE = float(os.environ.get('EPP_REGISTRAR_RATE', '0'))
+EPP_RATE_BURST = int(os.environ.get('EPP_RATE_BURST', '0'))  # 0: one second's worth
+EPP_MAX_SESSIONS = int(os.environ.get('EPP_MAX_SESSIONS', '0'))
+# How often cached registrar credentials are checked for changes
+EPP_CREDENTIALS_REFRESH_SECONDS = float(os.environ.get('EPP_CREDENTIALS_REFRESH_SECONDS', '5.0'))
+# run_eppserver serves Prometheus metrics on this port (worker N: port + N); 0 disables
+EPP_METRICS_PORT = int(os.environ.get('EPP_METRICS_PORT', '0'))
+# Profiler toggled by SIGUSR1 / manage.py epp_profile: share of commands sampled,
+# "cprofile" (.pstats) or "stacks" (.collapsed, for flame graphs), output directory
+EPP_PROFILE_RATE = float(os.environ.get('EPP_PROFILE_RATE', '0.1'))
+EPP_PROFILE_MODE = os.environ.get('EPP_PROFILE_MODE', 'cprofile')
+EPP_PROFILE_DIR = os.environ.get('EPP_PROFILE_DIR', '/tmp/epp-profiles')
+# All EPP ORM work runs on this many pooled threads per worker process. A worker
+# holds at most EPP_DB_POOL_SIZE + 2 connections (race scheduler, settlement), so
+# keep workers * (EPP_DB_POOL_SIZE + 2) below Postgres max_connections.
+EPP_DB_POOL_SIZE = int(os.environ.get('EPP_DB_POOL_SIZE', '16'))
+# Lifetime of pooled EPP connections in seconds (empty = reuse forever)
+_epp_conn_max_age = os.environ.get('EPP_DB_CONN_MAX_AGE', '300')
+EPP_DB_CONN_MAX_AGE = int(_epp_conn_max_age) if _epp_conn_max_age else None
+
+# Dashboard drop stream (/api/drop-events/, served over ASGI)
+DROP_EVENTS_POLL_SECONDS = float(os.environ.get('DROP_EVENTS_POLL_SECONDS', '0.5'))
+DROP_EVENTS_KEEPALIVE_SECONDS = float(os.environ.get('DROP_EVENTS_KEEPALIVE_SECONDS', '15'))
+# Change-log rows kept for reconnecting clients; older ones are pruned by settlement
+DROP_EVENTS_RETAIN = int(os.environ.get('DROP_EVENTS_RETAIN', '10000'))
+
+# Cache (unset by default before). LocMem is per process; point DJANGO_CACHE_BACKEND
+# at a shared backend (e.g. django.core.cache.backends.redis.RedisCache) so writes
+# from run_eppserver invalidate the web workers' cached /api/recent-drops/ at once.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', 'eppmock'),
+    }
+}
+# How long a cached change-log version is trusted (bounds staleness for per-process caches)
+RECENT_DROPS_VERSION_TTL = float(os.environ.get('RECENT_DROPS_VERSION_TTL', '2'))
+RECENT_DROPS_CACHE_SECONDS = int(os.environ.get('RECENT_DROPS_CACHE_SECONDS', '300'))
+
+# Time source for drop scheduling (due checks, race timers, settlement, seeding).
+# core.clock.SimClock runs a virtual clock, SIM_CLOCK_SPEED times real time to
+# start with, shared by the web and EPP processes through SIM_CLOCK_FILE; move it
+# with manage.py sim_clock or run_eppserver --clock-auto-jump.
+CLOCK_BACKEND = os.environ.get('CLOCK_BACKEND', 'core.clock.RealClock')
+SIM_CLOCK_SPEED = float(os.environ.get('SIM_CLOCK_SPEED', '1.0'))
+SIM_CLOCK_FILE = os.environ.get('SIM_CLOCK_FILE', '/tmp/eppmock-clock.json')
+SIM_CLOCK_REFRESH_SECONDS = float(os.environ.get('SIM_CLOCK_REFRESH_SECONDS', '0.2'))
+
+# Settlement leaves a contested drop this long past its fastest competitor's
+# time, so the EPP race scheduler can settle it with the live entrants first
+SETTLEMENT_GRACE_SECONDS = float(os.environ.get('SETTLEMENT_GRACE_SECONDS', '2.0'))
+
+# Largest number of <capture> elements accepted by /api/capture/batch/
+CAPTURE_BATCH_MAX = int(os.environ.get('CAPTURE_BATCH_MAX', '5000'))
+# Most Monte Carlo trials one request to /api/drops/<id>/simulation/ may ask for
+SIMULATION_MAX_TRIALS = int(os.environ.get('SIMULATION_MAX_TRIALS', '200000'))
+# Most attempts one competitor may register through the capture APIs; the
+# simulator clamps stored values to it as well
+COMPETITOR_MAX_ATTEMPTS = int(os.environ.get('COMPETITOR_MAX_ATTEMPTS', '100'))
+# Most arrival samples (trials x total attempts) one simulation batch holds
+SIMULATION_MAX_SAMPLES = int(os.environ.get('SIMULATION_MAX_SAMPLES', '5000000'))
 
 
 # Password validation
@@ -154,13 +254,23 @@ LOGOUT_REDIRECT_URL = "/accounts/login/"
 # --- Logging configuration ---
 import logging
 
+# Share of capture API hits written to the access log (1.0: all, 0: none)
+ACCESS_LOG_SAMPLE_RATE = float(os.environ.get('ACCESS_LOG_SAMPLE_RATE', '1.0'))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'filters': {
+        'access_sample': {
+            '()': 'core.log.SampleFilter',
+            'rate': ACCESS_LOG_SAMPLE_RATE,
+        },
+    },
     'handlers': {
         'file': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
+            # Writes happen on a background thread, off the request path
+            'class': 'core.log.AsyncFileHandler',
             'filename': '/tmp/eppserver.log',
         },
     },
@@ -170,5 +280,17 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        # EPP server errors (session failures, crashed workers, settlement)
+        'core': {
+            'handlers': ['file'],
+            'level': 'INFO',
+            'propagate': True,
+        },
+        'core.access': {
+            'handlers': ['file'],
+            'level': 'INFO',
+            'filters': ['access_sample'],
+            'propagate': False,
+        },
     },
 }